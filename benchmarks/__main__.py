@@ -0,0 +1,107 @@
+"""
+Run the simple-cdd benchmarks:
+
+    python3 -m benchmarks [--packages N] [--output results.json] [--compare baseline.json]
+"""
+from .hotpaths import BENCHMARKS, BenchContext
+import statistics
+import argparse
+import platform
+import tempfile
+import fnmatch
+import json
+import time
+import sys
+
+
+def run_benchmarks(ctx, repeat=5, selected=None):
+    """
+    Run the benchmarks and return a dict mapping their names to their timings
+    """
+    results = {}
+    for func in BENCHMARKS:
+        name = func.__name__
+        if selected and not any(fnmatch.fnmatch(name, pattern) for pattern in selected):
+            continue
+        run = func(ctx)
+        if run is None:
+            print("{:<24} skipped: missing requirements".format(name), file=sys.stderr)
+            continue
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "max": max(timings),
+            "runs": repeat,
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline, printing the ratios and returning the
+    names of the benchmarks that got slower than threshold times
+    """
+    regressions = []
+    for name, res in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None: continue
+        ratio = res["min"] / base["min"] if base["min"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("{:<24} {:>10.4f}s -> {:>10.4f}s  x{:.2f}{}".format(name, base["min"], res["min"], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the simple-cdd hot paths on synthetic mirrors")
+    parser.add_argument("--packages", type=int, default=5000, help="number of packages in the synthetic archive (default: %(default)s)")
+    parser.add_argument("--file-size", type=int, default=64, help="size in MiB of the file used to benchmark checksum verification (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs of each benchmark (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data (default: %(default)s)")
+    parser.add_argument("--output", action="store", help="write results as JSON to this file")
+    parser.add_argument("--compare", action="store", help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio considered a regression (default: %(default)s)")
+    parser.add_argument("benchmarks", nargs="*", help="names or shell patterns of the benchmarks to run (default: all)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="simple-cdd-bench-") as workdir:
+        ctx = BenchContext(workdir, packages=args.packages, file_size=args.file_size * 1024 * 1024, seed=args.seed)
+        results = run_benchmarks(ctx, repeat=args.repeat, selected=args.benchmarks)
+
+    for name, res in sorted(results.items()):
+        print("{:<24} min {:>10.4f}s  median {:>10.4f}s".format(name, res["min"], res["median"]))
+
+    if args.output:
+        with open(args.output, "wt") as fd:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "packages": args.packages,
+                    "file_size": args.file_size,
+                    "seed": args.seed,
+                },
+                "results": results,
+            }, fd, indent=1)
+
+    if args.compare:
+        with open(args.compare, "rt") as fd:
+            baseline = json.load(fd)
+        if baseline["meta"]["packages"] != args.packages or baseline["meta"]["file_size"] != args.file_size:
+            print("warning: baseline was run with different sizes", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("regressions: {}".format(" ".join(regressions)), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
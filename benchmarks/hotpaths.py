@@ -0,0 +1,285 @@
+"""
+Benchmarks of the Python hot paths of simple-cdd.
+
+Each benchmark is a function taking a BenchContext, doing its setup and
+returning a callable that runs the code to be timed.
+"""
+from simple_cdd import env
+from simple_cdd.variables import VARIABLES
+from simple_cdd.utils import Checksums, list_debs, stream_output, shell_which
+from simple_cdd.toollog import ToolLog
+from .synthetic import SyntheticArchive, write_release_file, write_data_file
+import importlib.machinery
+import importlib.util
+import subprocess
+import argparse
+import pickle
+import logging
+import sys
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    Decorator registering a benchmark function
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+class BenchContext:
+    """
+    Shared parameters and synthetic data for the benchmarks
+    """
+    def __init__(self, workdir, packages=1000, file_size=64 * 1024 * 1024, seed=0):
+        self.workdir = workdir
+        self.packages = packages
+        self.file_size = file_size
+        self.seed = seed
+        self._archive = None
+
+    @property
+    def archive(self):
+        if self._archive is None:
+            self._archive = SyntheticArchive(self.packages, seed=self.seed)
+        return self._archive
+
+    def path(self, *names):
+        pathname = os.path.join(self.workdir, *names)
+        os.makedirs(os.path.dirname(pathname), exist_ok=True)
+        return pathname
+
+
+def load_build_simple_cdd():
+    """
+    Import the build-simple-cdd script as a module
+    """
+    pathname = os.path.join(TOPDIR, "build-simple-cdd")
+    loader = importlib.machinery.SourceFileLoader("build_simple_cdd", pathname)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    # Normally set up by the main program
+    module.log = logging.getLogger()
+    return module
+
+
+@benchmark
+def parse_release_file(ctx):
+    pathname = ctx.path("release", "Release")
+    write_release_file(pathname, ctx.packages, seed=ctx.seed)
+
+    def run():
+        sums = Checksums(env.Environment(VARIABLES, environ={}))
+        sums.parse_release_file(pathname)
+    return run
+
+
+@benchmark
+def parse_release_file_filtered(ctx):
+    """
+    Parsing only the installer checksum files out of a Release file, as done
+    by mirror/download
+    """
+    pathname = ctx.path("release", "Release")
+    relnames = write_release_file(pathname, ctx.packages, seed=ctx.seed)
+    wanted = set([r for r in relnames if r.endswith("/SHA256SUMS")][:2])
+
+    def run():
+        sums = Checksums(env.Environment(VARIABLES, environ={}))
+        sums.parse_release_file(pathname, wanted=wanted)
+    return run
+
+
+@benchmark
+def verify_file(ctx):
+    pathname = ctx.path("verify", "netboot.tar.gz")
+    hashsum = write_data_file(pathname, ctx.file_size, seed=ctx.seed)
+    sums = Checksums(env.Environment(VARIABLES, environ={}))
+    sumsfile = ctx.path("verify", "SHA256SUMS")
+    with open(sumsfile, "wt") as fd:
+        print(hashsum, "./netboot.tar.gz", file=fd)
+    sums.parse_checksums_file(sumsfile, "SHA256")
+
+    def run():
+        sums.verify_file(pathname, "netboot.tar.gz")
+    return run
+
+
+@benchmark
+def list_debs_pool(ctx):
+    root = ctx.path("listdebs", "mirror", "x")
+    root = os.path.dirname(root)
+    ctx.archive.write_pool(root)
+
+    def run():
+        for f in list_debs(root):
+            pass
+    return run
+
+
+@benchmark
+def checkpackages(ctx):
+    root = os.path.dirname(ctx.path("checkpackages", "mirror", "x"))
+    ctx.archive.write_pool(root)
+    simple_cdd_dir = os.path.dirname(ctx.path("checkpackages", "profiles", "x"))
+    simple_cdd_dir = os.path.dirname(simple_cdd_dir)
+    profiles = ["bench{}".format(i) for i in range(4)]
+    count = max(1, ctx.packages // 10)
+    ctx.archive.write_package_lists(os.path.join(simple_cdd_dir, "profiles", "default.packages"), count, seed=ctx.seed)
+    for i, p in enumerate(profiles):
+        ctx.archive.write_package_lists(os.path.join(simple_cdd_dir, "profiles", p + ".packages"), count, seed=ctx.seed + i + 1)
+        ctx.archive.write_package_lists(os.path.join(simple_cdd_dir, "profiles", p + ".downloads"), count, seed=ctx.seed + i + 100)
+
+    module = load_build_simple_cdd()
+    scdd = module.SimpleCDD(argparse.Namespace())
+    scdd.env.set("MIRROR", root)
+    scdd.env.set("SECURITY", "")
+    scdd.env.set("local_packages", [])
+    scdd.env.set("simple_cdd_dir", simple_cdd_dir)
+    scdd.env.set("simple_cdd_dirs", [simple_cdd_dir])
+    scdd.env.set("build_profiles", [])
+    scdd.env.set("profiles", profiles)
+
+    def run():
+        scdd.checkpackages()
+    return run
+
+
+@benchmark
+def stream_output_lines(ctx):
+    lines = ctx.packages * 20
+    script = (
+        "import sys\n"
+        "out = sys.stdout\n"
+        "err = sys.stderr\n"
+        "for i in range({}):\n"
+        "    out.write('Get:%d http://deb.debian.org/debian pool/main/p/pkg%d.deb [1234 kB]\\n' % (i, i))\n"
+        "    if i % 10 == 0: err.write('W: warning %d\\n' % i)\n"
+    ).format(lines)
+
+    def run():
+        proc = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        for type, val in stream_output(proc):
+            pass
+    return run
+
+
+@benchmark
+def tool_log(ctx):
+    """
+    Logging the output of a tool with its JSON events, compressed with gzip
+    """
+    lines = ["Get:{} http://deb.debian.org/debian pool/main/p/pkg{}.deb [1234 kB]".format(i, i)
+             for i in range(ctx.packages * 20)]
+    pathname = ctx.path("toollog", "build-debian-cd.log")
+
+    def run():
+        with ToolLog(pathname, "build/debian-cd", compression="gz") as fd:
+            for line in lines:
+                fd.write("stdout", line)
+    return run
+
+
+@benchmark
+def environment(ctx):
+    VARIABLES = [
+        env.PathVar("simple_cdd_dir", "/srv/cdd"),
+        env.PathVar("simple_cdd_temp", ["{simple_cdd_dir}", "tmp"]),
+        env.PathVar("MIRROR", ["{simple_cdd_temp}", "mirror"]),
+        env.TextVar("CODENAME", "bookworm"),
+        env.TextVar("DI_CODENAME", "{CODENAME}"),
+        env.ListVar("ARCHES", "amd64 i386"),
+        env.ListVar("all_packages"),
+        env.BoolVar("do_mirror", True),
+    ]
+    names = ctx.archive.names[:max(1, ctx.packages // 10)]
+
+    def run():
+        e = env.Environment(VARIABLES)
+        for i in range(1000):
+            e.get("MIRROR")
+            e.get("ARCHES")
+            e.get("do_mirror")
+        for name in names:
+            e.append("all_packages", name)
+        for a in ("amd64", "i386"):
+            for i in range(200):
+                e.format("dists/{DI_CODENAME}/main/installer-{a}/current/images/SHA256SUMS", a=a)
+    return run
+
+
+@benchmark
+def environment_snapshot(ctx):
+    """
+    Restoring a build environment from a snapshot, as a worker process would
+    """
+    e = env.Environment(VARIABLES, environ=dict(os.environ, ARCH="amd64", CODENAME="bookworm"))
+    e.set("all_packages", ctx.archive.names[:max(1, ctx.packages // 10)])
+    data = pickle.dumps(e.snapshot())
+
+    def run():
+        for i in range(20):
+            r = env.Environment.from_snapshot(VARIABLES, pickle.loads(data))
+            r.get("MIRROR")
+    return run
+
+
+@benchmark
+def reprepro_dependencies(ctx):
+    """
+    The dependency resolution pipeline of the reprepro mirror hook
+    """
+    for tool in ("awk", "perl", "sort"):
+        if shell_which(tool) is None:
+            return None
+    packages = ctx.archive.write_packages(ctx.path("reprepro", "Packages"))
+    provides = ctx.path("reprepro", "provides")
+    wanted = ctx.path("reprepro", "packages")
+    script = (
+        "grep --no-filename ^Provides {packages} | cut -d : -f 2- | tr ',' '\\n'"
+        " | perl -np -e 's/\\s+\\(.*\\)//; s/^\\s*//' | sort -u > {provides}\n"
+        "awk -F Depends: '/Depends:/{{print $2}}' {packages} | tr '|,' '\\n' | awk '{{print $1}}'"
+        " | sed -e 's/:any//' | sort -u > {wanted}\n"
+        "{providecheck} {provides} {wanted} | sort -u > /dev/null\n"
+    ).format(packages=packages, provides=provides, wanted=wanted,
+             providecheck=os.path.join(TOPDIR, "providecheck"))
+
+    def run():
+        subprocess.check_call(["sh", "-ec", script])
+    return run
+
+
+@benchmark
+def minimal_dependencies(ctx):
+    """
+    Loading the Packages index and solving the dependencies of a profile with
+    dependency_solver=minimal
+    """
+    from simple_cdd.indices import PackageIndex
+    from simple_cdd.solver import Solver
+    packages = ctx.archive.write_packages(ctx.path("solver", "Packages"))
+    wanted = ctx.archive.names[::10]
+
+    def run():
+        index = PackageIndex()
+        index.load(packages)
+        Solver(index).solve(wanted)
+    return run
+
+
+@benchmark
+def startup(ctx):
+    """
+    Starting build-simple-cdd to print its command line help
+    """
+    cmd = [sys.executable, os.path.join(TOPDIR, "build-simple-cdd"), "--help"]
+
+    def run():
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+    return run
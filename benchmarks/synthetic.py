@@ -0,0 +1,149 @@
+"""
+Generate synthetic Debian mirrors, Packages and Release files of configurable
+size, so that benchmarks can run offline and give comparable results across
+runs.
+"""
+import hashlib
+import random
+import os
+
+PRIORITIES = ["required", "important", "standard", "optional", "optional", "optional", "extra"]
+COMPONENTS = ["main", "contrib", "non-free"]
+
+
+class SyntheticArchive:
+    """
+    Description of a synthetic archive: a deterministic list of packages with
+    dependencies, alternatives and virtual packages
+    """
+    def __init__(self, packages=1000, arch="amd64", seed=0):
+        self.arch = arch
+        rnd = random.Random(seed)
+        self.names = ["pkg{:06d}".format(i) for i in range(packages)]
+        self.virtuals = ["virtual{:04d}".format(i) for i in range(max(1, packages // 100))]
+        self.records = []
+        for idx, name in enumerate(self.names):
+            rec = {
+                "Package": name,
+                "Version": "{}.{}-{}".format(rnd.randint(0, 9), rnd.randint(0, 20), rnd.randint(1, 5)),
+                "Architecture": arch,
+                "Priority": rnd.choice(PRIORITIES),
+                "Section": "misc",
+                "Installed-Size": str(rnd.randint(10, 50000)),
+                "Size": str(rnd.randint(1000, 5000000)),
+            }
+            # Depend only on packages with a higher index, so that the
+            # dependency graph is acyclic and has a long tail
+            candidates = packages - idx - 1
+            depends = []
+            for i in range(min(candidates, rnd.randint(0, 6))):
+                dep = self.names[idx + 1 + rnd.randrange(candidates)]
+                if rnd.random() < 0.2:
+                    alt = self.names[idx + 1 + rnd.randrange(candidates)]
+                    depends.append("{} (>= 1.0) | {}".format(dep, alt))
+                elif rnd.random() < 0.05:
+                    depends.append(rnd.choice(self.virtuals))
+                else:
+                    depends.append(dep)
+            if depends:
+                rec["Depends"] = ", ".join(depends)
+            if candidates and rnd.random() < 0.3:
+                rec["Recommends"] = self.names[idx + 1 + rnd.randrange(candidates)]
+            if rnd.random() < 0.02:
+                rec["Provides"] = rnd.choice(self.virtuals)
+            pool_dir = os.path.join("pool", COMPONENTS[idx % len(COMPONENTS)], name[:4], name)
+            rec["Filename"] = os.path.join(pool_dir, "{}_{}_{}.deb".format(name, rec["Version"], arch))
+            rec["SHA256"] = hashlib.sha256(rec["Filename"].encode()).hexdigest()
+            rec["Description"] = "synthetic package {}".format(name)
+            self.records.append(rec)
+
+    def write_packages(self, pathname):
+        """
+        Write a Packages file with all the packages in the archive
+        """
+        with open(pathname, "wt") as fd:
+            for rec in self.records:
+                for key, val in rec.items():
+                    print("{}: {}".format(key, val), file=fd)
+                print(file=fd)
+        return pathname
+
+    def write_pool(self, root, extension=".deb", content=b""):
+        """
+        Create the .deb files of the archive under root
+        """
+        for rec in self.records:
+            pathname = os.path.join(root, rec["Filename"])
+            if extension != ".deb":
+                pathname = pathname[:-4] + extension
+            os.makedirs(os.path.dirname(pathname), exist_ok=True)
+            with open(pathname, "wb") as fd:
+                fd.write(content)
+
+    def write_package_lists(self, pathname, count, seed=0):
+        """
+        Write a profile .packages file listing count packages of the archive
+        """
+        rnd = random.Random(seed)
+        with open(pathname, "wt") as fd:
+            print("# synthetic profile", file=fd)
+            for name in rnd.sample(self.names, min(count, len(self.names))):
+                print(name, file=fd)
+        return pathname
+
+
+def write_release_file(pathname, entries, seed=0):
+    """
+    Write a Release file with MD5Sum, SHA1 and SHA256 sections of the given
+    number of entries, named like the indices and installer files of a real
+    archive.
+
+    Returns the list of relative pathnames listed in the file.
+    """
+    rnd = random.Random(seed)
+    relnames = []
+    idx = 0
+    while len(relnames) < entries:
+        component = COMPONENTS[idx % len(COMPONENTS)]
+        kind = idx % 4
+        if kind == 0:
+            relnames.append("{}/binary-arch{}/Packages{}".format(component, idx, rnd.choice(["", ".gz", ".xz"])))
+        elif kind == 1:
+            relnames.append("{}/i18n/Translation-l{}.bz2".format(component, idx))
+        elif kind == 2:
+            relnames.append("{}/Contents-arch{}.gz".format(component, idx))
+        else:
+            relnames.append("main/installer-arch{}/current/images/SHA256SUMS".format(idx))
+        idx += 1
+
+    sizes = [rnd.randint(100, 50000000) for x in relnames]
+    with open(pathname, "wt") as fd:
+        print("Origin: Debian", file=fd)
+        print("Label: Debian", file=fd)
+        print("Suite: stable", file=fd)
+        print("Codename: synthetic", file=fd)
+        print("Architectures: amd64", file=fd)
+        print("Components: main contrib non-free", file=fd)
+        for field, hashfunc in (("MD5Sum", hashlib.md5), ("SHA1", hashlib.sha1), ("SHA256", hashlib.sha256)):
+            print("{}:".format(field), file=fd)
+            for relname, size in zip(relnames, sizes):
+                print(" {} {:>9} {}".format(hashfunc(relname.encode()).hexdigest(), size, relname), file=fd)
+    return relnames
+
+
+def write_data_file(pathname, size, seed=0):
+    """
+    Write a file of pseudo-random data of the given size, returning its
+    SHA256 checksum
+    """
+    rnd = random.Random(seed)
+    block = bytes(rnd.getrandbits(8) for x in range(65536))
+    hasher = hashlib.sha256()
+    with open(pathname, "wb") as fd:
+        written = 0
+        while written < size:
+            chunk = block[:min(len(block), size - written)]
+            fd.write(chunk)
+            hasher.update(chunk)
+            written += len(chunk)
+    return hasher.hexdigest()
@@ -0,0 +1,341 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.env import Backtick
+from simple_cdd import env as env_module
+from simple_cdd import gnupg
+import selectors
+import traceback
+import subprocess
+import threading
+import socket
+import signal
+import codecs
+import queue
+import json
+import time
+import sys
+import os
+import logging
+
+log = logging.getLogger()
+
+
+def default_caches():
+    """
+    Enable and return the in-memory caches that the daemon keeps warm across
+    builds, indexed by name
+    """
+    if env_module.CONFIG_CACHE is None:
+        env_module.CONFIG_CACHE = {}
+    return {
+        "config": env_module.CONFIG_CACHE,
+        "gpg_keys": gnupg.KEY_CACHE,
+    }
+
+
+def warm_up(variables):
+    """
+    Do the work shared by all builds once, before serving requests: evaluate
+    commands used as default values, and import the modules used by builds
+    """
+    for v in variables:
+        if not isinstance(v.default, Backtick): continue
+        try:
+            v.default()
+        except (OSError, subprocess.CalledProcessError) as e:
+            log.warning("cannot compute default value of %s: %s", v.name, e)
+    from simple_cdd.tools import Tool
+    for type, name in Tool.MODULES:
+        Tool.lookup(type, name)
+    from debian import deb822
+
+
+class BuildServer:
+    """
+    Accept build requests on a Unix socket, and run each of them in a process
+    forked from this one, so that builds start with warm caches and without
+    interpreter startup and imports.
+
+    Requests are queued and run at most jobs at a time. Entries that builds
+    add to the caches are sent back to the daemon, so that later builds can
+    use them.
+
+    The protocol is made of JSON objects, one per line. The client sends
+    {"argv": [...], "cwd": str, "env": {...}}, and the server replies with any
+    number of {"queued": int} and {"stream": "stdout"|"stderr", "data": str},
+    followed by {"result": int} with the exit code of the build.
+    """
+    def __init__(self, socket_path, build, jobs=1, caches=None):
+        """
+        build is a function taking the command line arguments of a request
+        and returning the exit code of the build. It is called in a forked
+        process, with working directory and environment taken from the
+        request.
+        """
+        self.socket_path = socket_path
+        self.build = build
+        self.jobs = jobs
+        self.caches = caches if caches is not None else default_caches()
+        self.queue = queue.Queue()
+        self.sock = None
+        # Pids of the builds currently running
+        self.children = set()
+        self.children_lock = threading.Lock()
+        # Number of requests being handled by workers
+        self.active = 0
+        # Set to stop serve_forever, which is woken up by writing to wake_w
+        self.stopping = False
+        self.wake_r, self.wake_w = os.pipe()
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            # Remove a stale socket, but not one of a running daemon
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except ConnectionRefusedError:
+                os.unlink(self.socket_path)
+            else:
+                raise Fail("A build daemon is already listening on %s", self.socket_path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Requests run builds as our user: only allow our user to connect
+        old_umask = os.umask(0o177)
+        try:
+            self.sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen(16)
+
+    def serve_forever(self):
+        """
+        Serve requests until shutdown() is called
+        """
+        if self.sock is None:
+            self.bind()
+        for i in range(self.jobs):
+            threading.Thread(target=self._worker, daemon=True).start()
+        log.info("build daemon listening on %s", self.socket_path)
+        try:
+            with selectors.DefaultSelector() as sel:
+                sel.register(self.sock, selectors.EVENT_READ)
+                sel.register(self.wake_r, selectors.EVENT_READ)
+                while not self.stopping:
+                    for key, events in sel.select():
+                        if key.fileobj is not self.sock: continue
+                        conn, addr = self.sock.accept()
+                        with self.children_lock:
+                            ahead = self.queue.qsize() + self.active - self.jobs + 1
+                        if ahead > 0:
+                            self._send(conn, {"queued": ahead})
+                        self.queue.put(conn)
+        finally:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+            with self.children_lock:
+                for pid in self.children:
+                    os.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        """
+        Stop serving requests, and terminate the builds in progress. This can
+        be called from another thread or from a signal handler.
+        """
+        self.stopping = True
+        os.write(self.wake_w, b"x")
+
+    def _send(self, conn, msg):
+        conn.sendall(json.dumps(msg).encode() + b"\n")
+
+    def _worker(self):
+        while True:
+            conn = self.queue.get()
+            with self.children_lock:
+                self.active += 1
+            try:
+                self.handle(conn)
+            except Exception:
+                log.exception("error handling build request")
+            finally:
+                conn.close()
+                with self.children_lock:
+                    self.active -= 1
+
+    def handle(self, conn):
+        """
+        Read a request from a client connection and run it
+        """
+        with conn.makefile("rb") as fd:
+            line = fd.readline()
+        try:
+            request = json.loads(line.decode("utf-8"))
+            argv = list(request["argv"])
+            cwd = request["cwd"]
+            environ = dict(request["env"])
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("invalid build request: %s", e)
+            return
+        log.info("build request: %s", " ".join(argv))
+        start = time.monotonic()
+        result = self.run(argv, cwd, environ, conn)
+        log.info("build request finished in %.1fs with result %d: %s", time.monotonic() - start, result, " ".join(argv))
+
+    def _child(self, argv, cwd, environ, out_w, err_w, cache_w):
+        """
+        Run a build in the forked child process. Never returns.
+        """
+        code = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if self.sock is not None:
+                self.sock.close()
+            os.close(self.wake_r)
+            os.close(self.wake_w)
+            os.dup2(out_w, 1)
+            os.dup2(err_w, 2)
+            os.close(out_w)
+            os.close(err_w)
+            sys.stdout = os.fdopen(1, "wt", buffering=1, closefd=False)
+            sys.stderr = os.fdopen(2, "wt", buffering=1, closefd=False)
+            # Drop the daemon log handlers: the build sets up its own
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(environ)
+            known = {name: set(cache) for name, cache in self.caches.items()}
+            try:
+                code = self.build(argv)
+            except SystemExit as e:
+                code = e.code
+            if code is None:
+                code = 0
+            elif not isinstance(code, int):
+                print(code, file=sys.stderr)
+                code = 1
+            # Send back what the build added to the caches
+            added = {}
+            for name, cache in self.caches.items():
+                added[name] = {k: v for k, v in cache.items() if k not in known[name]}
+            with os.fdopen(cache_w, "wt") as fd:
+                json.dump(added, fd)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+
+    def run(self, argv, cwd, environ, conn):
+        """
+        Run a build in a forked process, relaying its output to conn.
+
+        Returns the exit code of the build.
+        """
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        cache_r, cache_w = os.pipe()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(out_r)
+            os.close(err_r)
+            os.close(cache_r)
+            self._child(argv, cwd, environ, out_w, err_w, cache_w)
+        with self.children_lock:
+            self.children.add(pid)
+        os.close(out_w)
+        os.close(err_w)
+        os.close(cache_w)
+
+        client_gone = False
+        cache_data = []
+        with selectors.DefaultSelector() as sel:
+            sel.register(out_r, selectors.EVENT_READ, ("stdout", codecs.getincrementaldecoder("utf-8")("replace")))
+            sel.register(err_r, selectors.EVENT_READ, ("stderr", codecs.getincrementaldecoder("utf-8")("replace")))
+            sel.register(cache_r, selectors.EVENT_READ, None)
+            while sel.get_map():
+                for key, events in sel.select():
+                    buf = os.read(key.fd, 65536)
+                    if not buf:
+                        sel.unregister(key.fd)
+                        os.close(key.fd)
+                    if key.data is None:
+                        cache_data.append(buf)
+                        continue
+                    stream, decoder = key.data
+                    data = decoder.decode(buf, final=not buf)
+                    if not data or client_gone: continue
+                    try:
+                        self._send(conn, {"stream": stream, "data": data})
+                    except OSError:
+                        # Nobody is waiting for the build anymore
+                        log.info("client disconnected: stopping build %d", pid)
+                        client_gone = True
+                        os.kill(pid, signal.SIGTERM)
+
+        pid, status = os.waitpid(pid, 0)
+        with self.children_lock:
+            self.children.discard(pid)
+        if os.WIFEXITED(status):
+            result = os.WEXITSTATUS(status)
+        else:
+            result = 128 + os.WTERMSIG(status)
+
+        try:
+            added = json.loads(b"".join(cache_data).decode("utf-8"))
+        except ValueError:
+            added = {}
+        for name, entries in added.items():
+            cache = self.caches.get(name, None)
+            if cache is None: continue
+            cache.update(entries)
+
+        if not client_gone:
+            try:
+                self._send(conn, {"result": result})
+            except OSError:
+                pass
+        return result
+
+
+def send_request(socket_path, argv, stdout=None, stderr=None):
+    """
+    Ask the build daemon listening on socket_path to run a build with the
+    given command line arguments, in the current directory and environment.
+
+    Output of the build is written to stdout and stderr. Returns the exit
+    code of the build.
+    """
+    if stdout is None: stdout = sys.stdout
+    if stderr is None: stderr = sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        sock.close()
+        raise Fail("Cannot connect to the build daemon at %s: %s", socket_path, e)
+    with sock:
+        request = {"argv": list(argv), "cwd": os.getcwd(), "env": dict(os.environ)}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as fd:
+            for line in fd:
+                msg = json.loads(line.decode("utf-8"))
+                if "stream" in msg:
+                    out = stdout if msg["stream"] == "stdout" else stderr
+                    out.write(msg["data"])
+                    out.flush()
+                elif "queued" in msg:
+                    print("waiting for {} build(s) to finish before this one starts".format(msg["queued"]), file=stderr)
+                elif "result" in msg:
+                    return msg["result"]
+    raise Fail("The build daemon at %s closed the connection before the end of the build", socket_path)
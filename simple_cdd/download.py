@@ -0,0 +1,270 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd import trace
+from urllib import request
+from urllib.error import HTTPError, URLError
+from http.client import HTTPException
+import threading
+import json
+import re
+import os
+import logging
+
+log = logging.getLogger()
+
+
+class NotFound(Fail):
+    """
+    The file to download does not exist on the server
+    """
+
+
+class Downloader:
+    """
+    Download files from mirrors.
+
+    Files are downloaded to a .partial file next to their final name, and
+    renamed into place only once complete and verified, so that readers never
+    see half-written files. When checksums are available, an interrupted
+    transfer is resumed with an HTTP Range request, so that only the missing
+    bytes are fetched again.
+
+    If a state file is given, it is used to remember HTTP validators (ETag,
+    Last-Modified) of downloaded files, to revalidate them with conditional
+    requests, and the stat information of files already verified against
+    their checksums. With trust_verified, files whose size, modification time
+    and inode did not change since they were verified are not hashed again:
+    this is faster, but corruption that keeps them is not detected.
+
+    If a ContentStore is given, files with a known SHA256 are linked from it
+    instead of being downloaded, and added to it after being downloaded.
+    """
+    # Size of the blocks read from the network
+    BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, timeout=60, state=None, store=None, trust_verified=False):
+        # Socket timeout for requests, in seconds
+        self.timeout = timeout
+        # Skip hashing files that did not change since they were verified
+        self.trust_verified = trust_verified
+        # Shared content-addressed store, if any
+        self.store = store
+        # Pathname of the file where the download state is persisted
+        self.state_file = state
+        # Maps absolute output pathnames to a dict with their validators and
+        # verification stamps
+        self.state = {}
+        self.state_lock = threading.Lock()
+        if state is not None:
+            try:
+                with open(state, "rt") as fd:
+                    self.state = json.load(fd)
+            except (OSError, ValueError):
+                pass
+
+    def save_state(self):
+        """
+        Write the download state to the state file
+        """
+        if self.state_file is None: return
+        with self.state_lock:
+            tmpname = self.state_file + ".tmp"
+            with open(tmpname, "wt") as fd:
+                json.dump(self.state, fd, indent=1, sort_keys=True)
+            os.replace(tmpname, self.state_file)
+
+    def _get_state(self, output):
+        with self.state_lock:
+            return dict(self.state.get(os.path.abspath(output), {}))
+
+    def _update_state(self, output, **kw):
+        with self.state_lock:
+            self.state.setdefault(os.path.abspath(output), {}).update(kw)
+
+    def _stamp(self, pathname):
+        st = os.stat(pathname)
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def _verify(self, checksums, pathname, relname, output):
+        """
+        Verify pathname against its checksums, skipping the work if output was
+        already verified against the same checksums and did not change since
+        """
+        expected = checksums.expected(relname)
+        if self.trust_verified and expected is not None and pathname == output:
+            state = self._get_state(output)
+            if state.get("verified") == [self._stamp(output), expected]:
+                log.debug("%s: already verified", output)
+                return
+        checksums.verify_file(pathname, relname)
+        if expected is not None:
+            # Stamp the final name: pathname is renamed to it when different
+            self._update_state(output, verified=[self._stamp(pathname), expected])
+
+    def _open(self, url, headers):
+        req = request.Request(url, headers=headers)
+        return request.urlopen(req, timeout=self.timeout)
+
+    def _transfer(self, url, partial, resume, headers=None):
+        """
+        Download url into the file partial.
+
+        If resume is True and partial already exists, ask the server only for
+        the missing bytes.
+
+        Returns a tuple (resumed, response headers), where resumed is True if
+        existing partial data has been kept.
+        """
+        offset = 0
+        if resume and os.path.exists(partial):
+            offset = os.path.getsize(partial)
+
+        headers = dict(headers) if headers else {}
+        if offset:
+            headers["Range"] = "bytes={}-".format(offset)
+
+        try:
+            res = self._open(url, headers)
+        except HTTPError as e:
+            if e.code == 416 and offset:
+                # Range not satisfiable: we probably have the whole file
+                # already, let verification decide
+                log.debug("%s: already fully downloaded", partial)
+                return True, e.headers
+            raise
+
+        with res:
+            mode = "wb"
+            if offset:
+                content_range = res.headers.get("Content-Range", "")
+                mo = re.match(r"bytes (\d+)-", content_range)
+                if res.status == 206 and mo and int(mo.group(1)) == offset:
+                    log.debug("resuming download of %s at byte %d", partial, offset)
+                    mode = "ab"
+                else:
+                    log.debug("server does not support resuming %s: downloading it again", url)
+            with open(partial, mode) as fd:
+                while True:
+                    buf = res.read(self.BLOCK_SIZE)
+                    if not buf: break
+                    fd.write(buf)
+
+            expected = res.headers.get("Content-Length")
+            if expected is not None and mode == "wb" and os.path.getsize(partial) != int(expected):
+                raise Fail("Short download of %s: expected %s bytes, got %d", url, expected, os.path.getsize(partial))
+            return mode == "ab", res.headers
+
+    def _conditional_headers(self, key, output):
+        """
+        Return the headers for a conditional request for the file identified
+        by key, if we have a copy of it in output with validators from a
+        previous download
+        """
+        if not os.path.exists(output):
+            return {}
+        state = self._get_state(output)
+        if state.get("key") != key or state.get("size") != os.path.getsize(output):
+            return {}
+        headers = {}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        return headers
+
+    def fetch(self, url, output, checksums=None, relname=None, revalidate=False, key=None):
+        """
+        Download url to output.
+
+        If checksums is given, it is a Checksums object used to verify the
+        file with the given relname: an existing output that already matches
+        is not downloaded again, and a download that does not match fails.
+
+        If revalidate is True, and output has been downloaded before, only
+        download it again if the server says that it changed. key identifies
+        the file for this purpose, and defaults to url: files that can come
+        from any of several mirrors use their path relative to the mirror
+        root, so that they are revalidated whatever mirror they came from.
+
+        Returns True if output has been downloaded, False if the existing file
+        was kept.
+        """
+        with trace.span(os.path.basename(output), "download", url=url) as trace_args:
+            res = self._fetch(url, output, checksums, relname, revalidate, key or url)
+            trace_args["downloaded"] = res
+        return res
+
+    def _fetch(self, url, output, checksums, relname, revalidate, key):
+        sha256 = None
+        if self.store is not None and checksums:
+            file_sums = checksums.by_relname.get(relname, None)
+            if file_sums is not None:
+                sha256 = file_sums.get("SHA256")
+
+        if checksums:
+            if os.path.exists(output):
+                try:
+                    self._verify(checksums, output, relname, output)
+                    log.debug("skipping download: %s checksum matched", output)
+                    if sha256 is not None:
+                        # Seed the store with what we already have
+                        self.store.ingest(output, sha256)
+                    return False
+                except Fail:
+                    log.debug("re-downloading: %s checksum invalid", output)
+        # Concurrent downloads can create the same directory
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+        if sha256 is not None and self.store.link_out(sha256, output):
+            try:
+                self._verify(checksums, output, relname, output)
+                return True
+            except Fail:
+                log.warning("%s: shared store object %s is corrupted, downloading again", output, sha256)
+                os.unlink(output)
+                self.store.discard(sha256)
+
+        headers = {}
+        if revalidate:
+            headers = self._conditional_headers(key, output)
+
+        partial = output + ".partial"
+        log.debug("downloading: %s", output)
+        try:
+            # Only resume if we can verify the result: without checksums we
+            # could not tell if the file changed on the server in the meantime
+            resumed, res_headers = self._transfer(url, partial, resume=bool(checksums), headers=headers)
+            if checksums:
+                try:
+                    self._verify(checksums, partial, relname, output)
+                except Fail:
+                    if not resumed:
+                        os.unlink(partial)
+                        raise
+                    # The partial data may come from an older version of the
+                    # file: try again once from scratch
+                    log.debug("%s: checksum failed after resuming, downloading again", output)
+                    resumed, res_headers = self._transfer(url, partial, resume=False)
+                    try:
+                        self._verify(checksums, partial, relname, output)
+                    except Fail:
+                        os.unlink(partial)
+                        raise
+        except HTTPError as e:
+            if e.code == 304 and headers:
+                log.debug("%s: not modified on the server", output)
+                return False
+            if e.code == 404:
+                raise NotFound("Cannot download %s: %s", url, e)
+            raise Fail("Cannot download %s: %s", url, e)
+        except (URLError, HTTPException, OSError) as e:
+            raise Fail("Cannot download %s: %s", url, e)
+        os.replace(partial, output)
+        if sha256 is not None:
+            self.store.ingest(output, sha256)
+
+        self._update_state(output,
+                           key=key,
+                           size=os.path.getsize(output),
+                           etag=res_headers.get("ETag"),
+                           last_modified=res_headers.get("Last-Modified"))
+        return True
@@ -3,7 +3,8 @@ import sys
 import os
 import re
 import json
-import tempfile
+import copy
+from collections import ChainMap
 try:
     # After Python 3.3
     from collections.abc import Iterable
@@ -18,6 +19,12 @@ import logging
 
 log = logging.getLogger()
 
+# If set to a dict, read_config_file caches there the result of sourcing
+# configuration files, indexed by file name, stat information and process
+# environment. This is only safe if configuration files just set variables,
+# and is enabled by the build daemon.
+CONFIG_CACHE = None
+
 
 class Backtick:
     """
@@ -25,6 +32,8 @@ class Backtick:
     output. This allows to use commands as default values for configuration
     variables.
     """
+    __slots__ = ("val", "cached_result")
+
     def __init__(self, *command):
         self.val = command
         self.cached_result = None
@@ -45,6 +54,10 @@ class Variable:
     This acts as a glue between the configuration files, the environment,
     python, the command line arguments and the scripts that we run.
     """
+    # There is one of these for each variable of the process environment:
+    # keep them small
+    __slots__ = ("name", "default", "cmdline", "help", "env", "current", "automatically_created")
+
     def __init__(self, name, default=None, cmdline=None, help=None, env=None):
         # Name of the variable in the environment
         self.name = name
@@ -143,6 +156,8 @@ class BoolVar(Variable):
     A proxy for a boolean environment variable. For python it behaves as a
     bool, and for the environment it will be "true" for True and "" for False
     """
+    __slots__ = ()
+
     def to_parser(self, parser):
         default = self.format_default()
         help = self.help + " (default: {})".format(default)
@@ -173,7 +188,7 @@ class TextVar(Variable):
     A proxy for a string environment variable. For python it behaves as a
     str, and for the environment it will be a string.
     """
-    pass
+    __slots__ = ()
 
 
 class PathVar(Variable):
@@ -183,6 +198,8 @@ class PathVar(Variable):
     supports appending, and default variables in the form of a string, which
     will be properly concatenated into a path.
     """
+    __slots__ = ()
+
     def append(self, value):
         if not isinstance(value, str):
             raise ValueError("Attempted to append a non-string value to a path")
@@ -212,6 +229,8 @@ class ListVar(Variable):
     space separated string. It supports appending. Command line arguments can
     be space or comma separated.
     """
+    __slots__ = ()
+
     def append(self, value):
         cur = self.to_python()
         if isinstance(value, str):
@@ -267,23 +286,94 @@ class Environment:
     """
     Keep track of environment changes
     """
-    def __init__(self, variables):
+    def __init__(self, variables, environ=None):
+        """
+        Create variables from their definitions, with values from environ,
+        which defaults to the process environment
+        """
+        if environ is None:
+            environ = os.environ
         env = {}
         for v in variables:
+            # Work on copies, so that environments created from the same
+            # variable list do not share values
+            v = copy.copy(v)
             v.env = self
             if v.name in env:
                 raise AssertionError("{} defined twice".format(v.name))
             env[v.name] = v
-            if v.name in os.environ:
-                v.current = os.environ[v.name]
-        for name, val in os.environ.items():
+            if v.name in environ:
+                v.current = environ[v.name]
+        for name, val in environ.items():
             if name in env: continue
             v = TextVar(name, help="Preexisting environment variable {}".format(name))
             env[name] = v
             v.automatically_created = True
             v.current = val
         super().__setattr__("env", env)
-        super().__setattr__("initial", dict(os.environ))
+        super().__setattr__("initial", dict(environ))
+
+    def snapshot(self):
+        """
+        Return the state of the environment as a dict of plain strings, which
+        can be pickled or dumped as JSON, and restored with from_snapshot
+        without reading configuration files again.
+
+        The results of the Backtick defaults that have been computed are
+        included, so that restoring does not run their commands again.
+        """
+        backticks = {}
+        for name, v in self.env.items():
+            if isinstance(v.default, Backtick) and v.default.cached_result is not None:
+                backticks[name] = v.default.cached_result
+        return {
+            "values": {name: v.current for name, v in self.env.items()},
+            "backticks": backticks,
+            "initial": self.initial,
+        }
+
+    @classmethod
+    def from_snapshot(cls, variables, snapshot):
+        """
+        Create an Environment with the variable definitions in variables, and
+        the state saved by snapshot()
+        """
+        res = cls(variables, environ={})
+        values = snapshot["values"]
+        for name in [name for name in res.env if name not in values]:
+            del res.env[name]
+        for name, current in values.items():
+            v = res.env.get(name, None)
+            if v is None:
+                res.env[name] = v = TextVar(name, env=res)
+                v.automatically_created = True
+            v.current = current
+        for name, result in snapshot["backticks"].items():
+            v = res.env.get(name, None)
+            if v is None or not isinstance(v.default, Backtick): continue
+            if v.default.cached_result is None:
+                # Do not touch the definition shared with other environments
+                v.default = copy.copy(v.default)
+                v.default.cached_result = result
+        super(Environment, res).__setattr__("initial", dict(snapshot["initial"]))
+        return res
+
+    def write_snapshot(self, pathname):
+        """
+        Save snapshot() to a JSON file
+        """
+        tmpname = pathname + ".tmp"
+        with open(tmpname, "wt") as fd:
+            json.dump(self.snapshot(), fd, separators=(",", ":"))
+        os.replace(tmpname, pathname)
+
+    @classmethod
+    def read_snapshot(cls, variables, pathname):
+        """
+        Create an Environment from a file written by write_snapshot
+        """
+        with open(pathname, "rt") as fd:
+            return cls.from_snapshot(variables, json.load(fd))
 
     def parse_commandline(self, args):
         """
@@ -343,13 +433,26 @@ class Environment:
         Source a config file and edit configuration from its environment
         """
         log.info("Reading configuration file %s", pathname)
-        # Write the source wrapper to a temporary file and execute it
-        with tempfile.NamedTemporaryFile("w+t") as fd:
-            print("set -a", file=fd)
-            print(". " + os.path.abspath(pathname), file=fd)
-            print("exec {} -c 'import os,json,sys;json.dump(dict(os.environ),sys.stdout)'".format(sys.executable), file=fd)
-            fd.flush()
-            out = subprocess.check_output(["sh", fd.name]).decode("utf-8")
+        out = None
+        cache_key = None
+        if CONFIG_CACHE is not None:
+            import hashlib
+            st = os.stat(pathname)
+            cache_key = hashlib.sha1(json.dumps([
+                os.path.abspath(pathname), st.st_size, st.st_mtime_ns, sorted(os.environ.items())
+            ]).encode()).hexdigest()
+            out = CONFIG_CACHE.get(cache_key, None)
+        if out is None:
+            # Write the source wrapper to a temporary file and execute it
+            import tempfile
+            with tempfile.NamedTemporaryFile("w+t") as fd:
+                print("set -a", file=fd)
+                print(". " + os.path.abspath(pathname), file=fd)
+                print("exec {} -c 'import os,json,sys;json.dump(dict(os.environ),sys.stdout)'".format(sys.executable), file=fd)
+                fd.flush()
+                out = subprocess.check_output(["sh", fd.name]).decode("utf-8")
+            if cache_key is not None:
+                CONFIG_CACHE[cache_key] = out
         # Parse its output
         if not out.strip(): return
         lines = out.split("\n")
@@ -395,9 +498,14 @@ class Environment:
         """
         Call string.format() including all the known env vars
         """
-        kwargs = dict(self.env)
-        kwargs.update(**kw)
-        return string.format(*args, **kwargs)
+        if args:
+            kwargs = dict(self.env)
+            kwargs.update(**kw)
+            return string.format(*args, **kwargs)
+        # Look variables up in place instead of copying them all
+        if kw:
+            return string.format_map(ChainMap(kw, self.env))
+        return string.format_map(self.env)
 
     def __getattr__(self, name):
         """
@@ -1,11 +1,16 @@
 from simple_cdd.exceptions import Fail
 from simple_cdd.utils import run_command
 import os
+import json
 import subprocess
 import logging
 
 log = logging.getLogger()
 
+# Results of list_valid_keys, indexed by keyring pathname and stat
+# information, so that unchanged keyrings are not listed again
+KEY_CACHE = {}
+
 
 class Gnupg:
     """
@@ -21,13 +26,51 @@ class Gnupg:
             os.makedirs(gnupghome, exist_ok=True)
             os.chmod(gnupghome, 0o700)
 
+        # Keyrings already imported, with their stat information, so that we
+        # do not import them again if they did not change. The stat of the
+        # keybox is stored too, so that a reset keybox triggers a new import
+        stamp_file = os.path.join(gnupghome, "simple-cdd-imported.json")
+        try:
+            with open(stamp_file, "rt") as fd:
+                stamps = json.load(fd)
+            if stamps.get("keybox") != self.keybox_stamp():
+                stamps = {}
+        except (OSError, ValueError, AttributeError):
+            stamps = {}
+        imported = stamps.get("keyrings", {})
+
         # Import all keyrings into our gnupg home
+        changed = False
         for keyring_file in self.env.get("keyring"):
             if not os.path.exists(keyring_file):
                 log.warning("keyring file %s does not exist", keyring_file)
                 continue
+            st = os.stat(keyring_file)
+            stamp = [st.st_size, st.st_mtime_ns]
+            if imported.get(os.path.abspath(keyring_file)) == stamp:
+                log.debug("%s already imported into %s", keyring_file, gnupghome)
+                continue
             self.import_keyring(keyring_file)
+            imported[os.path.abspath(keyring_file)] = stamp
+            changed = True
 
+        if changed:
+            with open(stamp_file, "wt") as fd:
+                json.dump({"keybox": self.keybox_stamp(), "keyrings": imported}, fd)
+
+    def keybox_stamp(self):
+        """
+        Return the stat information of the public keybox in GNUPGHOME, or None
+        if there is none
+        """
+        gnupghome = self.env.get("GNUPGHOME")
+        for name in ("pubring.kbx", "pubring.gpg"):
+            try:
+                st = os.stat(os.path.join(gnupghome, name))
+            except FileNotFoundError:
+                continue
+            return [name, st.st_size, st.st_mtime_ns]
+        return None
 
     def common_gpg_args(self):
         args = ["gpg", "--batch", "--no-default-keyring"]
@@ -75,6 +118,18 @@ class Gnupg:
             raise Fail("Importing %s into %s failed, gpg error code %s", keyring_file, self.env.get("GNUPGHOME"), retval)
 
     def list_valid_keys(self, keyring_file):
+        """
+        Return a list of keyIDs for valid signing keys found in the given
+        keyring file
+        """
+        st = os.stat(keyring_file)
+        key = "{}:{}:{}".format(os.path.abspath(keyring_file), st.st_size, st.st_mtime_ns)
+        res = KEY_CACHE.get(key, None)
+        if res is None:
+            res = KEY_CACHE[key] = list(self._list_valid_keys(keyring_file))
+        return list(res)
+
+    def _list_valid_keys(self, keyring_file):
         """
         Generate a sequence of keyIDs for valid signing keys found in the given
         keyring file
@@ -0,0 +1,201 @@
+from simple_cdd.exceptions import Fail
+import re
+import os
+import logging
+
+log = logging.getLogger()
+
+# Rank of package priorities, most important first
+PRIORITIES = {
+    "required": 0,
+    "important": 1,
+    "standard": 2,
+    "optional": 3,
+    "extra": 4,
+}
+
+# Priorities of the packages that mirror/reprepro always mirrors
+BASE_PRIORITIES = ("required", "important", "standard")
+
+# End of the package name in a relation like "foo:any (>= 1.0) [amd64]"
+RELATION_NAME_END = re.compile(r"[\s(\[<:]")
+
+
+def parse_relations(value):
+    """
+    Parse the value of a Depends-like field into a list of alternative
+    groups, each a list of package names.
+
+    Version constraints, architecture qualifiers and restrictions are
+    ignored.
+    """
+    res = []
+    for group in value.split(","):
+        alternatives = []
+        for alt in group.split("|"):
+            alt = alt.strip()
+            if not alt: continue
+            name = RELATION_NAME_END.split(alt, 1)[0]
+            if name and name not in alternatives:
+                alternatives.append(name)
+        if alternatives:
+            res.append(alternatives)
+    return res
+
+
+def open_index(pathname):
+    """
+    Open a possibly compressed index file for reading as text
+    """
+    if pathname.endswith(".gz"):
+        import gzip
+        return gzip.open(pathname, "rt", encoding="utf-8", errors="replace")
+    elif pathname.endswith(".xz"):
+        import lzma
+        return lzma.open(pathname, "rt", encoding="utf-8", errors="replace")
+    else:
+        return open(pathname, "rt", encoding="utf-8", errors="replace")
+
+
+def iter_paragraphs(fd, fields):
+    """
+    Generate a dict for each paragraph of a Debian control file, with only
+    the given fields.
+
+    This skips most of the file without parsing it, which matters on
+    Packages files with tens of thousands of entries.
+    """
+    cur = {}
+    # Name of the field we are in, or None if we are in a field that we do
+    # not need
+    name = None
+    for line in fd:
+        if line[0] in " \t":
+            if name is not None:
+                cur[name] += " " + line.strip()
+            continue
+        if line == "\n":
+            if cur:
+                yield cur
+                cur = {}
+            name = None
+            continue
+        name, sep, value = line.partition(":")
+        if name in fields:
+            cur[name] = value.strip()
+        else:
+            name = None
+    if cur:
+        yield cur
+
+
+class BinaryPackage:
+    """
+    Information about a binary package, as found in a Packages index
+    """
+    __slots__ = ("name", "version", "architecture", "priority", "pre_depends", "depends",
+                 "recommends", "provides", "size", "installed_size", "filename", "sha256", "origin")
+
+    FIELDS = frozenset(("Package", "Version", "Architecture", "Priority", "Pre-Depends", "Depends",
+                        "Recommends", "Provides", "Size", "Installed-Size", "Filename", "SHA256"))
+
+    def __init__(self, rec, origin=None):
+        self.name = rec["Package"]
+        self.version = rec.get("Version", "")
+        self.architecture = rec.get("Architecture", "")
+        self.priority = rec.get("Priority", "optional")
+        self.pre_depends = parse_relations(rec.get("Pre-Depends", ""))
+        self.depends = parse_relations(rec.get("Depends", ""))
+        self.recommends = parse_relations(rec.get("Recommends", ""))
+        self.provides = [alts[0] for alts in parse_relations(rec.get("Provides", ""))]
+        # Size of the .deb file, and size once installed in bytes (the index
+        # gives it in KiB)
+        self.size = int(rec.get("Size", 0) or 0)
+        self.installed_size = int(rec.get("Installed-Size", 0) or 0) * 1024
+        self.filename = rec.get("Filename", "")
+        self.sha256 = rec.get("SHA256", None)
+        # Where the package comes from, as given to PackageIndex.load
+        self.origin = origin
+
+    @property
+    def priority_rank(self):
+        return PRIORITIES.get(self.priority, len(PRIORITIES))
+
+    def __repr__(self):
+        return "BinaryPackage({}={})".format(self.name, self.version)
+
+
+class PackageIndex:
+    """
+    Binary packages available for one architecture, merged from one or more
+    Packages indices
+    """
+    def __init__(self):
+        # Package name: BinaryPackage
+        self.packages = {}
+        # Virtual package name: set of names of packages providing it
+        self.providers = {}
+
+    def load(self, pathname, origin=None):
+        """
+        Add the packages of a Packages file, which can be compressed with gzip
+        or xz. origin is stored in the packages, to tell where they come from.
+
+        When a package is found more than once, the highest version is kept.
+        """
+        from debian.debian_support import version_compare
+        from lzma import LZMAError
+        count = 0
+        try:
+            with open_index(pathname) as fd:
+                for rec in iter_paragraphs(fd, BinaryPackage.FIELDS):
+                    if "Package" not in rec: continue
+                    pkg = BinaryPackage(rec, origin)
+                    count += 1
+                    old = self.packages.get(pkg.name, None)
+                    if old is not None and version_compare(old.version, pkg.version) >= 0:
+                        continue
+                    self.packages[pkg.name] = pkg
+                    for name in pkg.provides:
+                        self.providers.setdefault(name, set()).add(pkg.name)
+        except (OSError, EOFError, LZMAError, ValueError) as e:
+            raise Fail("Cannot read package index %s: %s", pathname, e)
+        log.debug("%s: %d packages", pathname, count)
+
+    def get(self, name):
+        """
+        Return the BinaryPackage with the given name, or None
+        """
+        return self.packages.get(name, None)
+
+    def satisfiers(self, name):
+        """
+        Return the names of the packages that satisfy a dependency on name:
+        the package itself if it exists, followed by the packages that
+        provide it, most important first
+        """
+        res = []
+        if name in self.packages:
+            res.append(name)
+        providers = self.providers.get(name, ())
+        if providers:
+            res.extend(sorted(
+                (p for p in providers if p != name and p in self.packages),
+                key=lambda p: (self.packages[p].priority_rank, p)))
+        return res
+
+
+def find_list_files(listsdir, arch):
+    """
+    Return the pathnames of the Packages files for the given architecture
+    downloaded by reprepro in its lists directory
+    """
+    res = []
+    if not os.path.isdir(listsdir):
+        return res
+    suffix = "_{}_Packages".format(arch)
+    for entry in os.scandir(listsdir):
+        if entry.name.endswith(suffix):
+            res.append(entry.path)
+    res.sort()
+    return res
@@ -0,0 +1,215 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd import trace
+from contextlib import contextmanager
+import contextvars
+import functools
+import resource
+import json
+import time
+import os
+import logging
+
+log = logging.getLogger()
+
+
+def read_proc_io():
+    """
+    Return (read_bytes, write_bytes) of storage I/O done by this process, or
+    None if /proc/self/io is not available
+    """
+    try:
+        with open("/proc/self/io", "rt") as fd:
+            values = {}
+            for line in fd:
+                key, val = line.split(":", 1)
+                values[key] = int(val)
+    except (OSError, ValueError):
+        return None
+    return values.get("read_bytes", 0), values.get("write_bytes", 0)
+
+
+class Sample:
+    """
+    Snapshot of the resources used so far by this process and its children
+    """
+    def __init__(self):
+        self.time = time.monotonic()
+        self.self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.proc_io = read_proc_io()
+
+    def io_bytes(self):
+        """
+        Return (read, written) bytes of storage I/O for us and our children
+        """
+        # Block I/O in rusage is counted in 512 bytes units
+        read = self.children_usage.ru_inblock * 512
+        written = self.children_usage.ru_oublock * 512
+        if self.proc_io is not None:
+            read += self.proc_io[0]
+            written += self.proc_io[1]
+        else:
+            read += self.self_usage.ru_inblock * 512
+            written += self.self_usage.ru_oublock * 512
+        return read, written
+
+
+class StageRecord:
+    """
+    Resources used by a stage of the build
+    """
+    def __init__(self, name, ancestors, start):
+        self.name = name
+        # StageRecords of the stages running this one, outermost first
+        self.ancestors = ancestors
+        self.parent = ancestors[-1].name if ancestors else None
+        self.depth = len(ancestors)
+        # Seconds since the start of the build
+        self.start = start
+        self.wall = None
+        self.cpu_user = None
+        self.cpu_system = None
+        self.children_cpu_user = None
+        self.children_cpu_system = None
+        self.read_bytes = None
+        self.write_bytes = None
+        # True if other stages ran at the same time, outside of this one
+        self.concurrent = False
+        self.result = "ok"
+
+    def finish(self, before, after):
+        self.wall = after.time - before.time
+        self.cpu_user = after.self_usage.ru_utime - before.self_usage.ru_utime
+        self.cpu_system = after.self_usage.ru_stime - before.self_usage.ru_stime
+        self.children_cpu_user = after.children_usage.ru_utime - before.children_usage.ru_utime
+        self.children_cpu_system = after.children_usage.ru_stime - before.children_usage.ru_stime
+        read_before, written_before = before.io_bytes()
+        read_after, written_after = after.io_bytes()
+        self.read_bytes = read_after - read_before
+        self.write_bytes = written_after - written_before
+
+    def overlaps(self, other):
+        """
+        Return True if other ran at some point while this stage was running,
+        and is neither part of this stage nor running it
+        """
+        if other is self or other in self.ancestors or self in other.ancestors:
+            return False
+        return other.start < self.start + self.wall and self.start < other.start + other.wall
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "depth": self.depth,
+            "start": round(self.start, 6),
+            "wall": round(self.wall, 6),
+            "cpu_user": round(self.cpu_user, 6),
+            "cpu_system": round(self.cpu_system, 6),
+            "children_cpu_user": round(self.children_cpu_user, 6),
+            "children_cpu_system": round(self.children_cpu_system, 6),
+            "read_bytes": self.read_bytes,
+            "write_bytes": self.write_bytes,
+            "concurrent": self.concurrent,
+            "result": self.result,
+        }
+
+
+class BuildReport:
+    """
+    Record wall time, CPU time and storage I/O of the stages of a build, and
+    the peak memory usage of the whole build, and write them out as a JSON
+    report.
+
+    Peak resident set sizes are only known as high water marks since the
+    start of the process, so they are not reported per stage.
+
+    CPU time and I/O are measured for the whole process and its children, so
+    the usage of stages that StageScheduler runs at the same time cannot be
+    told apart: each of them includes the usage of the others, and they are
+    marked as concurrent in the report.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.start_sample = Sample()
+        self.stages = []
+        # Tuple of the StageRecords of the stages currently running. It is a
+        # context variable so that stages run in other threads by
+        # StageScheduler are nested in the stage that started them
+        self.running = contextvars.ContextVar("running", default=())
+
+    @contextmanager
+    def stage(self, name, category="stage"):
+        """
+        Context manager recording the resources used by the code it wraps.
+
+        category is used to group stages in the trace of the build, if
+        tracing.
+        """
+        with trace.span(name, category):
+            with self._stage(name) as record:
+                yield record
+
+    @contextmanager
+    def _stage(self, name):
+        before = Sample()
+        running = self.running.get()
+        record = StageRecord(name, running, before.time - self.start_sample.time)
+        self.stages.append(record)
+        token = self.running.set(running + (record,))
+        try:
+            yield record
+        except Fail:
+            record.result = "failed"
+            raise
+        except BaseException as e:
+            record.result = e.__class__.__name__
+            raise
+        finally:
+            self.running.reset(token)
+            record.finish(before, Sample())
+            log.debug("stage %s: %.3fs wall, %.3fs cpu, %.3fs children cpu",
+                      name, record.wall, record.cpu_user + record.cpu_system,
+                      record.children_cpu_user + record.children_cpu_system)
+
+    def to_dict(self, **extra):
+        end = Sample()
+        total = StageRecord("build", (), 0)
+        total.finish(self.start_sample, end)
+        total.depth = -1
+        stages = [s for s in self.stages if s.wall is not None]
+        for s in stages:
+            s.concurrent = any(s.overlaps(other) for other in stages)
+        res = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "total": total.to_dict(),
+            # Reported by linux in kilobytes
+            "max_rss": end.self_usage.ru_maxrss * 1024,
+            "children_max_rss": end.children_usage.ru_maxrss * 1024,
+            "stages": [s.to_dict() for s in stages],
+        }
+        res.update(extra)
+        return res
+
+    def write(self, pathname, **extra):
+        """
+        Write the report as JSON to the given file. Keyword arguments are added
+        as extra top level fields.
+        """
+        os.makedirs(os.path.dirname(pathname), exist_ok=True)
+        tmpname = pathname + ".tmp"
+        with open(tmpname, "wt") as fd:
+            json.dump(self.to_dict(**extra), fd, indent=1)
+        os.rename(tmpname, pathname)
+
+
+def instrumented(func):
+    """
+    Decorator for methods of objects with a 'report' BuildReport attribute,
+    recording each call as a stage named after the method
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kw):
+        with self.report.stage(func.__name__):
+            return func(self, *args, **kw)
+    return wrapper
@@ -0,0 +1,148 @@
+from simple_cdd.exceptions import Fail
+from contextlib import contextmanager
+import functools
+import fcntl
+import time
+import os
+import logging
+
+log = logging.getLogger()
+
+
+class FileLock:
+    """
+    Advisory lock on a file, usable as a context manager.
+
+    The lock is taken with flock(2), so it is released automatically if the
+    process dies, and works across processes sharing the same file system.
+    """
+    def __init__(self, pathname, shared=False, timeout=None):
+        """
+        If shared is True, take a shared lock, that can be held by several
+        processes at the same time; otherwise take an exclusive lock.
+
+        timeout is the number of seconds to wait for the lock before failing,
+        or None to wait forever.
+        """
+        self.pathname = pathname
+        self.shared = shared
+        self.timeout = timeout
+        self.fd = None
+
+    def _flock(self, shared):
+        """
+        Lock the file in the given mode, waiting according to self.timeout
+        """
+        op = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.fd, op | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            pass
+        log.info("waiting for %s lock on %s", "shared" if shared else "exclusive", self.pathname)
+        if self.timeout is None:
+            fcntl.flock(self.fd, op)
+            return
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self.fd, op | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    raise Fail("Timed out waiting for lock on %s", self.pathname)
+                time.sleep(0.1)
+
+    def acquire(self):
+        dirname = os.path.dirname(self.pathname)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.fd = os.open(self.pathname, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            self._flock(self.shared)
+        except BaseException:
+            os.close(self.fd)
+            self.fd = None
+            raise
+
+    def change(self, shared):
+        """
+        Convert a held lock to shared or exclusive.
+
+        As with flock(2), the conversion is not atomic: other processes may
+        get the lock in between.
+        """
+        if shared == self.shared: return
+        self._flock(shared)
+        self.shared = shared
+
+    def release(self):
+        if self.fd is None: return
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class LockManager:
+    """
+    Reentrant reader/writer lock on a resource shared between processes, such
+    as a mirror used by concurrent builds.
+
+    Code that modifies the resource runs inside exclusive(), code that only
+    reads it inside shared(). Nesting is allowed: an exclusive section inside
+    a shared one converts the lock for its duration.
+    """
+    def __init__(self, pathname, timeout=None):
+        self.pathname = pathname
+        self.timeout = timeout
+        self.lock = None
+        # Number of nested sections currently holding the lock
+        self.depth = 0
+
+    @contextmanager
+    def hold(self, shared):
+        if self.lock is None:
+            self.lock = FileLock(self.pathname, shared=shared, timeout=self.timeout)
+            self.lock.acquire()
+            log.debug("acquired %s lock on %s", "shared" if shared else "exclusive", self.pathname)
+        was_shared = self.lock.shared
+        if was_shared and not shared:
+            self.lock.change(False)
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                self.lock.release()
+                self.lock = None
+                log.debug("released lock on %s", self.pathname)
+            elif was_shared and not self.lock.shared:
+                self.lock.change(True)
+
+    def shared(self):
+        return self.hold(True)
+
+    def exclusive(self):
+        return self.hold(False)
+
+
+def locked(name, shared=False):
+    """
+    Decorator for methods of objects with a LockManager attribute with the
+    given name, running each call while holding its lock
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kw):
+            with getattr(self, name).hold(shared):
+                return func(self, *args, **kw)
+        return wrapper
+    return decorator
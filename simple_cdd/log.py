@@ -1,5 +1,4 @@
 import logging
-import curses
 import sys
 import shutil
 import time
@@ -58,6 +57,8 @@ class FancyTerminalHandler(logging.Handler):
         # Log level above which entries are not considered progress entries
         self.non_progress = logging.WARN
 
+        import curses
+
         # Build a mapping between level types and color escape sequences
         self._level_colors = {}
         fg_color = (curses.tigetstr("setaf") or
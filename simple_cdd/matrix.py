@@ -0,0 +1,218 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import format_size
+from simple_cdd import trace
+import configparser
+import traceback
+import signal
+import json
+import time
+import sys
+import os
+import re
+import logging
+
+log = logging.getLogger()
+
+# Variables that can differ between variants, and whose values are merged to
+# build a mirror with what all variants need
+UNION_VARIABLES = ("profiles", "build_profiles", "local_packages")
+
+# Variables that define the mirror, which all variants must share
+MIRROR_VARIABLES = (
+    "CODENAME", "DI_CODENAME", "ARCHES", "MIRROR", "mirror_components",
+    "mirror_components_extra", "mirror_tools", "debian_mirror",
+    "security_mirror", "updates_mirror", "backports_mirror",
+)
+
+VALID_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def read_matrix_file(pathname):
+    """
+    Read the variants of a matrix build from an ini file.
+
+    Each section is a variant, named after the section, and its keys are
+    variable names, with values in the same format as on the command line.
+    Keys in a [DEFAULT] section apply to all variants.
+
+    Returns a list of (name, {variable: value}).
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    # Variable names are case sensitive
+    parser.optionxform = str
+    try:
+        with open(pathname, "rt") as fd:
+            parser.read_file(fd)
+    except (OSError, configparser.Error) as e:
+        raise Fail("Cannot read matrix file %s: %s", pathname, e)
+
+    variants = []
+    for name in parser.sections():
+        if not VALID_NAME.match(name):
+            raise Fail("%s: invalid variant name %r: use only letters, digits, '.', '_' and '-'", pathname, name)
+        variants.append((name, dict(parser.items(name))))
+    if not variants:
+        raise Fail("%s: no variants defined", pathname)
+    return variants
+
+
+def union_values(lists):
+    """
+    Merge lists of values, keeping the order in which they are first found
+    """
+    res = []
+    for values in lists:
+        for v in values:
+            if v not in res:
+                res.append(v)
+    return res
+
+
+def check_shared_mirror(base, variants):
+    """
+    Raise Fail if a variant environment changes the mirror from the one of
+    the base environment.
+
+    variants is a sequence of (name, env).
+    """
+    for name, env in variants:
+        for var in MIRROR_VARIABLES:
+            if env.get(var) == base.get(var): continue
+            raise Fail("variant %s changes %s, which would need a mirror of its own", name, var)
+
+
+class VariantLogFilter(logging.Filter):
+    """
+    Prefix log messages with the name of the variant being built
+    """
+    def __init__(self, name):
+        super().__init__()
+        self.prefix = name + ": "
+
+    def filter(self, record):
+        if isinstance(record.msg, str) and not record.msg.startswith(self.prefix):
+            record.msg = self.prefix + record.msg
+        return True
+
+
+class VariantResult:
+    """
+    Outcome of building a variant
+    """
+    def __init__(self, name):
+        self.name = name
+        # Pathname of the built ISO image
+        self.isoname = None
+        self.size = None
+        # Error message if the build failed
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def status(self):
+        return "failed" if self.error is not None else "built"
+
+
+def run_forked(tasks, jobs):
+    """
+    Run each of tasks, a sequence of (name, func), in its own forked process,
+    at most jobs at a time.
+
+    func is called without arguments in the child process, and it returns
+    the pathname of the built image, or raises an exception.
+
+    Returns a list of VariantResult, in the same order as tasks.
+    """
+    results = {}
+    pending = list(tasks)
+    # pid: (result, read end of the pipe, start time)
+    running = {}
+    while pending or running:
+        while pending and len(running) < max(jobs, 1):
+            name, func = pending.pop(0)
+            read_fd, write_fd = os.pipe()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                _child(name, func, write_fd)
+            os.close(write_fd)
+            log.info("%s: started build in process %d", name, pid)
+            running[pid] = (VariantResult(name), read_fd, time.monotonic())
+
+        pid, status = os.wait()
+        if pid not in running: continue
+        result, read_fd, start = running.pop(pid)
+        result.elapsed = time.monotonic() - start
+        with os.fdopen(read_fd, "rt") as fd:
+            data = fd.read()
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            msg = {}
+        if os.WIFSIGNALED(status):
+            result.error = "killed by signal {}".format(os.WTERMSIG(status))
+        elif "error" in msg:
+            result.error = msg["error"]
+        elif os.WEXITSTATUS(status) != 0 or not msg.get("isoname"):
+            result.error = "exited with code {}".format(os.WEXITSTATUS(status))
+        else:
+            result.isoname = msg["isoname"]
+            try:
+                result.size = os.path.getsize(result.isoname)
+            except OSError:
+                pass
+        results[result.name] = result
+
+    return [results[name] for name, func in tasks]
+
+
+def _child(name, func, write_fd):
+    """
+    Run a task in a forked child process. Never returns.
+    """
+    code = 1
+    msg = {}
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(VariantLogFilter(name))
+        if trace.TRACER is not None:
+            trace.TRACER.set_process_name(name)
+        try:
+            msg["isoname"] = func()
+            code = 0
+        except Fail as e:
+            log.error(*e.args)
+            msg["error"] = e.args[0] % e.args[1:]
+        except Exception as e:
+            traceback.print_exc()
+            msg["error"] = str(e)
+        with os.fdopen(write_fd, "wt") as fd:
+            json.dump(msg, fd)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def format_table(results):
+    """
+    Format the results of a matrix build as a table, returning a list of
+    lines
+    """
+    rows = [("variant", "status", "size", "time", "image")]
+    for r in results:
+        rows.append((r.name, r.status, format_size(r.size), "{:.0f}s".format(r.elapsed),
+                     r.isoname if r.error is None else r.error))
+    widths = [max(len(row[i]) for row in rows) for i in range(4)]
+    lines = []
+    for row in rows:
+        cells = [cell.ljust(width) for cell, width in zip(row, widths)]
+        lines.append("  ".join(cells + [row[4]]))
+    return lines
@@ -0,0 +1,172 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.download import NotFound
+from urllib import request
+import threading
+import time
+import logging
+
+log = logging.getLogger()
+
+
+class Mirror:
+    """
+    One URL of a MirrorPool, with what we measured of it
+    """
+    def __init__(self, url):
+        self.url = url if url.endswith("/") else url + "/"
+        # Seconds until the probe response started, or None if not probed
+        self.latency = None
+        # Bytes per second of the probe transfer, or None if not probed or if
+        # the probe file was too small to tell
+        self.throughput = None
+        # Failed transfers since the last successful one
+        self.failures = 0
+        # False if the probe failed or too many transfers failed in a row
+        self.healthy = True
+
+    def score(self, size):
+        """
+        Estimated seconds to download size bytes
+        """
+        if self.latency is None:
+            return 0.0
+        if not self.throughput:
+            return self.latency
+        return self.latency + size / self.throughput
+
+    def __repr__(self):
+        return "Mirror({})".format(self.url)
+
+
+class MirrorPool:
+    """
+    A list of mirrors of the same archive, used interchangeably.
+
+    Mirrors are ranked by probing them with a small request. Downloads are
+    spread across the mirrors that are about as fast as the best one, and a
+    failed transfer is retried on the next mirror. A mirror failing
+    MAX_FAILURES transfers in a row is only used when all others failed.
+    """
+    # Bytes read from each mirror when probing it
+    PROBE_SIZE = 64 * 1024
+    # Size of the typical download used to compare mirrors
+    RANK_SIZE = 1024 * 1024
+    # Mirrors whose score is within this factor of the best one share the
+    # downloads
+    SPREAD = 2.0
+    MAX_FAILURES = 3
+
+    def __init__(self, urls, timeout=60):
+        if not urls:
+            raise Fail("No mirror URLs given")
+        self.mirrors = [Mirror(url) for url in urls]
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # Counter used to rotate downloads across the fast mirrors
+        self.turn = 0
+
+    def _probe_one(self, mirror, path):
+        start = time.monotonic()
+        try:
+            with request.urlopen(mirror.url + path, timeout=self.timeout) as res:
+                latency = time.monotonic() - start
+                size = len(res.read(self.PROBE_SIZE))
+        except Exception as e:
+            log.warning("mirror %s does not respond: %s", mirror.url, e)
+            mirror.healthy = False
+            return
+        elapsed = time.monotonic() - start - latency
+        mirror.latency = latency
+        mirror.throughput = None
+        if size >= self.PROBE_SIZE and elapsed > 0:
+            mirror.throughput = size / elapsed
+        mirror.healthy = True
+
+    def probe(self, path):
+        """
+        Measure the latency and throughput of each mirror by downloading the
+        start of path from all of them at the same time
+        """
+        if len(self.mirrors) < 2:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.mirrors)) as executor:
+            list(executor.map(lambda mirror: self._probe_one(mirror, path), self.mirrors))
+        for mirror in self.ranked():
+            if not mirror.healthy: continue
+            if mirror.throughput:
+                log.info("mirror %s: %.0fms latency, %.0fKiB/s", mirror.url, mirror.latency * 1000,
+                         mirror.throughput / 1024)
+            else:
+                log.info("mirror %s: %.0fms latency", mirror.url, mirror.latency * 1000)
+
+    def ranked(self):
+        """
+        Return the mirrors from the most to the least preferred
+        """
+        with self.lock:
+            return sorted(self.mirrors, key=lambda m: (not m.healthy, m.score(self.RANK_SIZE)))
+
+    def candidates(self):
+        """
+        Return the mirrors to try, in order, for the next download
+        """
+        ranked = self.ranked()
+        healthy = [m for m in ranked if m.healthy]
+        if len(healthy) < 2:
+            return ranked
+        best = healthy[0].score(self.RANK_SIZE)
+        fast = [m for m in healthy if m.score(self.RANK_SIZE) <= best * self.SPREAD]
+        with self.lock:
+            turn = self.turn
+            self.turn += 1
+        start = turn % len(fast)
+        first = fast[start:] + fast[:start]
+        return first + [m for m in ranked if m not in first]
+
+    def _failed(self, mirror):
+        with self.lock:
+            mirror.failures += 1
+            if mirror.failures >= self.MAX_FAILURES and mirror.healthy:
+                mirror.healthy = False
+                log.warning("mirror %s failed %d times in a row: using it only as a last resort",
+                            mirror.url, mirror.failures)
+
+    def _succeeded(self, mirror):
+        with self.lock:
+            mirror.failures = 0
+            mirror.healthy = True
+
+    def fetch(self, downloader, path, output, **kw):
+        """
+        Download path, relative to the root of the mirrors, to output with
+        downloader, trying the next mirror when one fails. Keyword arguments
+        are passed to Downloader.fetch.
+
+        Files are revalidated by path, so that a copy downloaded from another
+        mirror is not downloaded again if it did not change.
+        """
+        errors = []
+        for mirror in self.candidates():
+            try:
+                res = downloader.fetch(mirror.url + path, output, key=path, **kw)
+            except NotFound as e:
+                # Not a problem of the mirror, but it may lag behind others
+                errors.append(e)
+                continue
+            except Fail as e:
+                if len(self.mirrors) > 1:
+                    log.warning("%s, trying another mirror", e)
+                self._failed(mirror)
+                errors.append(e)
+                continue
+            if res:
+                # Only a transfer tells that the mirror works: files already
+                # up to date are not downloaded
+                self._succeeded(mirror)
+            return res
+        if all(isinstance(e, NotFound) for e in errors):
+            raise errors[0]
+        if len(errors) == 1:
+            raise errors[0]
+        raise Fail("Cannot download %s from any of %d mirrors: %s", path, len(errors), errors[-1])
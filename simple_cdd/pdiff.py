@@ -0,0 +1,101 @@
+from simple_cdd.exceptions import Fail
+import re
+
+# ed command in a pdiff: "12a", "3,5c", "7d"
+ED_COMMAND = re.compile(r"^(\d+)(?:,(\d+))?([acd])$")
+
+
+class DiffIndex:
+    """
+    Contents of the Index file of a Packages.diff directory, which lists the
+    patches that bring an older Packages file up to date
+    """
+    def __init__(self):
+        # (sha256, size) of the current Packages file
+        self.current = None
+        # List of (sha256, size, patch name): the checksums of each older
+        # version of the Packages file, and the patch to apply to it
+        self.history = []
+        # Patch name: (sha256, size) of the uncompressed patch
+        self.patches = {}
+        # Downloaded file name: (sha256, size) of the compressed patch
+        self.downloads = {}
+        # If True, each patch brings its version directly up to date instead
+        # of to the next version
+        self.merged = False
+
+    @classmethod
+    def parse(cls, pathname):
+        res = cls()
+        # Field whose indented lines we are reading
+        field = None
+        with open(pathname, "rt") as fd:
+            for line in fd:
+                if line[0] in " \t":
+                    values = line.split()
+                    if len(values) != 3: continue
+                    entry = (values[0], int(values[1]), values[2])
+                    if field == "SHA256-History":
+                        res.history.append(entry)
+                    elif field == "SHA256-Patches":
+                        res.patches[entry[2]] = entry[:2]
+                    elif field == "SHA256-Download":
+                        res.downloads[entry[2]] = entry[:2]
+                    continue
+                field, sep, value = line.partition(":")
+                value = value.strip()
+                if field == "SHA256-Current":
+                    sha256, size = value.split()
+                    res.current = (sha256, int(size))
+                elif field == "X-Patch-Precedence":
+                    res.merged = value == "merged"
+        return res
+
+    def patches_from(self, sha256):
+        """
+        Return the names of the patches to apply, in order, to the Packages
+        file with the given checksum, or None if it is too old or unknown
+        """
+        for idx, (old_sha256, size, name) in enumerate(self.history):
+            if old_sha256 != sha256: continue
+            if self.merged:
+                return [name]
+            return [entry[2] for entry in self.history[idx:]]
+        return None
+
+
+def apply_ed_patch(lines, patch):
+    """
+    Apply a patch in the ed script format used by pdiffs to a list of lines,
+    in place.
+
+    The commands of these scripts go from the end of the file to its start,
+    so line numbers always refer to the unpatched part of the file.
+    """
+    idx = 0
+    while idx < len(patch):
+        cmd = patch[idx].rstrip("\n")
+        idx += 1
+        if not cmd or cmd == "w":
+            continue
+        mo = ED_COMMAND.match(cmd)
+        if mo is None:
+            raise Fail("Unsupported command in pdiff: %r", cmd)
+        start = int(mo.group(1))
+        end = int(mo.group(2) or start)
+        op = mo.group(3)
+        new = []
+        if op in "ac":
+            while True:
+                if idx >= len(patch):
+                    raise Fail("Truncated pdiff: text of %r is not terminated", cmd)
+                line = patch[idx]
+                idx += 1
+                if line.rstrip("\n") == ".": break
+                new.append(line)
+        if op == "a":
+            lines[start:start] = new
+        elif op == "c":
+            lines[start - 1:end] = new
+        else:
+            del lines[start - 1:end]
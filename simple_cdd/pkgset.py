@@ -0,0 +1,156 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.indices import open_index, iter_paragraphs
+import os
+import logging
+
+log = logging.getLogger()
+
+# Name of the package set of the last successful build, in simple_cdd_logs
+PACKAGE_SET_FILE = "packages.list"
+# Name of the report of what changed since the build before, in simple_cdd_logs
+PACKAGE_DIFF_FILE = "packages.diff"
+
+# Fields of the Packages indices that make the package set
+FIELDS = frozenset(("Package", "Version", "Architecture", "SHA256", "Filename"))
+
+# Index names, in order of preference when a directory has several
+INDEX_NAMES = ("Packages", "Packages.gz", "Packages.xz")
+
+
+class PackageSet:
+    """
+    The packages of a mirror: name, version, architecture, SHA256 and pool
+    file of each deb and udeb
+    """
+    def __init__(self):
+        # (name, arch, "deb" or "udeb"): (version, sha256, filename)
+        self.packages = {}
+
+    def add(self, name, version, arch, sha256, filename):
+        kind = "udeb" if filename.endswith(".udeb") else "deb"
+        self.packages[(name, arch, kind)] = (version, sha256, filename)
+
+    def add_index(self, pathname):
+        """
+        Add the packages of a Packages index, which can be compressed
+        """
+        try:
+            with open_index(pathname) as fd:
+                for rec in iter_paragraphs(fd, FIELDS):
+                    if "Package" not in rec: continue
+                    self.add(rec["Package"], rec.get("Version", ""), rec.get("Architecture", ""),
+                             rec.get("SHA256", ""), rec.get("Filename", ""))
+        except (OSError, EOFError, ValueError) as e:
+            raise Fail("Cannot read package index %s: %s", pathname, e)
+
+    @classmethod
+    def from_mirror(cls, root):
+        """
+        Read the package set from the binary indices found in the dists/
+        directory of a mirror
+        """
+        res = cls()
+        for dirpath, dirs, files in os.walk(os.path.join(root, "dists")):
+            dirs.sort()
+            if not os.path.basename(dirpath).startswith("binary-"): continue
+            for name in INDEX_NAMES:
+                if name in files:
+                    res.add_index(os.path.join(dirpath, name))
+                    break
+        return res
+
+    def files(self):
+        """
+        Return a dict mapping pool filenames to their SHA256
+        """
+        return {filename: sha256 for version, sha256, filename in self.packages.values()}
+
+    def write(self, pathname):
+        """
+        Write the package set as tab separated name, version, architecture,
+        SHA256 and filename, one package per line
+        """
+        tmpname = pathname + ".tmp"
+        with open(tmpname, "wt") as fd:
+            for (name, arch, kind), (version, sha256, filename) in sorted(self.packages.items()):
+                print(name, version, arch, sha256, filename, sep="\t", file=fd)
+        os.replace(tmpname, pathname)
+
+    @classmethod
+    def read(cls, pathname):
+        """
+        Read a package set written by write(). Returns None if pathname does
+        not exist.
+        """
+        res = cls()
+        try:
+            with open(pathname, "rt") as fd:
+                for line in fd:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 5: continue
+                    name, version, arch, sha256, filename = fields
+                    res.add(name, version, arch, sha256, filename)
+        except FileNotFoundError:
+            return None
+        return res
+
+
+class PackageSetDiff:
+    """
+    What changed between two package sets
+    """
+    def __init__(self, old, new):
+        from debian.debian_support import version_compare
+        # Sorted lists of (name, arch, kind, version)
+        self.added = []
+        self.removed = []
+        # Sorted lists of (name, arch, kind, old version, new version)
+        self.upgraded = []
+        self.downgraded = []
+        # Sorted list of (name, arch, kind, version) of packages with the same
+        # version but different contents
+        self.rebuilt = []
+        self.unchanged = 0
+        for key, (version, sha256, filename) in new.packages.items():
+            old_entry = old.packages.get(key, None)
+            if old_entry is None:
+                self.added.append(key + (version,))
+            elif old_entry[0] != version:
+                if version_compare(old_entry[0], version) < 0:
+                    self.upgraded.append(key + (old_entry[0], version))
+                else:
+                    self.downgraded.append(key + (old_entry[0], version))
+            elif old_entry[1] != sha256:
+                self.rebuilt.append(key + (version,))
+            else:
+                self.unchanged += 1
+        for key, (version, sha256, filename) in old.packages.items():
+            if key not in new.packages:
+                self.removed.append(key + (version,))
+        for entries in (self.added, self.removed, self.upgraded, self.downgraded, self.rebuilt):
+            entries.sort()
+
+        old_files = old.files()
+        new_files = new.files()
+        # Pool files that are not in old with the same contents
+        self.new_files = sorted(f for f, sha256 in new_files.items() if old_files.get(f, None) != sha256)
+        # Pool files of old that new does not use anymore
+        self.stale_files = sorted(f for f in old_files if f not in new_files)
+
+    def summary(self):
+        return "{} added, {} removed, {} upgraded, {} downgraded, {} rebuilt, {} unchanged".format(
+            len(self.added), len(self.removed), len(self.upgraded), len(self.downgraded),
+            len(self.rebuilt), self.unchanged)
+
+    def report(self):
+        """
+        Return the lines of a human readable report of the differences
+        """
+        lines = [self.summary()]
+        for label, entries in (("added", self.added), ("removed", self.removed), ("rebuilt", self.rebuilt)):
+            for name, arch, kind, version in entries:
+                lines.append("{}\t{} {} ({}) {}".format(label, name, version, arch, kind))
+        for label, entries in (("upgraded", self.upgraded), ("downgraded", self.downgraded)):
+            for name, arch, kind, old_version, version in entries:
+                lines.append("{}\t{} {} -> {} ({}) {}".format(label, name, old_version, version, arch, kind))
+        return lines
@@ -0,0 +1,265 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import Checksums
+from simple_cdd.gnupg import Gnupg
+from simple_cdd.indices import PackageIndex
+from simple_cdd.solver import Solver
+import os
+import logging
+
+log = logging.getLogger()
+
+MB = 1000 * 1000
+
+# Approximate capacity of each debian-cd DISKTYPE, smallest first
+DISK_CAPACITIES = [
+    ("CD", 680 * MB),
+    ("CD700", 737 * MB),
+    ("DVD", 4700 * MB),
+    ("DLDVD", 8500 * MB),
+    ("BD", 25000 * MB),
+    ("DLBD", 50000 * MB),
+]
+
+# DISKTYPE values chosen by DISKTYPE=auto
+AUTO_DISKTYPES = ("CD", "DVD", "DLDVD", "BD", "DLBD")
+
+# Rough size of the installer images and udebs of an architecture, used when
+# they have not been downloaded yet
+INSTALLER_ESTIMATE = 150 * MB
+
+# Size of an ISO 9660 block: each file takes a whole number of blocks
+BLOCK_SIZE = 2048
+
+# Space taken by directories, indices and other metadata, as a fraction of
+# the size of the packages
+METADATA_OVERHEAD = 0.03
+
+
+def disk_capacity(disktype):
+    """
+    Return the approximate capacity in bytes of a DISKTYPE, or None if it is
+    not known
+    """
+    for name, capacity in DISK_CAPACITIES:
+        if name == disktype:
+            return capacity
+    return None
+
+
+def choose_disktype(size):
+    """
+    Return the smallest DISKTYPE among AUTO_DISKTYPES that can hold an image
+    of the given size, or None if none can
+    """
+    for name in AUTO_DISKTYPES:
+        if size <= disk_capacity(name):
+            return name
+    return None
+
+
+def blocks(size):
+    """
+    Round a file size up to a whole number of ISO blocks
+    """
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+class SizeEstimate:
+    """
+    Estimated contribution of an architecture to the image size
+    """
+    def __init__(self, arch):
+        self.arch = arch
+        # Names of the packages that would end up in the image
+        self.packages = set()
+        # Sum of the sizes of the .deb files
+        self.debs_size = 0
+        # Sum of the installed sizes of the packages
+        self.installed_size = 0
+        # Size of the installer images
+        self.installer_size = 0
+        # Filenames of the packages in the pool, to count arch:all packages
+        # shared between architectures only once
+        self.filenames = {}
+
+
+class ImagePlanner:
+    """
+    Estimate the size of the image from the Packages indices of the mirror,
+    before anything is downloaded
+    """
+    def __init__(self, env):
+        self.env = env
+        self.workdir = os.path.join(env.get("simple_cdd_temp"), "plan")
+
+    def requested_packages(self, index):
+        """
+        Return the names of the packages that debian-cd puts on the image:
+        all_packages and the base system
+        """
+        res = list(self.env.get("all_packages"))
+        for pkg in index.packages.values():
+            if pkg.priority in ("required", "important"):
+                res.append(pkg.name)
+        return res
+
+    def excluded_packages(self):
+        res = set()
+        for f in self.env.get("exclude_files"):
+            with open(f, "rt") as fd:
+                for line in fd:
+                    pkg = line.strip()
+                    if not pkg or pkg.startswith("#"): continue
+                    res.add(pkg)
+        return res
+
+    def installer_size(self, arch):
+        """
+        Return the size of the installer images of arch, measured on the
+        mirror if they are there, or estimated
+        """
+        images = self.env.format("{MIRROR}/dists/{DI_CODENAME}/main/installer-{a}/{di_release}/images", a=arch)
+        if not os.path.isdir(images):
+            return INSTALLER_ESTIMATE
+        total = 0
+        for root, dirs, files in os.walk(images):
+            for f in files:
+                total += blocks(os.path.getsize(os.path.join(root, f)))
+        return total
+
+    def extras_size(self):
+        """
+        Return the size of the files that simple-cdd adds to the image
+        """
+        total = 0
+        seen = set()
+        for name in ("all_extras", "package_files", "preseed_files", "exclude_files"):
+            for pathname in self.env.get(name):
+                if pathname in seen or not os.path.isfile(pathname): continue
+                seen.add(pathname)
+                total += blocks(os.path.getsize(pathname))
+        return total
+
+    def estimate_arch(self, arch, index):
+        """
+        Resolve the packages of the image from the index of arch, and return
+        their SizeEstimate
+        """
+        res = SizeEstimate(arch)
+        solver = Solver(index, recommends=self.env.get("NORECOMMENDS") != "1",
+                        excluded=self.excluded_packages())
+        res.packages = solver.solve(self.requested_packages(index))
+        for name in solver.unknown:
+            log.info("%s: size estimate: package %s not found", arch, name)
+        for name in res.packages:
+            pkg = index.packages[name]
+            res.filenames[pkg.filename or name] = blocks(pkg.size)
+            res.debs_size += pkg.size
+            res.installed_size += pkg.installed_size
+        res.installer_size = self.installer_size(arch)
+        return res
+
+    def total_size(self, estimates):
+        """
+        Return the estimated size of an image with the given per-architecture
+        estimates
+        """
+        pool = {}
+        installer = 0
+        for e in estimates:
+            pool.update(e.filenames)
+            installer += e.installer_size
+        packages = sum(pool.values())
+        return int(packages * (1 + METADATA_OVERHEAD)) + installer + self.extras_size()
+
+    def fetch_indices(self, arch, downloader, sums):
+        """
+        Download the Packages indices of arch, returning their pathnames
+        """
+        res = []
+        for component in self.env.get("mirror_components"):
+            for ext in (".xz", ".gz"):
+                relname = "{}/binary-{}/Packages{}".format(component, arch, ext)
+                if relname not in sums.by_relname: continue
+                url = self.env.format("{debian_mirror}dists/{CODENAME}/{relname}", relname=relname)
+                output = os.path.join(self.workdir, self.env.get("CODENAME"), relname)
+                downloader.fetch(url, output, checksums=sums, relname=relname)
+                res.append(output)
+                break
+            else:
+                raise Fail("No Packages index for %s/%s found in the Release file of %s", component, arch, self.env.get("CODENAME"))
+        return res
+
+    def fetch_release(self, downloader):
+        """
+        Download and verify the Release file, returning the checksums of the
+        Packages indices
+        """
+        codename = self.env.get("CODENAME")
+        release_file = os.path.join(self.workdir, "{}_Release".format(codename))
+        url = self.env.format("{debian_mirror}dists/{CODENAME}/Release")
+        sums_cache = release_file + ".sums"
+        changed = downloader.fetch(url, release_file, revalidate=True)
+        changed |= downloader.fetch(url + ".gpg", release_file + ".gpg", revalidate=True)
+        if changed and os.path.exists(sums_cache):
+            # Invalidate what we derived from the previous version
+            os.unlink(sums_cache)
+        wanted = set()
+        for a in self.env.get("ARCHES"):
+            for component in self.env.get("mirror_components"):
+                for ext in (".xz", ".gz"):
+                    wanted.add("{}/binary-{}/Packages{}".format(component, a, ext))
+        sums = Checksums(self.env)
+        if not sums.load(sums_cache, release_file, release_file + ".gpg", filter=sorted(wanted)):
+            Gnupg(self.env).verify_detached_sig(release_file, release_file + ".gpg")
+            sums.parse_release_file(release_file, wanted=wanted)
+            sums.save(sums_cache)
+        return sums
+
+    def local_indices(self, arch):
+        """
+        Return the pathnames of the Packages indices of arch in the local
+        mirror
+        """
+        res = []
+        for component in self.env.get("mirror_components"):
+            for ext in (".xz", ".gz", ""):
+                pathname = self.env.format("{MIRROR}/dists/{CODENAME}/{component}/binary-{arch}/Packages{ext}",
+                                           component=component, arch=arch, ext=ext)
+                if os.path.exists(pathname):
+                    res.append(pathname)
+                    break
+            else:
+                raise Fail("No Packages index for %s/%s found in the local mirror %s: build the mirror first",
+                           component, arch, self.env.get("MIRROR"))
+        return res
+
+    def estimate_indices(self, indices):
+        """
+        Return (total size, [SizeEstimate]) from the Packages indices returned
+        by indices(arch)
+        """
+        estimates = []
+        for a in self.env.get("ARCHES"):
+            index = PackageIndex()
+            for pathname in indices(a):
+                index.load(pathname)
+            estimates.append(self.estimate_arch(a, index))
+        return self.total_size(estimates), estimates
+
+    def estimate(self, local=False):
+        """
+        Download the indices and return (total size, [SizeEstimate]). If local
+        is True, use the indices of the local mirror instead, without
+        accessing the network
+        """
+        if local:
+            return self.estimate_indices(self.local_indices)
+        from simple_cdd.download import Downloader
+        os.makedirs(self.workdir, exist_ok=True)
+        downloader = Downloader(state=os.path.join(self.workdir, "download-state.json"))
+        try:
+            sums = self.fetch_release(downloader)
+            return self.estimate_indices(lambda a: self.fetch_indices(a, downloader, sums))
+        finally:
+            downloader.save_state()
@@ -0,0 +1,206 @@
+from simple_cdd.exceptions import Fail
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import logging
+
+log = logging.getLogger()
+
+# ioctl request used to clone a whole file on copy-on-write file systems
+# (FICLONE in linux/fs.h)
+FICLONE = 0x40049409
+
+# Ways of creating a file in the destination tree, in order of preference
+METHODS = {
+    "auto": ("reflink", "hardlink", "copy"),
+    "reflink": ("reflink", "copy"),
+    "hardlink": ("hardlink", "copy"),
+    "copy": ("copy",),
+}
+
+# Errors meaning that a method is not available for a pair of file systems,
+# and that we should fall back to the next one
+FALLBACK_ERRNOS = frozenset((
+    errno.EXDEV, errno.EPERM, errno.EACCES, errno.EINVAL, errno.ENOTTY,
+    errno.EOPNOTSUPP, errno.EMLINK, errno.ENOSYS,
+))
+
+
+def reflink_file(src, dst):
+    """
+    Create dst as a copy-on-write clone of src.
+
+    Raises OSError if the file system does not support it.
+    """
+    with open(src, "rb") as infd:
+        outfd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            fcntl.ioctl(outfd, FICLONE, infd.fileno())
+        except OSError:
+            os.close(outfd)
+            os.unlink(dst)
+            raise
+        os.close(outfd)
+    shutil.copystat(src, dst)
+
+
+class TreePopulator:
+    """
+    Populate directory trees from other directory trees, sharing file data
+    with the source via reflinks or hardlinks where the file system allows it,
+    and falling back to copying.
+
+    This replaces rsync -aWH for trees that live on the same file system, so
+    that multi-GB sets of packages and installer images are not duplicated on
+    disk and in the page cache.
+    """
+    def __init__(self, method="auto", writable=False):
+        """
+        method is one of the keys of METHODS.
+
+        If writable is True, files in the destination tree may later be
+        modified in place, and hardlinks are never used.
+        """
+        if not method:
+            method = "auto"
+        if method not in METHODS:
+            raise Fail("Unknown populate method %s: valid methods are %s", method, ", ".join(sorted(METHODS)))
+        self.methods = [m for m in METHODS[method] if not writable or m != "hardlink"]
+        # (src device, dst device) -> methods known not to work between them
+        self.unsupported = {}
+        # Count of files by the way they have been created
+        self.stats = {"reflink": 0, "hardlink": 0, "copy": 0, "unchanged": 0, "removed": 0}
+
+    def install_file(self, src, dst, src_st, dst_dev):
+        """
+        Create dst with the contents of src, using the first method that works
+        """
+        unsupported = self.unsupported.setdefault((src_st.st_dev, dst_dev), set())
+        for method in self.methods:
+            if method in unsupported: continue
+            try:
+                if method == "reflink":
+                    reflink_file(src, dst)
+                elif method == "hardlink":
+                    os.link(src, dst)
+                else:
+                    shutil.copy2(src, dst)
+            except OSError as e:
+                if method == "copy" or e.errno not in FALLBACK_ERRNOS:
+                    raise
+                log.debug("cannot %s %s to %s: %s", method, src, dst, e)
+                unsupported.add(method)
+                continue
+            self.stats[method] += 1
+            return method
+
+    def is_unchanged(self, src_st, dst_st):
+        """
+        Check if a destination file is already up to date, using the same size
+        and mtime heuristics as rsync
+        """
+        if not stat.S_ISREG(dst_st.st_mode):
+            return False
+        if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino):
+            # A hardlink is only acceptable if we are allowed to create them
+            return "hardlink" in self.methods
+        return (src_st.st_size == dst_st.st_size
+                and int(src_st.st_mtime) == int(dst_st.st_mtime)
+                and stat.S_IMODE(src_st.st_mode) == stat.S_IMODE(dst_st.st_mode))
+
+    def _remove(self, pathname):
+        if os.path.isdir(pathname) and not os.path.islink(pathname):
+            shutil.rmtree(pathname)
+        else:
+            os.unlink(pathname)
+
+    def _sync_entry(self, src, dst, dst_dev):
+        """
+        Make the non-directory entry dst match src
+        """
+        src_st = os.lstat(src)
+        try:
+            dst_st = os.lstat(dst)
+        except FileNotFoundError:
+            dst_st = None
+
+        if stat.S_ISLNK(src_st.st_mode):
+            target = os.readlink(src)
+            if dst_st is not None:
+                if stat.S_ISLNK(dst_st.st_mode) and os.readlink(dst) == target:
+                    self.stats["unchanged"] += 1
+                    return
+                self._remove(dst)
+            os.symlink(target, dst)
+            return
+
+        if not stat.S_ISREG(src_st.st_mode):
+            log.debug("skipping special file %s", src)
+            return
+
+        if dst_st is not None:
+            if self.is_unchanged(src_st, dst_st):
+                self.stats["unchanged"] += 1
+                return
+            self._remove(dst)
+        self.install_file(src, dst, src_st, dst_dev)
+
+    def populate(self, src, dst, delete=False):
+        """
+        Make the directory tree dst contain all the files in src.
+
+        If delete is True, also remove from dst the files that are not in src,
+        like rsync --delete.
+        """
+        os.makedirs(dst, exist_ok=True)
+        for root, dirs, files in os.walk(src):
+            relroot = os.path.relpath(root, src)
+            dst_root = os.path.normpath(os.path.join(dst, relroot))
+            dst_dev = os.stat(dst_root).st_dev
+
+            # Symlinks to directories are listed in dirs: recreate them as
+            # symlinks and do not descend into them
+            for d in list(dirs):
+                if not os.path.islink(os.path.join(root, d)): continue
+                dirs.remove(d)
+                files.append(d)
+
+            for d in dirs:
+                pathname = os.path.join(dst_root, d)
+                if os.path.lexists(pathname) and (os.path.islink(pathname) or not os.path.isdir(pathname)):
+                    self._remove(pathname)
+                os.makedirs(pathname, exist_ok=True)
+
+            for f in files:
+                self._sync_entry(os.path.join(root, f), os.path.join(dst_root, f), dst_dev)
+
+            if delete:
+                wanted = set(dirs) | set(files)
+                for name in os.listdir(dst_root):
+                    if name in wanted: continue
+                    self._remove(os.path.join(dst_root, name))
+                    self.stats["removed"] += 1
+
+        # Preserve directory permissions and times once their contents are in
+        # place
+        for root, dirs, files in os.walk(src):
+            relroot = os.path.relpath(root, src)
+            shutil.copystat(root, os.path.normpath(os.path.join(dst, relroot)))
+
+    def summary(self):
+        """
+        Return a short description of what has been done
+        """
+        return ", ".join("{} {}".format(count, name) for name, count in sorted(self.stats.items()) if count)
+
+
+def populate_tree(src, dst, delete=False, method="auto", writable=False):
+    """
+    Populate dst from src using a TreePopulator, and return the populator
+    """
+    populator = TreePopulator(method, writable=writable)
+    populator.populate(src, dst, delete=delete)
+    log.debug("populated %s from %s: %s", dst, src, populator.summary())
+    return populator
@@ -0,0 +1,120 @@
+import os
+import logging
+
+log = logging.getLogger()
+
+# Extensions of the profile files that simple-cdd uses
+EXTENSIONS = ("conf", "description", "preseed", "packages", "downloads", "udebs",
+              "postinst", "extra", "excludes")
+
+
+class ProfileIndex:
+    """
+    Index of the files in the profiles directories of simple_cdd_dirs.
+
+    Each directory is listed once, and a file in a directory hides the files
+    with the same name in the directories that come after it.
+    """
+    def __init__(self, dirs):
+        self.dirs = list(dirs)
+        # File name: pathname of the file that is used
+        self.files = {}
+        # File name: pathnames of the files hidden by it
+        self.hidden = {}
+        for d in self.dirs:
+            self.scan(os.path.join(d, "profiles"))
+
+    def scan(self, pathname):
+        try:
+            entries = list(os.scandir(pathname))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith("."): continue
+            try:
+                if not entry.is_file(): continue
+            except OSError:
+                continue
+            if entry.name in self.files:
+                self.hidden.setdefault(entry.name, []).append(entry.path)
+            else:
+                self.files[entry.name] = entry.path
+
+    def find(self, profile, ext):
+        """
+        Return the pathname of the file of profile with the given extension,
+        or None
+        """
+        return self.files.get("{}.{}".format(profile, ext), None)
+
+    def profile_files(self, profile):
+        """
+        Return a sorted list of (extension, pathname) for all the files of a
+        profile
+        """
+        prefix = profile + "."
+        res = []
+        for name, pathname in self.files.items():
+            if not name.startswith(prefix): continue
+            ext = name[len(prefix):]
+            # Files of a longer profile name, or backup copies
+            if "." in ext: continue
+            res.append((ext, pathname))
+        res.sort()
+        return res
+
+    def write(self, pathname):
+        """
+        Write the index for the shell tools: one line per file, with the
+        profile name, the extension and the pathname separated by tabs
+        """
+        with open(pathname, "wt") as fd:
+            for name in sorted(self.files):
+                profile, sep, ext = name.rpartition(".")
+                if not sep or not profile: continue
+                print("{}\t{}\t{}".format(profile, ext, self.files[name]), file=fd)
+
+    @classmethod
+    def read(cls, pathname):
+        """
+        Read an index written by write(). Returns None if pathname does not
+        exist.
+        """
+        res = cls([])
+        try:
+            with open(pathname, "rt") as fd:
+                for line in fd:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) != 3: continue
+                    profile, ext, path = fields
+                    res.files["{}.{}".format(profile, ext)] = path
+        except FileNotFoundError:
+            return None
+        return res
+
+    def report(self, profiles):
+        """
+        Check the files of the given profiles.
+
+        Returns (lines, problems): lines describe the files that each profile
+        contributes, and problems are messages about what looks wrong.
+        """
+        lines = []
+        problems = []
+        for profile in profiles:
+            files = self.profile_files(profile)
+            lines.append("{}:".format(profile))
+            if not files:
+                lines.append("  no files")
+                if profile != "default":
+                    problems.append("profile {}: no files found in {}".format(
+                        profile, " ".join(os.path.join(d, "profiles") for d in self.dirs)))
+                continue
+            for ext, pathname in files:
+                lines.append("  {}: {}".format(ext, pathname))
+                for hidden in self.hidden.get(os.path.basename(pathname), ()):
+                    lines.append("    hides {}".format(hidden))
+                if ext not in EXTENSIONS:
+                    problems.append("profile {}: {} is not used by simple-cdd (known extensions: {})".format(
+                        profile, pathname, ", ".join(EXTENSIONS)))
+        return lines, problems
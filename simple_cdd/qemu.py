@@ -0,0 +1,253 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import run_command, shell_quote, shell_which
+import subprocess
+import json
+import time
+import os
+import re
+import logging
+
+log = logging.getLogger()
+
+
+class Qemu:
+    """
+    Collect all qemu related functions
+    """
+    # Directory in the ISO image with the installer kernel and initrd, by
+    # architecture
+    INSTALLER_DIRS = {
+        "amd64": "install.amd",
+        "i386": "install.386",
+        "arm64": "install.a64",
+        "armhf": "install.ahf",
+        "ppc64el": "install",
+        "s390x": "install",
+    }
+
+    def __init__(self, env):
+        self.env = env
+
+    def find_binary(self):
+        """
+        Find the qemu command to use for the target architecture
+        """
+        arch = self.env.get("ARCH")
+        if arch == "amd64":
+            qemu = "qemu-system-x86_64"
+        elif arch == "powerpc":
+            qemu = "qemu-system-ppc"
+        else:
+            qemu = "qemu-system-" + arch
+        qemu_bin = shell_which(qemu)
+        if qemu_bin is None:
+            raise Fail("Cannot find qemu executable %s", qemu)
+        return qemu_bin
+
+    def accel_opts(self):
+        """
+        Return qemu options to enable hardware acceleration, if available
+        """
+        if os.path.exists("/dev/kvm"):
+            return ["-enable-kvm"]
+        return []
+
+    def create_image(self, pathname, size=None, backing=None):
+        """
+        Create a qcow2 disk image, optionally as a copy-on-write overlay on top
+        of a backing image
+        """
+        cmd = ["qemu-img", "create", "-f", "qcow2"]
+        if backing is not None:
+            cmd.extend(("-F", "qcow2", "-b", os.path.abspath(backing)))
+        cmd.append(pathname)
+        if size is not None:
+            cmd.append(size)
+        retval = run_command("creating qemu HD image", cmd)
+        if retval != 0:
+            raise Fail("failed to build qemu HD image %s", pathname)
+
+    def extract_installer(self, isoname, destdir):
+        """
+        Extract the installer kernel and initrd from an ISO image, so that the
+        installer can be booted with a custom command line.
+
+        Returns the pathnames of the kernel and the initrd.
+        """
+        xorriso = shell_which("xorriso")
+        if xorriso is None:
+            raise Fail("Cannot find xorriso, needed to extract the installer from %s", isoname)
+        arch = self.env.get("ARCH")
+        installer_dir = self.env.get("qemu_test_installer_dir") or self.INSTALLER_DIRS.get(arch, "install")
+        os.makedirs(destdir, exist_ok=True)
+        kernel = os.path.join(destdir, "vmlinuz")
+        initrd = os.path.join(destdir, "initrd.gz")
+        for src, dst in (("vmlinuz", kernel), ("initrd.gz", initrd)):
+            if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(isoname):
+                continue
+            cmd = [xorriso, "-osirrox", "on", "-indev", isoname,
+                   "-extract", "/{}/{}".format(installer_dir, src), dst]
+            retval = run_command("extracting installer from image", cmd)
+            if retval != 0:
+                raise Fail("Cannot extract /%s/%s from %s", installer_dir, src, isoname)
+        return kernel, initrd
+
+
+class QemuTestResult:
+    """
+    Outcome of an unattended installation test
+    """
+    def __init__(self, label, profiles):
+        self.label = label
+        self.profiles = profiles
+        # "pass", "fail" or "timeout"
+        self.status = None
+        self.retval = None
+        self.duration = None
+        self.serial_log = None
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "profiles": self.profiles,
+            "status": self.status,
+            "retval": self.retval,
+            "duration": self.duration,
+            "serial_log": self.serial_log,
+        }
+
+
+class QemuTestRunner:
+    """
+    Run unattended installations of an ISO image in qemu, one for each
+    combination of automatically selected profiles.
+
+    Each run gets its own copy-on-write overlay on top of a shared empty base
+    disk image, its own serial console log and a timeout. Runs are executed in
+    parallel.
+    """
+    def __init__(self, env, isoname):
+        self.env = env
+        self.isoname = isoname
+        self.qemu = Qemu(env)
+        self.workdir = os.path.join(env.get("simple_cdd_temp"), "qemu-test")
+        self.logdir = env.get("simple_cdd_logs")
+
+    def profile_matrix(self):
+        """
+        Return the list of profile combinations to test.
+
+        Each entry of qemu_test_profiles is a combination of profiles joined by
+        '+'. If qemu_test_profiles is empty, test auto_profiles.
+        """
+        matrix = []
+        for entry in self.env.get("qemu_test_profiles"):
+            matrix.append([p for p in entry.split("+") if p])
+        if not matrix:
+            matrix.append(self.env.get("auto_profiles"))
+        return matrix
+
+    def kernel_cmdline(self, profiles):
+        """
+        Build the installer command line for a run with the given profiles
+        """
+        params = [p for p in self.env.get("KERNEL_PARAMS") if not p.startswith("simple-cdd/profiles=")]
+        preseed = self.env.get("simple_cdd_preseed")
+        if preseed and preseed not in params:
+            params.append(preseed)
+        if profiles:
+            params.append("simple-cdd/profiles=" + ",".join(profiles))
+        params.extend(("auto=true", "priority=critical", "DEBIAN_FRONTEND=text"))
+        params.append(self.env.format("console={serial_console_opts}"))
+        return " ".join(params)
+
+    def run_one(self, profiles, qemu_bin, base_img, kernel, initrd):
+        label = "+".join(profiles) if profiles else "default"
+        result = QemuTestResult(label, profiles)
+        rundir = os.path.join(self.workdir, label)
+        os.makedirs(rundir, exist_ok=True)
+
+        overlay = os.path.join(rundir, "hd.qcow2")
+        if os.path.exists(overlay):
+            os.unlink(overlay)
+        self.qemu.create_image(overlay, backing=base_img)
+
+        result.serial_log = os.path.join(self.logdir, "qemu-test-{}.log".format(label))
+        cmd = [qemu_bin] + self.qemu.accel_opts()
+        cmd.extend(self.env.get("qemu_test_opts").split())
+        cmd.extend(("-display", "none", "-no-reboot",
+                    "-serial", "file:" + result.serial_log,
+                    "-drive", "if=virtio,aio=threads,cache=unsafe,file=" + overlay,
+                    "-cdrom", self.isoname,
+                    "-kernel", kernel, "-initrd", initrd,
+                    "-append", self.kernel_cmdline(profiles)))
+        log.info("qemu test %s: running %s", label, " ".join(shell_quote(x) for x in cmd))
+
+        timeout = int(self.env.get("qemu_test_timeout"))
+        start = time.monotonic()
+        try:
+            proc = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.PIPE, timeout=timeout)
+            result.retval = proc.returncode
+            result.status = "pass" if proc.returncode == 0 else "fail"
+            if proc.returncode != 0:
+                for line in proc.stderr.decode("utf-8", errors="replace").splitlines()[-5:]:
+                    log.warning("qemu test %s: %s", label, line)
+        except subprocess.TimeoutExpired:
+            result.status = "timeout"
+        result.duration = time.monotonic() - start
+
+        if result.status == "pass":
+            self.check_serial_log(result)
+
+        log.info("qemu test %s: %s after %.0fs", label, result.status, result.duration)
+        return result
+
+    def check_serial_log(self, result):
+        """
+        Fail a run that exited successfully if qemu_test_success_pattern is
+        not in its serial console log.
+
+        An installation that fails and powers the machine off also makes qemu
+        exit successfully, while one that completes reboots it, which
+        -no-reboot turns into an exit.
+        """
+        success_pattern = self.env.get("qemu_test_success_pattern")
+        if not success_pattern:
+            log.warning("qemu test %s: qemu_test_success_pattern is empty: only the exit code of qemu is checked",
+                        result.label)
+            return
+        with open(result.serial_log, "rt", errors="replace") as fd:
+            if not re.search(success_pattern, fd.read()):
+                log.warning("qemu test %s: %r not found in %s", result.label, success_pattern, result.serial_log)
+                result.status = "fail"
+
+    def run(self):
+        """
+        Run all the tests and return a list of QemuTestResult
+        """
+        qemu_bin = self.qemu.find_binary()
+        os.makedirs(self.workdir, exist_ok=True)
+        os.makedirs(self.logdir, exist_ok=True)
+
+        base_img = os.path.join(self.workdir, "base.qcow2")
+        if not os.path.exists(base_img):
+            self.qemu.create_image(base_img, size=self.env.get("hd_size") or "4G")
+
+        kernel, initrd = self.qemu.extract_installer(self.isoname, os.path.join(self.workdir, "installer"))
+
+        matrix = self.profile_matrix()
+        jobs = max(1, int(self.env.get("qemu_test_jobs")))
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(self.run_one, profiles, qemu_bin, base_img, kernel, initrd)
+                       for profiles in matrix]
+            results = [f.result() for f in futures]
+
+        with open(os.path.join(self.logdir, "qemu-test.json"), "wt") as fd:
+            json.dump({
+                "image": self.isoname,
+                "results": [r.to_dict() for r in results],
+            }, fd, indent=1)
+
+        return results
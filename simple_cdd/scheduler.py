@@ -0,0 +1,103 @@
+from simple_cdd.exceptions import Fail
+import contextvars
+import logging
+
+log = logging.getLogger()
+
+
+class Stage:
+    """
+    A unit of work run by StageScheduler
+    """
+    def __init__(self, name, func, inputs=(), outputs=None):
+        self.name = name
+        self.func = func
+        # Names of the resources that the stage reads and writes. If outputs
+        # is None, the stage can write anything, and it never runs at the
+        # same time as other stages
+        self.inputs = frozenset(inputs)
+        self.outputs = frozenset(outputs) if outputs is not None else None
+
+    def conflicts(self, other):
+        """
+        Return True if this stage and other cannot run at the same time
+        """
+        if self.outputs is None or other.outputs is None:
+            return True
+        return bool(self.outputs & (other.inputs | other.outputs) or other.outputs & self.inputs)
+
+    def __repr__(self):
+        return "Stage({})".format(self.name)
+
+
+class StageScheduler:
+    """
+    Run stages in threads, at the same time when they do not conflict.
+
+    Stages that conflict run in the order in which they were added. If a
+    stage fails, no more stages are started, and the first failure is raised
+    once the running ones are finished.
+    """
+    def __init__(self, jobs):
+        self.jobs = max(jobs, 1)
+        self.stages = []
+
+    def add(self, name, func, inputs=(), outputs=None):
+        """
+        Add a stage running func without arguments
+        """
+        self.stages.append(Stage(name, func, inputs, outputs))
+
+    def is_ready(self, stage, done):
+        """
+        Return True if all the stages added before stage that conflict with
+        it are done
+        """
+        for other in self.stages:
+            if other is stage:
+                return True
+            if other not in done and other.conflicts(stage):
+                return False
+        return True
+
+    def run(self):
+        """
+        Run all the stages, returning when they are all done
+        """
+        if self.jobs == 1 or len(self.stages) < 2:
+            for stage in self.stages:
+                stage.func()
+            return
+
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        pending = list(self.stages)
+        done = set()
+        # Future: Stage
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while running or (pending and error is None):
+                if error is None:
+                    for stage in list(pending):
+                        if len(running) >= self.jobs: break
+                        if not self.is_ready(stage, done): continue
+                        pending.remove(stage)
+                        if running:
+                            log.info("%s: running at the same time as %s", stage.name,
+                                     ", ".join(s.name for s in running.values()))
+                        # Each stage runs in a copy of our context, so that
+                        # it sees the context variables set by the caller
+                        running[executor.submit(contextvars.copy_context().run, stage.func)] = stage
+                finished, unused = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    done.add(stage)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                        elif isinstance(e, Fail):
+                            log.error(*e.args)
+        if error is not None:
+            raise error
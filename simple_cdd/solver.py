@@ -0,0 +1,133 @@
+from simple_cdd.indices import BASE_PRIORITIES
+from collections import deque
+import logging
+
+log = logging.getLogger()
+
+
+class Solver:
+    """
+    Compute a small set of packages that contains a list of packages and
+    everything they depend on.
+
+    Each group of alternatives in a dependency is satisfied by a single
+    package: one that is already selected if there is one, otherwise one of
+    the base priorities, which are always in the mirror, otherwise the first
+    alternative that exists. Virtual packages are satisfied by their
+    provider with the most important Priority.
+
+    Dependencies without alternatives are followed before choosing among
+    alternatives, so that choices can take advantage of what is selected
+    anyway.
+
+    With all_alternatives, every alternative and every provider of a virtual
+    package is selected instead, as the reprepro dependency loop does.
+    """
+    def __init__(self, index, recommends=False, excluded=(), all_alternatives=False):
+        """
+        index is the PackageIndex to resolve packages from. If recommends is
+        True, Recommends are followed as well as Depends and Pre-Depends.
+        Packages in excluded are never selected.
+        """
+        self.index = index
+        self.recommends = recommends
+        self.all_alternatives = all_alternatives
+        self.excluded = frozenset(excluded)
+        # Names of the selected packages
+        self.selected = set()
+        # Requested packages that cannot be found
+        self.unknown = []
+        # (package name, alternatives) for dependencies that cannot be satisfied
+        self.missing = []
+        self._queue = deque()
+        self._choices = deque()
+
+    def candidates(self, alternatives):
+        """
+        Return the names of the packages that can satisfy a group of
+        alternatives, in order of preference
+        """
+        res = []
+        for alt in alternatives:
+            for name in self.index.satisfiers(alt):
+                if name in self.excluded or name in res: continue
+                res.append(name)
+        return res
+
+    def is_satisfied(self, alternatives):
+        for alt in alternatives:
+            if alt in self.selected:
+                return True
+            for name in self.index.providers.get(alt, ()):
+                if name in self.selected:
+                    return True
+        return False
+
+    def choose(self, candidates):
+        """
+        Choose the package to satisfy a group of alternatives
+        """
+        for name in candidates:
+            if self.index.packages[name].priority in BASE_PRIORITIES:
+                return name
+        return candidates[0]
+
+    def select(self, name):
+        if name in self.selected: return
+        self.selected.add(name)
+        self._queue.append(name)
+
+    def _follow(self, pkg):
+        """
+        Select what is needed by the dependencies of pkg, or queue the choice
+        if there are alternatives
+        """
+        groups = [(alts, True) for alts in pkg.pre_depends + pkg.depends]
+        if self.recommends:
+            groups.extend((alts, False) for alts in pkg.recommends)
+        for alternatives, required in groups:
+            if self.all_alternatives:
+                candidates = self.candidates(alternatives)
+                if not candidates and required:
+                    self.missing.append((pkg.name, alternatives))
+                for name in candidates:
+                    self.select(name)
+                continue
+            if self.is_satisfied(alternatives): continue
+            candidates = self.candidates(alternatives)
+            if not candidates:
+                if required:
+                    self.missing.append((pkg.name, alternatives))
+            elif len(candidates) == 1:
+                self.select(candidates[0])
+            else:
+                self._choices.append(alternatives)
+
+    def solve(self, packages):
+        """
+        Add packages and their dependencies to the selection, and return the
+        set of the names of all the selected packages
+        """
+        for name in packages:
+            if name in self.excluded: continue
+            candidates = self.candidates([name])
+            if not candidates:
+                self.unknown.append(name)
+            elif self.all_alternatives:
+                for candidate in candidates:
+                    self.select(candidate)
+            elif candidates[0] == name:
+                self.select(name)
+            else:
+                # A virtual package
+                self._choices.append([name])
+
+        while self._queue or self._choices:
+            while self._queue:
+                self._follow(self.index.packages[self._queue.popleft()])
+            if self._choices:
+                alternatives = self._choices.popleft()
+                if self.is_satisfied(alternatives): continue
+                self.select(self.choose(self.candidates(alternatives)))
+
+        return self.selected
@@ -0,0 +1,115 @@
+from simple_cdd.lock import FileLock
+from simple_cdd.populate import TreePopulator
+from simple_cdd.utils import file_sha256
+import os
+import logging
+
+log = logging.getLogger()
+
+
+class ContentStore:
+    """
+    Store of files addressed by their SHA256 checksum, that can be shared by
+    several simple-cdd projects.
+
+    Files are linked into the store after they have been downloaded and
+    verified, and linked out of it instead of being downloaded again.
+    Objects are only ever added with an atomic rename and never modified, so
+    readers only need to hold a shared lock to protect against gc().
+    """
+    def __init__(self, root, method="auto"):
+        self.root = root
+        # Pool files are never modified in place, so hardlinks are fine
+        self.populator = TreePopulator(method)
+        self.lock_file = os.path.join(root, ".lock")
+        # Count of store hits and files added
+        self.stats = {"linked": 0, "added": 0}
+
+    def path(self, sha256):
+        """
+        Return the pathname of the object with the given checksum
+        """
+        return os.path.join(self.root, "sha256", sha256[:2], sha256)
+
+    def has(self, sha256):
+        return os.path.exists(self.path(sha256))
+
+    def link_out(self, sha256, dst):
+        """
+        Create dst with the contents of the object with the given checksum.
+
+        Returns False if the store does not have it.
+        """
+        src = self.path(sha256)
+        dirname = os.path.dirname(dst)
+        os.makedirs(dirname, exist_ok=True)
+        tmpname = dst + ".store-tmp"
+        if os.path.exists(tmpname):
+            os.unlink(tmpname)
+        with FileLock(self.lock_file, shared=True):
+            try:
+                src_st = os.stat(src)
+            except FileNotFoundError:
+                return False
+            self.populator.install_file(src, tmpname, src_st, os.stat(dirname).st_dev)
+        os.replace(tmpname, dst)
+        self.stats["linked"] += 1
+        log.debug("%s: linked from shared store", dst)
+        return True
+
+    def ingest(self, pathname, sha256=None):
+        """
+        Add a file to the store, if it does not have it already.
+
+        sha256 is the checksum the file has already been verified against; if
+        it is None, it is computed.
+        """
+        if sha256 is None:
+            sha256 = file_sha256(pathname)
+        dst = self.path(sha256)
+        if os.path.exists(dst):
+            return False
+        dirname = os.path.dirname(dst)
+        os.makedirs(dirname, exist_ok=True)
+        tmpname = "{}.{}.tmp".format(dst, os.getpid())
+        with FileLock(self.lock_file, shared=True):
+            self.populator.install_file(pathname, tmpname, os.stat(pathname), os.stat(dirname).st_dev)
+            # Objects are read only, so that a hardlinked copy in a project
+            # cannot be modified by mistake
+            os.chmod(tmpname, 0o444)
+            os.replace(tmpname, dst)
+        self.stats["added"] += 1
+        log.debug("%s: added to shared store as %s", pathname, sha256)
+        return True
+
+    def discard(self, sha256):
+        """
+        Remove an object from the store
+        """
+        with FileLock(self.lock_file):
+            try:
+                os.unlink(self.path(sha256))
+            except FileNotFoundError:
+                pass
+
+    def gc(self):
+        """
+        Remove objects that are not hardlinked from any project.
+
+        This only makes sense for stores populated with hardlinks: objects
+        reflinked or copied into projects always look unused.
+
+        Returns the number of objects removed.
+        """
+        removed = 0
+        with FileLock(self.lock_file):
+            top = os.path.join(self.root, "sha256")
+            if not os.path.isdir(top): return 0
+            for entry in os.scandir(top):
+                if not entry.is_dir(): continue
+                for obj in os.scandir(entry.path):
+                    st = obj.stat(follow_symlinks=False)
+                    if st.st_nlink > 1: continue
+                    os.unlink(obj.path)
+                    removed += 1
+        return removed
@@ -0,0 +1,175 @@
+from simple_cdd.exceptions import Fail
+import json
+import time
+import os
+import logging
+
+log = logging.getLogger()
+
+# Values of tool_log_compression, and the extensions they add to log names
+COMPRESSIONS = {
+    "": "",
+    "gz": ".gz",
+    "xz": ".xz",
+}
+
+# Size of the blocks written to the log files
+BLOCK_SIZE = 1024 * 1024
+
+# Time in seconds after which buffered lines are written even if a block is
+# not full, so that the logs can be followed while a tool runs
+FLUSH_INTERVAL = 2.0
+
+
+def _open_compressed(pathname, compression):
+    if compression == "gz":
+        import gzip
+        # The default compression level is much slower for little gain
+        return gzip.open(pathname, "wb", compresslevel=6)
+    elif compression == "xz":
+        import lzma
+        return lzma.open(pathname, "wb", preset=1)
+    else:
+        return open(pathname, "wb")
+
+
+class ToolLog:
+    """
+    Log of the output of a tool.
+
+    The output is written as lines prefixed with their stream name ("runcmd",
+    "stdout", "stderr", "retval"), in large blocks, and optionally
+    compressed. Buffered lines are also written when a line arrives
+    flush_interval seconds after the last write, and by run_command when the
+    tool has been quiet for flush_interval seconds. If events is True, each
+    line is also written as a JSON object to an uncompressed .events.jsonl
+    file next to the log, with its time, tool and stream.
+    """
+    def __init__(self, pathname, tool, compression="", events=False, block_size=BLOCK_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        """
+        pathname is the name of the log without the compression extension
+        """
+        if compression not in COMPRESSIONS:
+            raise Fail("Unknown log compression %r: use one of %s", compression,
+                       ", ".join(repr(x) for x in sorted(COMPRESSIONS)))
+        self.tool = tool
+        self.compression = compression
+        self.pathname = pathname + COMPRESSIONS[compression]
+        self.events_pathname = pathname + ".events.jsonl" if events else None
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        # Remove logs of previous runs with another compression, which would
+        # be found by find_tool_log instead of this one
+        for ext in COMPRESSIONS.values():
+            if pathname + ext != self.pathname and os.path.exists(pathname + ext):
+                os.unlink(pathname + ext)
+        if not events and os.path.exists(pathname + ".events.jsonl"):
+            os.unlink(pathname + ".events.jsonl")
+        self.fd = _open_compressed(self.pathname, compression)
+        self.events_fd = open(self.events_pathname, "wb") if events else None
+        self._lines = []
+        self._events = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, stream, text):
+        """
+        Log a line of text from the given stream
+        """
+        line = "{}: {}\n".format(stream, text).encode("utf-8", errors="replace")
+        self._lines.append(line)
+        self._size += len(line)
+        if self.events_fd is not None:
+            event = json.dumps({"time": time.time(), "tool": self.tool, "stream": stream, "text": text})
+            event = (event + "\n").encode("utf-8", errors="replace")
+            self._events.append(event)
+            self._size += len(event)
+        if self._size >= self.block_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.fd.write(b"".join(self._lines))
+            self._lines = []
+        if self._events:
+            self.events_fd.write(b"".join(self._events))
+            self.events_fd.flush()
+            self._events = []
+        if not self.compression:
+            # Flushing a compressor would make it restart its blocks
+            self.fd.flush()
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.fd.close()
+            if self.events_fd is not None:
+                self.events_fd.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def find_tool_log(pathname):
+    """
+    Return the pathname of the log written by ToolLog for pathname, with
+    whatever compression it used, or None
+    """
+    for ext in sorted(COMPRESSIONS.values()):
+        if os.path.exists(pathname + ext):
+            return pathname + ext
+    return None
+
+
+def open_tool_log(pathname):
+    """
+    Open a possibly compressed tool log for reading as text
+    """
+    if pathname.endswith(".gz"):
+        import gzip
+        return gzip.open(pathname, "rt", encoding="utf-8", errors="replace")
+    elif pathname.endswith(".xz"):
+        import lzma
+        return lzma.open(pathname, "rt", encoding="utf-8", errors="replace")
+    else:
+        return open(pathname, "rt", encoding="utf-8", errors="replace")
+
+
+def iter_tool_log(pathname, streams=None):
+    """
+    Generate (stream, text) for each line of a tool log, only for the given
+    streams if streams is not None
+    """
+    with open_tool_log(pathname) as fd:
+        for line in fd:
+            stream, sep, text = line.rstrip("\n").partition(": ")
+            if not sep:
+                stream, text = "", line.rstrip("\n")
+            if streams is not None and stream not in streams: continue
+            yield stream, text
+
+
+def iter_events(pathname, streams=None, offset=0):
+    """
+    Generate (offset, event) for each event of an .events.jsonl file
+    starting at the given byte offset, only for the given streams if streams
+    is not None.
+
+    offset is where the next event starts, so that a reader can resume from
+    there. A last line that is still being written is not generated.
+    """
+    with open(pathname, "rb") as fd:
+        fd.seek(offset)
+        for line in fd:
+            if not line.endswith(b"\n"): break
+            offset += len(line)
+            event = json.loads(line.decode("utf-8"))
+            if streams is not None and event.get("stream") not in streams: continue
+            yield offset, event
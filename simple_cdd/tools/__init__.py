@@ -1,3 +1,9 @@
 from .base import Tool
-from . import mirror_download
-from . import mirror_reprepro
+
+# Modules implementing tools in Python, imported by Tool.create only when the
+# tool is used
+Tool.lazy_register("build", "debian-cd", __name__ + ".build_debian_cd")
+Tool.lazy_register("mirror", "download", __name__ + ".mirror_download")
+Tool.lazy_register("mirror", "local", __name__ + ".mirror_local")
+Tool.lazy_register("mirror", "native", __name__ + ".mirror_native")
+Tool.lazy_register("mirror", "reprepro", __name__ + ".mirror_reprepro")
@@ -1,5 +1,7 @@
 from simple_cdd.exceptions import Fail
 from simple_cdd.utils import run_command, shell_quote
+from simple_cdd.toollog import ToolLog
+import importlib
 import os.path
 import logging
 
@@ -11,6 +13,17 @@ class Tool:
     Base class for external tools
     """
     TOOLS = {}
+    # Maps (type, name) to the name of the module that registers the tool
+    MODULES = {}
+
+    # Names of the resources that the tool reads and writes, used to run
+    # tools that do not conflict at the same time. None for outputs means
+    # that the tool can write anything, and always runs on its own. Mirror
+    # tools use "mirror:archive" for the package repository (conf, db, lists,
+    # pool and package indices), "mirror:installer" for the installer images
+    # and "mirror:files" for the mirror_files
+    inputs = ()
+    outputs = None
 
     @classmethod
     def register(cls, tool):
@@ -21,12 +34,34 @@ class Tool:
         cls.TOOLS[(tool.type, tool.name)] = tool
         return tool
 
+    @classmethod
+    def lazy_register(cls, type, name, module):
+        """
+        Declare that the tool with this type and name is registered by the
+        given module, which is imported the first time the tool is needed
+        """
+        cls.MODULES[(type, name)] = module
+
+    @classmethod
+    def lookup(cls, type, name):
+        """
+        Return the Tool class for this type and name, or None if it is
+        implemented as a shell script
+        """
+        tool = cls.TOOLS.get((type, name), None)
+        if tool is None:
+            module = cls.MODULES.get((type, name), None)
+            if module is not None:
+                importlib.import_module(module)
+                tool = cls.TOOLS.get((type, name), None)
+        return tool
+
     @classmethod
     def create(cls, env, type, name):
         """
         Create a tool runner for this type and name.
         """
-        tool = cls.TOOLS.get((type, name), None)
+        tool = cls.lookup(type, name)
         if tool is None:
             return ToolShell(env, type, name)
         else:
@@ -115,18 +150,16 @@ class ToolShell(Tool):
         log.info("Running tool %s", self.pathname)
         scriptname = self._make_run_script()
         retval = None
-        logfilename = scriptname + ".log"
-        with open(logfilename, "wt") as fd:
-            retval = run_command(
-                        "{}/{}".format(self.type, self.name),
-                        [scriptname],
-                        env={},
-                        logfd=fd)
-
-            if retval == 0:
-                log.info("%s/%s ran successfully, full log can be found in %s", self.type, self.name, scriptname)
-            else:
-                raise Fail("%s/%s exited with code %s, full log can be found in %s", self.type, self.name, retval, scriptname)
+        toolname = "{}/{}".format(self.type, self.name)
+        with ToolLog(scriptname + ".log", toolname,
+                     compression=self.env.get("tool_log_compression"),
+                     events=self.env.get("tool_log_events")) as fd:
+            retval = run_command(toolname, [scriptname], env={}, logfd=fd)
+
+        if retval == 0:
+            log.info("%s ran successfully, full log can be found in %s", toolname, fd.pathname)
+        else:
+            raise Fail("%s exited with code %s, full log can be found in %s", toolname, retval, fd.pathname)
         return retval
 
     def run(self):
@@ -0,0 +1,148 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.profiles import ProfileIndex
+from .base import Tool, ToolShell
+import shutil
+import os
+import logging
+
+log = logging.getLogger()
+
+@Tool.register
+class ToolBuildDebianCd(ToolShell):
+    """
+    Build the image with debian-cd.
+
+    The files that simple-cdd adds to the debian-cd build (task, exclude
+    list, extra files and debconf templates) are generated here, and the
+    shell script only runs debian-cd and tweaks the boot configuration.
+    """
+    type = "build"
+    name = "debian-cd"
+
+    def __init__(self, env):
+        super().__init__(env)
+        # ProfileIndex exported by build-simple-cdd, loaded when first needed
+        self.profile_index = None
+
+    def find_profile_file(self, profile, ext):
+        """
+        Return the pathname of the file for the given profile and extension
+        in the first of simple_cdd_dirs that has it, or None
+        """
+        if self.profile_index is None:
+            if self.env.get("profile_index"):
+                self.profile_index = ProfileIndex.read(self.env.get("profile_index"))
+            if self.profile_index is None:
+                # Not exported: the tool is run on its own
+                self.profile_index = ProfileIndex(self.env.get("simple_cdd_dirs"))
+        return self.profile_index.find(profile, ext)
+
+    def find_file(self, relname):
+        """
+        Return the pathname of relname in the first of simple_cdd_dirs that
+        has it, or None
+        """
+        for d in self.env.get("simple_cdd_dirs"):
+            pathname = os.path.join(d, relname)
+            if os.access(pathname, os.R_OK):
+                return pathname
+        return None
+
+    def write_task(self):
+        """
+        Write the debian-cd task with the includes and all the packages
+        """
+        pathname = self.env.get("TASK")
+        with open(pathname, "wt") as fd:
+            for i in sorted(set(self.env.get("includes"))):
+                print("#include <{}>".format(i), file=fd)
+            for p in sorted(set(self.env.get("all_packages"))):
+                print(p, file=fd)
+        log.info("%s: %d packages", pathname, len(set(self.env.get("all_packages"))))
+
+    def write_exclude(self):
+        """
+        Merge the exclude files of the profiles into the debian-cd exclude
+        list
+        """
+        if not self.env.get("exclude_files"):
+            self.env.set("EXCLUDE", "")
+            return
+        pathname = os.path.join(self.env.get("simple_cdd_temp"), "simple-cdd.excludes")
+        excluded = set()
+        for f in self.env.get("exclude_files"):
+            with open(f, "rt") as fd:
+                for line in fd:
+                    line = line.strip()
+                    if not line or line.startswith("#"): continue
+                    excluded.add(line)
+        with open(pathname, "wt") as fd:
+            for p in sorted(excluded):
+                print(p, file=fd)
+        self.env.set("EXCLUDE", pathname)
+
+    def write_templates(self, pathname):
+        """
+        Write the debconf template used to choose profiles at install time
+        """
+        profiles = self.env.get("profiles")
+        template = self.find_file("simple-cdd.templates")
+        if template is None:
+            raise Fail("Cannot find simple-cdd.templates in %s", self.env.get("simple_cdd_dirs"))
+        with open(template, "rt") as fd:
+            text = fd.read()
+        text = text.replace("CHOICES", ",".join(profiles))
+        text = text.replace("DEFAULTS", ",".join(self.env.get("default_profiles")))
+        text = text.replace(",", ", ")
+        with open(pathname, "wt") as fd:
+            fd.write(text)
+            for p in profiles:
+                description = self.find_profile_file(p, "description")
+                if description is None: continue
+                log.info("including description: %s", description)
+                words = []
+                with open(description, "rt") as infd:
+                    for line in infd:
+                        if line.startswith("#"): continue
+                        words.extend(line.split())
+                print(" .", file=fd)
+                print(" {}: {}".format(p, " ".join(words)), file=fd)
+
+    def write_extras(self):
+        """
+        Build the tree of files that simple-cdd adds to the image
+        """
+        extras_base_dir = os.path.join(self.env.get("simple_cdd_temp"), "extras")
+        if os.path.isdir(extras_base_dir):
+            log.info("purging %s", extras_base_dir)
+            shutil.rmtree(extras_base_dir)
+        extras_dir = os.path.join(extras_base_dir, "simple-cdd")
+        build_info = os.path.join(extras_dir, ".build-info")
+        os.makedirs(build_info)
+
+        # Copy some build information onto the image
+        with open(os.path.join(build_info, "commandline"), "wt") as fd:
+            print(self.env.get("commandline_opts"), file=fd)
+        for p in self.env.get("profiles") + self.env.get("build_profiles"):
+            pathname = self.find_profile_file(p, "conf")
+            if pathname is not None:
+                shutil.copy(pathname, build_info)
+
+        # Copy the extra files
+        copied = set()
+        for name in ("all_extras", "package_files", "preseed_files", "exclude_files"):
+            for pathname in self.env.get(name):
+                if pathname in copied or not os.access(pathname, os.R_OK): continue
+                copied.add(pathname)
+                shutil.copy(pathname, extras_dir)
+
+        if self.env.get("profiles"):
+            self.write_templates(os.path.join(extras_dir, "simple-cdd.templates"))
+
+    def run(self):
+        self.check_pre()
+        self.write_task()
+        self.write_exclude()
+        self.write_extras()
+        retval = self.run_script()
+        self.check_post(retval)
@@ -0,0 +1,165 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import run_command, list_debs, file_sha256
+from .base import Tool
+import subprocess
+import os
+import logging
+
+log = logging.getLogger()
+
+@Tool.register
+class ToolMirrorLocal(Tool):
+    """
+    Include local_packages into the reprepro mirror.
+
+    Packages already in the mirror with the same checksum are skipped, the
+    others are imported with one reprepro invocation per distribution and
+    package type.
+    """
+    type = "mirror"
+    name = "local"
+    outputs = ("mirror:archive",)
+
+    # Maximum number of files passed to a single reprepro invocation
+    BATCH_SIZE = 500
+
+    def __init__(self, env):
+        self.env = env
+        # Pathnames of the packages included by the last run, by outcome
+        self.added = []
+        self.replaced = []
+        self.skipped = []
+
+    def check_pre(self):
+        if not os.path.exists(os.path.join(self.env.get("MIRROR"), "conf", "distributions")):
+            raise Fail("Cannot run mirror/local: %s is not a reprepro repository", self.env.get("MIRROR"))
+
+    def reprepro_env(self):
+        """
+        Build the environment for running reprepro
+        """
+        res = {}
+        for name, val, changed in self.env.export_iter():
+            res[name] = str(val)
+        return res
+
+    def reprepro(self, description, args, reprepro_env, check=True):
+        cmd = ["reprepro"]
+        cmd.extend(self.env.get("reprepro_opts"))
+        cmd.extend(args)
+        retval = run_command(description, cmd, env=reprepro_env)
+        if retval != 0:
+            if check:
+                raise Fail("reprepro failed with exit code: %d", retval)
+            log.warning("reprepro failed with exit code: %d", retval)
+
+    def list_indexed(self, codename, reprepro_env):
+        """
+        Return a dict mapping (package type, file basename) to (package name,
+        sha256) for all the packages in the given distribution
+        """
+        cmd = ["reprepro"]
+        cmd.extend(self.env.get("reprepro_opts"))
+        cmd.extend(["--list-format=${$type} ${package} ${Filename} ${SHA256}\\n", "listmatched", codename, "*"])
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=reprepro_env)
+        if proc.returncode != 0:
+            raise Fail("reprepro listmatched %s failed with exit code %d: %s",
+                       codename, proc.returncode, proc.stderr.decode("utf-8", errors="replace").strip())
+        res = {}
+        for line in proc.stdout.decode("utf-8").splitlines():
+            fields = line.split()
+            if len(fields) != 4: continue
+            type, package, filename, sha256 = fields
+            res[(type, os.path.basename(filename))] = (package, sha256)
+        return res
+
+    def scan(self):
+        """
+        Return a list of (type, pathname) for all packages in local_packages
+        """
+        res = []
+        for src in self.env.get("local_packages"):
+            for f in list_debs(src):
+                if f.endswith(".deb"):
+                    res.append(("deb", f))
+                elif f.endswith(".udeb"):
+                    res.append(("udeb", f))
+                else:
+                    log.warning("unknown package type: %s", f)
+        return res
+
+    def include(self, reprepro_env=None):
+        """
+        Include local packages into the mirror
+        """
+        if reprepro_env is None:
+            reprepro_env = self.reprepro_env()
+        self.added = []
+        self.replaced = []
+        self.skipped = []
+
+        packages = self.scan()
+        if not packages: return
+
+        codename = self.env.get("CODENAME")
+        di_codename = self.env.get("DI_CODENAME")
+        distributions = [codename]
+        if di_codename != codename:
+            distributions.append(di_codename)
+
+        sums = {}
+        for type, pathname in packages:
+            sums[pathname] = file_sha256(pathname)
+
+        added = set()
+        replaced = set()
+        for dist in distributions:
+            indexed = self.list_indexed(dist, reprepro_env)
+            for type in ("deb", "udeb"):
+                # debs only go in the main distribution
+                if type == "deb" and dist != codename: continue
+                to_include = []
+                to_remove = []
+                for t, pathname in packages:
+                    if t != type: continue
+                    existing = indexed.get((type, os.path.basename(pathname)), None)
+                    if existing is None:
+                        added.add(pathname)
+                    elif existing[1] != sums[pathname]:
+                        # Same file name but different contents: reprepro
+                        # refuses to include it until the old one is removed
+                        to_remove.append(existing[0])
+                        replaced.add(pathname)
+                    else:
+                        continue
+                    to_include.append(pathname)
+
+                for idx in range(0, len(to_remove), self.BATCH_SIZE):
+                    self.reprepro("reprepro: removing replaced local packages",
+                                  ["-T", type, "remove", dist] + to_remove[idx:idx + self.BATCH_SIZE],
+                                  reprepro_env)
+                for idx in range(0, len(to_include), self.BATCH_SIZE):
+                    self.reprepro("reprepro: including local {} files".format(type),
+                                  ["--ignore=wrongdistribution", "include" + type, dist] + to_include[idx:idx + self.BATCH_SIZE],
+                                  reprepro_env, check=dist == codename)
+
+        for type, pathname in packages:
+            if pathname in replaced:
+                self.replaced.append(pathname)
+            elif pathname in added:
+                self.added.append(pathname)
+            else:
+                self.skipped.append(pathname)
+
+        log.info("local packages: %d added, %d replaced, %d already in the mirror",
+                 len(self.added), len(self.replaced), len(self.skipped))
+        for pathname in self.added:
+            log.debug("local packages: added %s", pathname)
+        for pathname in self.replaced:
+            log.debug("local packages: replaced %s", pathname)
+        for pathname in self.skipped:
+            log.debug("local packages: skipped %s", pathname)
+
+    def run(self):
+        self.check_pre()
+        self.include()
@@ -0,0 +1,517 @@
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import Checksums, FileSums, file_sha256
+from simple_cdd.gnupg import Gnupg
+from simple_cdd.download import Downloader, NotFound
+from simple_cdd.mirrors import MirrorPool
+from simple_cdd.store import ContentStore
+from simple_cdd.indices import PackageIndex, BASE_PRIORITIES
+from simple_cdd.solver import Solver
+from simple_cdd.pdiff import DiffIndex, apply_ed_patch
+from simple_cdd.pkgset import PackageSet, PackageSetDiff, PACKAGE_SET_FILE
+from .base import Tool
+import shutil
+import time
+import os
+import logging
+
+log = logging.getLogger()
+
+# Codenames whose security archive uses the CODENAME/updates suite
+LEGACY_SECURITY = ("jessie", "stretch", "buster")
+
+
+class Source:
+    """
+    A suite of an upstream archive that packages are mirrored from
+    """
+    def __init__(self, name, mirrors, suite, required=True):
+        # Name used for the local copies of its indices
+        self.name = name
+        # MirrorPool of the archive
+        self.mirrors = mirrors
+        self.suite = suite
+        # If False, indices missing from the archive are skipped
+        self.required = required
+        # Checksums of the files listed in the Release file
+        self.sums = None
+        # True if the archive serves indices by checksum
+        self.by_hash = False
+
+    def dist_path(self, relname):
+        return "dists/{}/{}".format(self.suite, relname)
+
+    def fetch(self, downloader, path, output, **kw):
+        """
+        Download the file path of the dists/ directory of the suite
+        """
+        return self.mirrors.fetch(downloader, self.dist_path(path), output, **kw)
+
+    def __repr__(self):
+        return "Source({} {})".format(self.name, self.suite)
+
+
+def make_checksums(env, entries):
+    """
+    Build a Checksums object from a dict mapping relnames to (sha256, size)
+    """
+    res = Checksums(env)
+    for relname, (sha256, size) in entries.items():
+        res.by_relname[relname] = FileSums(SHA256=sha256, size=size)
+    return res
+
+
+def decompress(src, dst):
+    """
+    Decompress a .gz or .xz file, or copy an uncompressed one
+    """
+    if src.endswith(".gz"):
+        import gzip
+        opener = gzip.open
+    elif src.endswith(".xz"):
+        import lzma
+        opener = lzma.open
+    else:
+        opener = open
+    tmpname = dst + ".tmp"
+    with opener(src, "rb") as infd:
+        with open(tmpname, "wb") as outfd:
+            shutil.copyfileobj(infd, outfd, 1024 * 1024)
+    os.replace(tmpname, dst)
+
+
+def copy_paragraphs(pathname, keep, out):
+    """
+    Write to out the paragraphs of a Packages file for which keep(name,
+    version) returns True. Returns the number of paragraphs written.
+    """
+    count = 0
+    with open(pathname, "rt", encoding="utf-8", errors="surrogateescape") as fd:
+        lines = []
+        name = version = None
+        for line in fd:
+            if line != "\n":
+                lines.append(line)
+                if line.startswith("Package:"):
+                    name = line[8:].strip()
+                elif line.startswith("Version:"):
+                    version = line[8:].strip()
+                continue
+            if lines and keep(name, version):
+                out.writelines(lines)
+                out.write("\n")
+                count += 1
+            lines = []
+            name = version = None
+        if lines and keep(name, version):
+            out.writelines(lines)
+            if not lines[-1].endswith("\n"): out.write("\n")
+            out.write("\n")
+            count += 1
+    return count
+
+
+@Tool.register
+class ToolMirrorNative(Tool):
+    """
+    Build the mirror without reprepro.
+
+    The Release files and Packages indices of the upstream archives are
+    downloaded and verified, using by-hash URLs and pdiffs when the archive
+    provides them. The packages needed by the image are computed from the
+    indices, downloaded concurrently and verified, and the dists/ and pool/
+    trees that debian-cd reads are written directly.
+    """
+    type = "mirror"
+    name = "native"
+    outputs = ("mirror:archive",)
+
+    # Features of mirror/reprepro that this tool does not implement
+    UNSUPPORTED = ("local_packages", "debian_mirror_extra", "backports", "profiles_udeb_dist",
+                   "extra_udeb_dist", "udebs_filter_formula")
+
+    def __init__(self, env):
+        self.env = env
+        self.gnupg = Gnupg(env)
+        # Verified copies of the upstream indices
+        self.workdir = os.path.join(env.get("simple_cdd_temp"), "native")
+        self.timeout = int(env.get("mirror_timeout") or 60)
+        # Name of the mirror variable: MirrorPool
+        self.pools = {}
+
+    def check_pre(self):
+        for name in self.UNSUPPORTED:
+            if self.env.get(name):
+                raise Fail("mirror/native does not support %s: use mirror/reprepro instead", name)
+        if self.env.get("dependency_solver") not in ("reprepro", "minimal"):
+            raise Fail("Unknown dependency_solver %r: use reprepro or minimal", self.env.get("dependency_solver"))
+
+    def mirror_pool(self, name, suite):
+        """
+        Return the MirrorPool for the mirror variable name, probing its
+        mirrors with the Release file of suite the first time
+        """
+        pool = self.pools.get(name, None)
+        if pool is None:
+            urls = self.env.get(name + "s") or [self.env.get(name)]
+            pool = self.pools[name] = MirrorPool(urls, timeout=self.timeout)
+            pool.probe("dists/{}/Release".format(suite))
+        return pool
+
+    def sources(self):
+        """
+        Return the Sources that debs are mirrored from, most important first
+        """
+        codename = self.env.get("CODENAME")
+        res = [Source("debian", self.mirror_pool("debian_mirror", codename), codename)]
+        if self.env.get("security_mirror") and codename != "sid":
+            suite = codename + ("/updates" if codename in LEGACY_SECURITY else "-security")
+            res.append(Source("security", self.mirror_pool("security_mirror", suite), suite, required=False))
+        if self.env.get("updates_mirror") and codename != "sid":
+            suite = codename + "-updates"
+            res.append(Source("updates", self.mirror_pool("updates_mirror", suite), suite, required=False))
+        if self.env.get("proposed_updates"):
+            res.append(Source("proposed-updates", self.mirror_pool("debian_mirror", codename),
+                              codename + "-proposed-updates", required=False))
+        return res
+
+    def udeb_source(self):
+        """
+        Return the Source that udebs are mirrored from
+        """
+        di_codename = self.env.get("DI_CODENAME")
+        return Source("debian-installer", self.mirror_pool("debian_mirror", di_codename), di_codename)
+
+    def local_path(self, source, relname):
+        return os.path.join(self.workdir, source.name, source.suite.replace("/", "_"), relname)
+
+    def fetch_release(self, downloader, source):
+        """
+        Download and verify the Release file of source, preferring InRelease
+        """
+        release = self.local_path(source, "Release")
+        inrelease = self.local_path(source, "InRelease")
+        try:
+            source.fetch(downloader, "InRelease", inrelease, revalidate=True)
+        except Fail as e:
+            log.debug("%s: %s: falling back to Release and Release.gpg", source, e.args[0] % e.args[1:])
+            source.fetch(downloader, "Release", release, revalidate=True)
+            source.fetch(downloader, "Release.gpg", release + ".gpg", revalidate=True)
+            self.gnupg.verify_detached_sig(release, release + ".gpg")
+        else:
+            self.gnupg.verify_inline_sig(inrelease)
+            self.gnupg.extract_inline_contents(release, inrelease)
+
+        source.sums = Checksums(self.env)
+        source.sums.parse_release_file(release)
+        with open(release, "rt") as fd:
+            for line in fd:
+                if line.startswith("Acquire-By-Hash:"):
+                    source.by_hash = line.split(":", 1)[1].strip().lower() == "yes"
+                    break
+
+    def fetch_index(self, downloader, source, relname):
+        """
+        Bring the local uncompressed copy of the index relname of source up to
+        date, and return its pathname, or None if source does not have it
+        """
+        local = self.local_path(source, relname)
+        expected = source.sums.by_relname.get(relname, None)
+        if os.path.exists(local):
+            if expected is not None and file_sha256(local) == expected.get("SHA256"):
+                log.debug("%s: %s is up to date", source, relname)
+                return local
+            if expected is not None and self.update_with_pdiff(downloader, source, relname, local):
+                return local
+
+        for ext in (".xz", ".gz", ""):
+            if relname + ext not in source.sums.by_relname: continue
+            path = relname + ext
+            if source.by_hash:
+                sha256 = source.sums.by_relname[relname + ext].get("SHA256")
+                if sha256 is not None:
+                    path = "{}/by-hash/SHA256/{}".format(os.path.dirname(relname), sha256)
+            if ext:
+                source.fetch(downloader, path, local + ext, checksums=source.sums, relname=relname + ext)
+                decompress(local + ext, local)
+                os.unlink(local + ext)
+            else:
+                source.fetch(downloader, path, local, checksums=source.sums, relname=relname)
+            if expected is not None:
+                source.sums.verify_file(local, relname)
+            return local
+
+        if source.required:
+            raise Fail("%s has no %s", source, relname)
+        return None
+
+    def update_with_pdiff(self, downloader, source, relname, local):
+        """
+        Update the local copy of an index with the pdiffs published by the
+        archive. Returns False if it cannot be done.
+        """
+        index_relname = relname + ".diff/Index"
+        if index_relname not in source.sums.by_relname:
+            return False
+        index_file = self.local_path(source, index_relname)
+        source.fetch(downloader, index_relname, index_file, checksums=source.sums, relname=index_relname)
+        index = DiffIndex.parse(index_file)
+        names = index.patches_from(file_sha256(local))
+        if index.current is None or not names:
+            return False
+
+        log.info("%s: updating %s with %d pdiffs", source, relname, len(names))
+        with open(local, "rt", encoding="utf-8", errors="surrogateescape") as fd:
+            lines = fd.readlines()
+        patch_sums = make_checksums(self.env, index.patches)
+        download_sums = make_checksums(self.env, index.downloads)
+        for name in names:
+            download = name + ".gz"
+            if name not in index.patches or download not in index.downloads:
+                return False
+            patch_file = os.path.join(os.path.dirname(index_file), name)
+            source.fetch(downloader, os.path.dirname(index_relname) + "/" + download, patch_file + ".gz",
+                         checksums=download_sums, relname=download)
+            decompress(patch_file + ".gz", patch_file)
+            try:
+                patch_sums.verify_file(patch_file, name)
+                with open(patch_file, "rt", encoding="utf-8", errors="surrogateescape") as fd:
+                    apply_ed_patch(lines, fd.readlines())
+            except Fail as e:
+                log.warning("%s: cannot apply pdiff %s: %s", source, name, e.args[0] % e.args[1:])
+                return False
+            finally:
+                for pathname in (patch_file, patch_file + ".gz"):
+                    if os.path.exists(pathname): os.unlink(pathname)
+
+        tmpname = local + ".patched"
+        with open(tmpname, "wt", encoding="utf-8", errors="surrogateescape") as fd:
+            fd.writelines(lines)
+        if file_sha256(tmpname) != index.current[0]:
+            log.warning("%s: %s does not match its checksum after applying pdiffs", source, relname)
+            os.unlink(tmpname)
+            return False
+        os.replace(tmpname, local)
+        return True
+
+    def select_packages(self, arch, index):
+        """
+        Return the names of the packages of arch to mirror: all_packages, the
+        base system, and their dependencies
+        """
+        wanted = list(self.env.get("all_packages"))
+        for pkg in index.packages.values():
+            if pkg.priority in BASE_PRIORITIES:
+                wanted.append(pkg.name)
+        solver = Solver(index, recommends=self.env.get("NORECOMMENDS") != "1",
+                        all_alternatives=self.env.get("dependency_solver") == "reprepro")
+        selected = solver.solve(wanted)
+        for name in solver.unknown:
+            log.info("%s: package %s not found in the archive", arch, name)
+        for name, alternatives in solver.missing:
+            log.info("%s: cannot satisfy dependency of %s on %s", arch, name, " | ".join(alternatives))
+        return selected
+
+    def fetch_pool(self, downloader, files):
+        """
+        Download the pool files, a dict mapping filenames to the
+        BinaryPackage that they contain, at most mirror_jobs at a time.
+        Files are downloaded, or verified if already in the mirror.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        mirror = self.env.get("MIRROR")
+        sums = Checksums(self.env)
+        for filename, pkg in files.items():
+            sums.by_relname[filename] = FileSums(SHA256=pkg.sha256, size=pkg.size)
+
+        def fetch(filename):
+            pkg = files[filename]
+            return pkg.origin.mirrors.fetch(downloader, filename, os.path.join(mirror, filename),
+                                            checksums=sums, relname=filename)
+
+        jobs = int(self.env.get("mirror_jobs") or 1)
+        start = time.monotonic()
+        downloaded = 0
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            for changed in executor.map(fetch, sorted(files)):
+                if changed: downloaded += 1
+        log.info("mirror/native: %d pool files, %d downloaded in %.1fs with %d jobs",
+                 len(files), downloaded, time.monotonic() - start, jobs)
+
+    def write_index(self, pathname, parts):
+        """
+        Write a Packages index and its gzipped version from parts, a list of
+        (source index pathname, keep function)
+        """
+        import gzip
+        os.makedirs(os.path.dirname(pathname), exist_ok=True)
+        count = 0
+        with open(pathname + ".tmp", "wt", encoding="utf-8", errors="surrogateescape") as out:
+            for source_pathname, keep in parts:
+                count += copy_paragraphs(source_pathname, keep, out)
+        os.replace(pathname + ".tmp", pathname)
+        with open(pathname, "rb") as infd:
+            with gzip.open(pathname + ".gz.tmp", "wb", compresslevel=6) as outfd:
+                shutil.copyfileobj(infd, outfd, 1024 * 1024)
+        os.replace(pathname + ".gz.tmp", pathname + ".gz")
+        log.debug("%s: %d packages", pathname, count)
+
+    def write_release(self, codename, components):
+        """
+        Write the Release file of a distribution of the local mirror, with the
+        checksums of all its indices
+        """
+        import hashlib
+        distdir = os.path.join(self.env.get("MIRROR"), "dists", codename)
+        entries = []
+        for root, dirs, files in os.walk(distdir):
+            dirs.sort()
+            for f in sorted(files):
+                if not f.startswith("Packages"): continue
+                pathname = os.path.join(root, f)
+                md5 = hashlib.md5()
+                sha256 = hashlib.sha256()
+                with open(pathname, "rb") as fd:
+                    while True:
+                        buf = fd.read(1024 * 1024)
+                        if not buf: break
+                        md5.update(buf)
+                        sha256.update(buf)
+                entries.append((os.path.relpath(pathname, distdir), os.path.getsize(pathname),
+                                md5.hexdigest(), sha256.hexdigest()))
+        with open(os.path.join(distdir, "Release.tmp"), "wt") as fd:
+            print("Codename:", codename, file=fd)
+            print("Suite:", self.env.get("SUITE"), file=fd)
+            print("Date:", time.strftime("%a, %d %b %Y %H:%M:%S UTC", time.gmtime()), file=fd)
+            print("Architectures:", " ".join(self.env.get("ARCHES")), file=fd)
+            print("Components:", " ".join(components), file=fd)
+            print("Description:", self.env.format("mirror for {CODENAME}"), file=fd)
+            for name, idx in (("MD5Sum", 2), ("SHA256", 3)):
+                print("{}:".format(name), file=fd)
+                for entry in entries:
+                    print(" {} {:>16} {}".format(entry[idx], entry[1], entry[0]), file=fd)
+        os.replace(os.path.join(distdir, "Release.tmp"), os.path.join(distdir, "Release"))
+
+    def remove_stale(self, filenames):
+        """
+        Remove the given files from the pool
+        """
+        mirror = self.env.get("MIRROR")
+        removed = 0
+        for filename in filenames:
+            try:
+                os.unlink(os.path.join(mirror, filename))
+            except FileNotFoundError:
+                continue
+            removed += 1
+        log.info("mirror/native: removed %d pool files not used anymore", removed)
+
+    def clean_pool(self, keep):
+        """
+        Remove the files in the pool that are not in keep
+        """
+        mirror = self.env.get("MIRROR")
+        removed = 0
+        for root, dirs, files in os.walk(os.path.join(mirror, "pool")):
+            for f in files:
+                pathname = os.path.join(root, f)
+                if os.path.relpath(pathname, mirror) in keep: continue
+                os.unlink(pathname)
+                removed += 1
+        log.info("mirror/native: removed %d unused pool files", removed)
+
+    def run(self):
+        self.check_pre()
+        env = self.env
+        codename = env.get("CODENAME")
+        di_codename = env.get("DI_CODENAME")
+        components = env.get("mirror_components")
+        os.makedirs(self.workdir, exist_ok=True)
+
+        store = None
+        if env.get("shared_store"):
+            store = ContentStore(env.get("shared_store"), env.get("populate_method"))
+        downloader = Downloader(timeout=self.timeout, state=os.path.join(self.workdir, "download-state.json"),
+                                store=store, trust_verified=env.get("trust_verified_files"))
+        try:
+            sources = []
+            for source in self.sources():
+                try:
+                    self.fetch_release(downloader, source)
+                except NotFound as e:
+                    if source.required:
+                        raise
+                    log.warning("%s: skipping %s", e.args[0] % e.args[1:], source)
+                    continue
+                sources.append(source)
+            udeb_source = self.udeb_source()
+            self.fetch_release(downloader, udeb_source)
+
+            # filename: BinaryPackage of the files of the pool
+            pool = {}
+            mirror = env.get("MIRROR")
+            for a in env.get("ARCHES"):
+                index = PackageIndex()
+                # (component, source, pathname) of the indices of this arch
+                indices = []
+                for source in sources:
+                    for component in components:
+                        relname = "{}/binary-{}/Packages".format(component, a)
+                        pathname = self.fetch_index(downloader, source, relname)
+                        if pathname is None: continue
+                        index.load(pathname, origin=source)
+                        indices.append((component, source, pathname))
+                selected = self.select_packages(a, index)
+                versions = {}
+                for name in selected:
+                    pkg = index.packages[name]
+                    versions[name] = (pkg.version, pkg.origin)
+                    pool[pkg.filename] = pkg
+
+                for component in components:
+                    parts = []
+                    for c, source, pathname in indices:
+                        if c != component: continue
+                        parts.append((pathname, lambda name, version, source=source:
+                                      versions.get(name, None) == (version, source)))
+                    self.write_index(os.path.join(mirror, "dists", codename, component,
+                                                  "binary-{}".format(a), "Packages"), parts)
+
+                # All the udebs of the installer
+                relname = "main/debian-installer/binary-{}/Packages".format(a)
+                pathname = self.fetch_index(downloader, udeb_source, relname)
+                udebs = PackageIndex()
+                udebs.load(pathname, origin=udeb_source)
+                for pkg in udebs.packages.values():
+                    pool[pkg.filename] = pkg
+                self.write_index(os.path.join(mirror, "dists", di_codename, relname),
+                                 [(pathname, lambda name, version, udebs=udebs:
+                                   name in udebs.packages and udebs.packages[name].version == version)])
+
+            # Only fetch and verify what changed since the last successful
+            # build, whose files are all in the mirror already
+            previous = None
+            if env.get("simple_cdd_logs"):
+                previous = PackageSet.read(os.path.join(env.get("simple_cdd_logs"), PACKAGE_SET_FILE))
+            diff = None
+            fetch = pool
+            if previous is not None:
+                current = PackageSet()
+                for pkg in pool.values():
+                    current.add(pkg.name, pkg.version, pkg.architecture, pkg.sha256 or "", pkg.filename)
+                diff = PackageSetDiff(previous, current)
+                log.info("mirror/native: packages since the last build: %s", diff.summary())
+                changed = set(diff.new_files)
+                fetch = {filename: pkg for filename, pkg in pool.items()
+                         if filename in changed or not os.path.exists(os.path.join(mirror, filename))}
+            self.fetch_pool(downloader, fetch)
+        finally:
+            downloader.save_state()
+
+        self.write_release(codename, components)
+        if di_codename != codename:
+            self.write_release(di_codename, ["main"])
+        if env.get("clean_mirror"):
+            if diff is not None:
+                self.remove_stale(diff.stale_files)
+            else:
+                self.clean_pool(set(pool))
@@ -1,6 +1,10 @@
 from simple_cdd.exceptions import Fail
-from simple_cdd.utils import run_command, list_debs, shell_which
+from simple_cdd.utils import run_command, shell_which
+from simple_cdd.store import ContentStore
+from simple_cdd.indices import PackageIndex, find_list_files, BASE_PRIORITIES
+from simple_cdd.solver import Solver
 from .base import Tool, ToolShell
+from .mirror_local import ToolMirrorLocal
 from debian import deb822
 import shutil
 import subprocess
@@ -13,6 +17,7 @@ log = logging.getLogger()
 class ToolMirrorReprepro(ToolShell):
     type = "mirror"
     name = "reprepro"
+    outputs = ("mirror:archive",)
 
     def run(self):
         """
@@ -257,33 +262,37 @@ class ToolMirrorReprepro(ToolShell):
             reprepro_env[name] = str(val)
 
         # include local packages into the mirror
-        for src in self.env.get("local_packages"):
-            for f in list_debs(src):
-                if f.endswith(".deb"):
-                    cmd = ["reprepro"]
-                    cmd.extend(self.env.get("reprepro_opts"))
-                    cmd.extend(["--ignore=wrongdistribution", "includedeb", codename, f])
-                    retval = run_command("reprepro: including local deb file", cmd, env=reprepro_env)
-                    if retval != 0:
-                        raise Fail("reprepro failed with exit code: %d", retval)
-                elif f.endswith(".udeb"):
-                    cmd = ["reprepro"]
-                    cmd.extend(self.env.get("reprepro_opts"))
-                    cmd.extend(["--ignore=wrongdistribution", "includeudeb", codename, f])
-                    retval = run_command("reprepro: including local deb file", cmd, env=reprepro_env)
-                    if retval != 0:
-                        raise Fail("reprepro failed with exit code: %d", retval)
-                    if codename != di_codename:
-                        cmd = ["reprepro"]
-                        cmd.extend(self.env.get("reprepro_opts"))
-                        cmd.extend(["--ignore=wrongdistribution", "includeudeb", di_codename, f])
-                        retval = run_command("reprepro: including local deb file", cmd, env=reprepro_env)
-                else:
-                    log.warning("unknown package type: %s", f)
+        ToolMirrorLocal(self.env).include(reprepro_env)
+
+        store = None
+        if self.env.get("shared_store"):
+            store = ContentStore(self.env.get("shared_store"), self.env.get("populate_method"))
+
+        dependency_solver = self.env.get("dependency_solver")
+        if dependency_solver not in ("reprepro", "minimal"):
+            raise Fail("Unknown dependency_solver %r: use reprepro or minimal", dependency_solver)
 
         # Update package lists
+        update_opts = []
+        if store is not None or dependency_solver == "minimal":
+            # Download the package lists first, so that we can fill the pool
+            # with what the shared store already has, and compute the
+            # packages we need
+            cmd = ["reprepro"]
+            cmd.extend(self.env.get("reprepro_opts"))
+            cmd.extend(["--noskipold", "checkupdate"])
+            retval = run_command("reprepro: downloading package lists", cmd, env=reprepro_env)
+            if retval != 0:
+                raise Fail("reprepro failed with exit code: %d", retval)
+            if store is not None:
+                self.seed_from_store(store, reprepro_env)
+            if dependency_solver == "minimal":
+                self.solve_dependencies(pkglist_file)
+            update_opts.append("--nolistsdownload")
+
         cmd = ["reprepro"]
         cmd.extend(self.env.get("reprepro_opts"))
+        cmd.extend(update_opts)
         cmd.extend(["--noskipold", "update"])
         retval = run_command("reprepro: updating package lists", cmd, env=reprepro_env)
         if retval != 0:
@@ -293,7 +302,9 @@ class ToolMirrorReprepro(ToolShell):
         # installable, and warn otherwise or fail before we start building a
         # mirror
 
-        self.run_script()
+        if dependency_solver == "reprepro":
+            # Iterate reprepro update until no new dependencies are found
+            self.run_script()
 
         for f in self.env.get("exclude_files"):
             with open(f, "rt") as infd:
@@ -308,8 +319,144 @@ class ToolMirrorReprepro(ToolShell):
                     if retval != 0:
                         raise Fail("reprepro failed with exit code: %d", retval)
 
+        if store is not None:
+            self.update_store(store, reprepro_env)
+
         self.check_post(retval)
 
+    def solve_dependencies(self, pkglist_file):
+        """
+        Write to pkglist_file the smallest set of packages that contains
+        all_packages, the local packages, the packages of the base priorities,
+        and their dependencies, choosing a single package for each group of
+        alternatives.
+
+        This uses the package lists downloaded by reprepro checkupdate.
+        """
+        mirror = self.env.get("MIRROR")
+        listsdir = os.path.join(mirror, "lists")
+
+        excluded = set()
+        for f in self.env.get("exclude_files"):
+            with open(f, "rt") as fd:
+                for line in fd:
+                    pkg = line.strip()
+                    if not pkg or pkg.startswith("#"): continue
+                    excluded.add(pkg)
+
+        # Local packages are in the mirror already, but what they depend on
+        # needs to be mirrored too
+        requested = list(self.env.get("all_packages"))
+        for type, pathname in ToolMirrorLocal(self.env).scan():
+            requested.append(os.path.basename(pathname).split("_", 1)[0])
+
+        recommends = self.env.get("NORECOMMENDS") != "1"
+        selected = set()
+        for a in self.env.get("ARCHES"):
+            index = PackageIndex()
+            list_files = find_list_files(listsdir, a)
+            if not list_files:
+                raise Fail("No package lists for %s found in %s", a, listsdir)
+            for pathname in list_files:
+                index.load(pathname)
+            # Our distribution has the local packages
+            for component in self.env.get("mirror_components"):
+                pathname = self.env.format("{MIRROR}/dists/{CODENAME}/{component}/binary-{a}/Packages", component=component, a=a)
+                if os.path.exists(pathname):
+                    index.load(pathname)
+
+            # Packages of the base priorities are always mirrored, and so
+            # must be what they depend on
+            base = sorted(name for name, pkg in index.packages.items() if pkg.priority in BASE_PRIORITIES)
+
+            solver = Solver(index, recommends=recommends, excluded=excluded)
+            selected.update(solver.solve(requested + base))
+            for name in solver.unknown:
+                log.warning("%s: requested package %s not found", a, name)
+            for name, alternatives in solver.missing:
+                log.warning("%s: %s: cannot satisfy dependency on %s", a, name, " | ".join(alternatives))
+
+        with open(pkglist_file, "wt") as fd:
+            for name in sorted(selected):
+                print(name, "install", file=fd)
+        log.info("dependency solver: %d packages selected for %d requested", len(selected), len(set(requested)))
+
+    def reprepro_batched(self, description, args, filekeys, reprepro_env, batch_size=500):
+        """
+        Run a reprepro command on a list of files, a batch at a time
+        """
+        for idx in range(0, len(filekeys), batch_size):
+            cmd = ["reprepro"]
+            cmd.extend(self.env.get("reprepro_opts"))
+            cmd.extend(args)
+            cmd.extend(filekeys[idx:idx + batch_size])
+            retval = run_command(description, cmd, env=reprepro_env)
+            if retval != 0:
+                raise Fail("reprepro failed with exit code: %d", retval)
+
+    def seed_from_store(self, store, reprepro_env):
+        """
+        Link into the pool all the files of the downloaded package lists that
+        are in the shared store, and register them in the reprepro database,
+        so that reprepro update does not download them again.
+        """
+        mirror = self.env.get("MIRROR")
+        listsdir = os.path.join(mirror, "lists")
+        if not os.path.isdir(listsdir): return
+
+        seeded = []
+        seen = set()
+        for entry in os.scandir(listsdir):
+            if not entry.name.endswith("_Packages"): continue
+            with open(entry.path, "rt", encoding="utf-8", errors="replace") as fd:
+                for rec in deb822.Deb822.iter_paragraphs(fd, fields=("Filename", "SHA256")):
+                    filekey = rec.get("Filename")
+                    sha256 = rec.get("SHA256")
+                    if not filekey or not sha256 or filekey in seen: continue
+                    seen.add(filekey)
+                    pathname = os.path.join(mirror, filekey)
+                    if os.path.exists(pathname): continue
+                    if store.link_out(sha256, pathname):
+                        seeded.append(filekey)
+
+        if not seeded: return
+        log.info("shared store: %d files linked into the pool", len(seeded))
+        self.reprepro_batched("reprepro: registering files from the shared store", ["_detect"], seeded, reprepro_env)
+
+    def update_store(self, store, reprepro_env):
+        """
+        Add the pool files to the shared store, and remove from the pool the
+        files linked by seed_from_store that turned out not to be needed
+        """
+        cmd = ["reprepro"]
+        cmd.extend(self.env.get("reprepro_opts"))
+        cmd.extend(["deleteunreferenced"])
+        retval = run_command("reprepro: removing unused files", cmd, env=reprepro_env)
+        if retval != 0:
+            raise Fail("reprepro failed with exit code: %d", retval)
+
+        # _listchecksums prints one line per file: the filekey followed by
+        # reprepro's representation of its checksums, where the SHA256 is
+        # the field starting with :2:
+        cmd = ["reprepro"]
+        cmd.extend(self.env.get("reprepro_opts"))
+        cmd.append("_listchecksums")
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=reprepro_env)
+        if proc.returncode != 0:
+            log.warning("reprepro _listchecksums failed with exit code %d: not updating the shared store", proc.returncode)
+            return
+        mirror = self.env.get("MIRROR")
+        for line in proc.stdout.decode("utf-8").splitlines():
+            fields = line.split()
+            if not fields: continue
+            for field in fields[1:]:
+                if field.startswith(":2:"):
+                    pathname = os.path.join(mirror, fields[0])
+                    if os.path.exists(pathname):
+                        store.ingest(pathname, field[3:])
+                    break
+        log.info("shared store: %d files linked, %d files added", store.stats["linked"], store.stats["added"])
+
     def check_post(self, retval):
         debcheck = shell_which("dose-debcheck")
         if debcheck is None:
@@ -0,0 +1,135 @@
+from simple_cdd.exceptions import Fail
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+import logging
+
+log = logging.getLogger()
+
+# Tracer of the running build, if tracing was requested
+TRACER = None
+
+
+class Tracer:
+    """
+    Write a timeline of the build as a JSON file in the Trace Event Format,
+    which can be opened with chrome://tracing or https://ui.perfetto.dev.
+
+    Events are appended to the file as they happen, with one write each, so
+    that processes forked during the build can add their own events to the
+    same file.
+    """
+    def __init__(self, pathname, process_name="build-simple-cdd"):
+        self.pathname = pathname
+        # Only the process that created the tracer closes the file
+        self.pid = os.getpid()
+        self.origin = time.monotonic()
+        self.lock = threading.Lock()
+        # (pid, tid) of the threads that have been named in the trace
+        self.named = set()
+        try:
+            self.fd = os.open(pathname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+        except OSError as e:
+            raise Fail("Cannot write trace file %s: %s", pathname, e)
+        os.write(self.fd, b"[\n")
+        self.set_process_name(process_name)
+
+    def now(self):
+        """
+        Return the current trace time, in microseconds
+        """
+        return int((time.monotonic() - self.origin) * 1000000)
+
+    def _emit(self, event, last=False):
+        data = json.dumps(event, default=str) + ("\n" if last else ",\n")
+        os.write(self.fd, data.encode("utf-8"))
+
+    def _thread_ids(self):
+        """
+        Return the (pid, tid) of the current thread, naming it in the trace
+        the first time it is seen
+        """
+        pid = os.getpid()
+        tid = threading.get_ident() & 0xffffffff
+        with self.lock:
+            if (pid, tid) not in self.named:
+                self.named.add((pid, tid))
+                self._emit({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                            "args": {"name": threading.current_thread().name}})
+        return pid, tid
+
+    def set_process_name(self, name):
+        """
+        Name the current process in the trace
+        """
+        self._emit({"name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0, "args": {"name": name}})
+
+    def complete(self, name, category, start, args=None):
+        """
+        Record a span that started at the given trace time and ends now
+        """
+        end = self.now()
+        pid, tid = self._thread_ids()
+        event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": end - start,
+                 "pid": pid, "tid": tid}
+        if args:
+            event["args"] = args
+        self._emit(event)
+
+    def close(self):
+        """
+        Terminate the JSON array, if called from the process that started the
+        trace
+        """
+        if self.fd is None or os.getpid() != self.pid: return
+        self._emit({"name": "trace_end", "ph": "M", "pid": self.pid, "tid": 0, "args": {}}, last=True)
+        os.write(self.fd, b"]\n")
+        os.close(self.fd)
+        self.fd = None
+
+
+def start(pathname):
+    """
+    Start tracing the build to the given file. Returns False if a trace is
+    already running.
+    """
+    global TRACER
+    if TRACER is not None:
+        return False
+    TRACER = Tracer(pathname)
+    log.info("writing trace to %s", pathname)
+    return True
+
+
+def stop():
+    global TRACER
+    tracer, TRACER = TRACER, None
+    if tracer is not None:
+        tracer.close()
+
+
+@contextmanager
+def span(name, category, **args):
+    """
+    Context manager recording the code it wraps as a span, if tracing.
+
+    It yields a dict of arguments attached to the span, which the wrapped
+    code can add to.
+    """
+    tracer = TRACER
+    if tracer is None:
+        yield args
+        return
+    start = tracer.now()
+    try:
+        yield args
+    except Fail as e:
+        args["error"] = e.args[0] % e.args[1:]
+        raise
+    except BaseException as e:
+        args["error"] = e.__class__.__name__
+        raise
+    finally:
+        tracer.complete(name, category, start, args)
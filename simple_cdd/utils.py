@@ -1,11 +1,11 @@
 from .exceptions import Fail
-from debian import deb822
+from . import trace
 import subprocess
 import fcntl
 import select
 import shlex
 import re
-import hashlib
+import json
 import os
 import logging
 import shutil
@@ -27,12 +27,15 @@ else:
     from distutils.spawn import find_executable
     shell_which = find_executable
 
-def stream_output(proc):
+def stream_output(proc, timeout=None):
     """
     Take a subprocess.Popen object and generate its output, line by line,
     annotated with "stdout" or "stderr". At process termination it generates
     one last element: ("result", return_code) with the return code of the
     process.
+
+    If timeout is given, ("idle", None) is generated each time the process
+    writes nothing for timeout seconds.
     """
     fds = [proc.stdout, proc.stderr]
     bufs = [b"", b""]
@@ -42,7 +45,9 @@ def stream_output(proc):
         fcntl.fcntl(fd, fcntl.F_SETFL, os.O_NONBLOCK)
     # Multiplex stdout and stderr with different prefixes
     while len(fds) > 0:
-        s = select.select(fds, (), ())
+        s = select.select(fds, (), (), timeout)
+        if not s[0]:
+            yield "idle", None
         for fd in s[0]:
             idx = fds.index(fd)
             buf = fd.read()
@@ -61,6 +66,24 @@ def stream_output(proc):
     yield "result", res
 
 
+class OutputCollector:
+    """
+    Collect in memory the output of a command run by run_command, as a list
+    of (stream, text)
+    """
+    def __init__(self):
+        self.lines = []
+
+    def write(self, stream, text):
+        self.lines.append((stream, text))
+
+    def stream(self, name):
+        """
+        Return the lines of text of the given stream
+        """
+        return [text for stream, text in self.lines if stream == name]
+
+
 def run_command(name, cmd, env=None, logfd=None):
     """
     Run a command logging its output.
@@ -72,32 +95,47 @@ def run_command(name, cmd, env=None, logfd=None):
     env is the environment to run the command in. If missing, the current
     environment is used.
 
-    logfd, if present, is a file where the full output of the command will also
-    be written.
+    logfd, if present, is a ToolLog or OutputCollector where the full output
+    of the command will also be written.
     """
     quoted_cmd = " ".join(shell_quote(x) for x in cmd)
     log.debug("%s running command %s", name, quoted_cmd)
-    if logfd: print("runcmd:", quoted_cmd, file=logfd)
+    if logfd: logfd.write("runcmd", quoted_cmd)
+
+    with trace.span(name, "command", cmd=quoted_cmd) as trace_args:
+        # Run the script itself on an empty environment, so that what was
+        # documented is exactly what was run
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        trace_args["pid"] = proc.pid
+        retval = _log_output(name, proc, logfd)
+        trace_args["exit_code"] = retval
+
+    return retval
 
-    # Run the script itself on an empty environment, so that what was
-    # documented is exactly what was run
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
 
+def _log_output(name, proc, logfd):
+    """
+    Log the output of a process run by run_command, and return its exit code
+    """
     stderr = []
-    for type, val in stream_output(proc):
+    # Let a ToolLog write what it buffered while the process is quiet
+    timeout = getattr(logfd, "flush_interval", None)
+    for type, val in stream_output(proc, timeout=timeout):
         if type == "stdout":
             val = val.decode("utf-8").rstrip()
-            if logfd: print("stdout:", val, file=logfd)
+            if logfd: logfd.write("stdout", val)
             log.debug("%s stdout: %s", name, val)
         elif type == "stderr":
             val = val.decode("utf-8").rstrip()
-            if logfd: print("stderr:", val, file=logfd)
+            if logfd: logfd.write("stderr", val)
             if val: stderr.append(val)
             log.debug("%s stderr: %s", name, val)
         elif type == "result":
-            if logfd: print("retval:", val, file=logfd)
+            if logfd: logfd.write("retval", str(val))
             log.debug("%s retval: %d", name, val)
             retval = val
+        elif type == "idle":
+            logfd.flush()
 
     if retval != 0:
         lastlines = min(len(stderr), 5)
@@ -153,6 +191,53 @@ def list_debs(file_or_dir):
         log.warning("local package source %s is neither a file nor a directory", file_or_dir)
 
 
+def file_sha256(pathname):
+    """
+    Compute the SHA256 checksum of a file
+    """
+    import hashlib
+    hasher = hashlib.sha256()
+    with open(pathname, "rb") as fd:
+        while True:
+            buf = fd.read(1024 * 1024)
+            if not buf: break
+            hasher.update(buf)
+    return hasher.hexdigest()
+
+
+class FileSums:
+    """
+    Checksums expected for a file.
+
+    Only those checksum fields actually present in the source file are set,
+    the others are None. size is also optional.
+    """
+    __slots__ = ("size", "MD5Sum", "SHA1", "SHA256")
+
+    def __init__(self, **kw):
+        for name in self.__slots__:
+            setattr(self, name, kw.get(name, None))
+
+    def get(self, name, default=None):
+        if name not in self.__slots__:
+            return default
+        val = getattr(self, name)
+        if val is None:
+            return default
+        return val
+
+    def items(self):
+        """
+        Return a list of (name, value) for all the fields that are set
+        """
+        res = []
+        for name in self.__slots__:
+            val = getattr(self, name)
+            if val is None: continue
+            res.append((name, val))
+        return res
+
+
 class Checksums:
     """
     In-memory database of file checksums
@@ -160,13 +245,14 @@ class Checksums:
     FIELDS = ["MD5Sum", "SHA1", "SHA256"]
 
     def __init__(self, env):
-        # dict mapping pathnames to { size: int, MD5Sum: str, SHA1: str, SHA256: str }
-        #
-        # Only those checksum fields actually present in the Release file will
-        # exist. size is also optional.
+        # dict mapping pathnames to FileSums
         self.by_relname = {}
         # Files that have been parsed to collect checksums
         self.sources = []
+        # Sorted list of the relnames, or prefixes of relnames, that
+        # parse_release_file has been limited to, or None if it stored all
+        # of them
+        self.filter = None
         # Parameters
         self.env = env
 
@@ -191,6 +277,8 @@ class Checksums:
             if real_size != expected_size:
                 raise Fail("Invalid size for %s: expected %d, got %d", absname, expected_size, real_size)
 
+        import hashlib
+
         # Check the file against the checksums that we have
         for hashtype in self.FIELDS:
             hashsum = file_sums.get(hashtype, None)
@@ -212,26 +300,95 @@ class Checksums:
             if hasher.hexdigest() != hashsum:
                 raise Fail("Invalid checksum for %s: expected %s, got %s", absname, hashsum, hasher.hexdigest())
 
-    def parse_release_file(self, pathname):
+    def parse_release_file(self, pathname, wanted=None, prefixes=None):
         """
-        Add checksums from a Release file
+        Add checksums from a Release file.
+
+        wanted is an optional set of relnames, and prefixes an optional
+        sequence of relname prefixes: if any of them is given, only the
+        checksums of the files matching them are stored, and the rest of the
+        file is skipped without being parsed.
         """
+        if wanted is not None or prefixes is not None:
+            wanted = frozenset(wanted or ())
+            prefixes = tuple(prefixes or ())
+            self.filter = sorted(wanted.union(prefixes))
+        by_relname = self.by_relname
+        fields = self.FIELDS
         self.sources.append(pathname)
         with open(pathname, "rt") as fd:
-            for rec in deb822.Deb822.iter_paragraphs(fd, fields=self.FIELDS):
-                for hashname in self.FIELDS:
-                    hashes = rec.get(hashname, None)
-                    if hashes is None: continue
-                    for line in hashes.split("\n"):
-                        line = line.strip()
-                        if not line: continue
-                        hashsum, size, pathname = line.split()
-                        entry = self.by_relname.get(pathname, None)
-                        if entry is None:
-                            self.by_relname[pathname] = { "size": int(size), hashname: hashsum }
-                        else:
-                            entry["size"] = int(size)
-                            entry[hashname] = hashsum
+            # Name of the checksum field we are in, or None if we are in a
+            # field that we do not need
+            hashname = None
+            for line in fd:
+                if line[0] not in " \t":
+                    name = line.split(":", 1)[0]
+                    hashname = name if name in fields else None
+                    continue
+                if hashname is None: continue
+                if wanted is not None:
+                    relname = line.rsplit(None, 1)[-1]
+                    if relname not in wanted and not (prefixes and relname.startswith(prefixes)):
+                        continue
+                hashsum, size, relname = line.split()
+                entry = by_relname.get(relname, None)
+                if entry is None:
+                    by_relname[relname] = entry = FileSums()
+                entry.size = int(size)
+                setattr(entry, hashname, hashsum)
+
+    def expected(self, relname):
+        """
+        Return a JSON-serializable description of the checksums expected for
+        relname, or None if we have none
+        """
+        file_sums = self.by_relname.get(relname, None)
+        if file_sums is None:
+            return None
+        return [list(item) for item in file_sums.items()]
+
+    def save(self, pathname):
+        """
+        Save the parsed checksums to a cache file
+        """
+        tmpname = pathname + ".tmp"
+        with open(tmpname, "wt") as fd:
+            json.dump({
+                "sources": self.sources,
+                "filter": self.filter,
+                "by_relname": { relname: dict(sums.items()) for relname, sums in self.by_relname.items() },
+            }, fd)
+        os.replace(tmpname, pathname)
+
+    def load(self, pathname, *sources, filter=None):
+        """
+        Load checksums from a cache file written by save().
+
+        If source pathnames are given, the cache is only used if it is newer
+        than all of them.
+
+        filter is the sorted list of wanted relnames and prefixes that the
+        checksums are expected to have been filtered with, as in
+        self.filter: a cache filtered differently is not used.
+
+        Returns True if the cache was loaded, False if it is missing or stale.
+        """
+        try:
+            mtime = os.path.getmtime(pathname)
+            for source in sources:
+                if os.path.getmtime(source) > mtime:
+                    return False
+            with open(pathname, "rt") as fd:
+                data = json.load(fd)
+        except (OSError, ValueError):
+            return False
+        if data.get("filter") != filter:
+            return False
+        self.sources.extend(data["sources"])
+        self.filter = filter
+        for relname, sums in data["by_relname"].items():
+            self.by_relname[relname] = FileSums(**sums)
+        return True
 
     def parse_checksums_file(self, pathname, fieldname):
         """
@@ -245,8 +402,19 @@ class Checksums:
                     pathname = pathname[2:]
                 entry = self.by_relname.get(pathname, None)
                 if entry is None:
-                    self.by_relname[pathname] = { fieldname: hashsum }
-                else:
-                    entry[fieldname] = hashsum
+                    self.by_relname[pathname] = entry = FileSums()
+                setattr(entry, fieldname, hashsum)
 
 
+def format_size(size):
+    """
+    Format a size in bytes for humans, or "-" if it is None
+    """
+    if size is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB": break
+        size /= 1024
+    if unit == "B":
+        return "{}B".format(size)
+    return "{:.1f}{}".format(size, unit)
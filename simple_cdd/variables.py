@@ -10,6 +10,10 @@ VARIABLES = [
             help="directory where intermediate build data are stored"),
     PathVar("simple_cdd_logs", ["{simple_cdd_temp}", "log"],
             help="directory where execution logs are stored"),
+    TextVar("tool_log_compression", "",
+            help="compression of the tool logs in simple_cdd_logs: empty for none, gz or xz"),
+    BoolVar("tool_log_events", False,
+            help="when true, also log the output of tools as JSON lines in TOOL.log.events.jsonl"),
     PathVar("simple_cdd_mirror", ["{simple_cdd_temp}", "mirror"],
             help="directory where the local mirror is stored"),
     PathVar("simple_cdd_basedir", ["{simple_cdd_temp}", "debian-cd"],
@@ -27,7 +31,8 @@ VARIABLES = [
     TextVar("DI_CODENAME", "{CODENAME}",
             help="distribution name for debian-installer"),
     TextVar("DISKTYPE", "CD",
-            help="ISO image type ('CD' or 'DVD')"),
+            help="ISO image type ('CD', 'DVD', or another debian-cd disk type), or 'auto' to choose the smallest that fits"
+                 " the estimated image size"),
     TextVar("locale", cmdline="--locale",
             help="preselect this default locale for the distribution"),
     TextVar("keyboard", cmdline="--keyboard",
@@ -52,6 +57,10 @@ VARIABLES = [
             help="profiles only used while building the CD"),
     ListVar("mirror_tools", ["download", "reprepro"], cmdline="--mirror-tools",
             help="list the mirror tools to be used"),
+    BoolVar("mirror_tools_parallel", True,
+            help="when true, run the mirror tools that do not write to the same parts of the mirror at the same time"),
+    TextVar("mirror_jobs", "8",
+            help="number of files downloaded at the same time by the native mirror tool"),
     ListVar("build_tools", "debian-cd", cmdline="--build-tools",
             help="list the build tools to be used"),
     ListVar("auto_profiles", cmdline=["--auto-profiles", "-a"],
@@ -61,6 +70,9 @@ VARIABLES = [
     ListVar("simple_cdd_dirs",
             ["{simple_cdd_dir}", os.path.dirname(os.path.abspath(sys.argv[0])), "/usr/share/simple-cdd"],
             help="directories used to look for simple-cdd support scripts"),
+    PathVar("profile_index", ["{simple_cdd_temp}", "profiles.index"],
+            help="index of the profile files found in simple_cdd_dirs, for use by tools: one line per file,"
+                 " with profile name, extension and pathname separated by tabs"),
     TextVar("debian_mirror", "http://{server}/debian/", "--debian-mirror",
             help="official Debian mirror to use to get Debian packages"),
     TextVar("rsync_debian_mirror", "{server}::debian",
@@ -71,6 +83,16 @@ VARIABLES = [
             help="all the architectures that will be present in the built ISO"),
     TextVar("files_debian_mirror", "{debian_mirror}",
             help="Debian mirror base URL that will be used when downloading files"),
+    ListVar("debian_mirrors", "{debian_mirror}",
+            help="mirrors used interchangeably in place of debian_mirror by the download and native mirror tools"),
+    ListVar("security_mirrors", "{security_mirror}",
+            help="mirrors used interchangeably in place of security_mirror by the native mirror tool"),
+    ListVar("updates_mirrors", "{updates_mirror}",
+            help="mirrors used interchangeably in place of updates_mirror by the native mirror tool"),
+    ListVar("files_debian_mirrors", "{files_debian_mirror}",
+            help="mirrors used interchangeably in place of files_debian_mirror by the download mirror tool"),
+    TextVar("mirror_timeout", "60",
+            help="seconds without an answer after which a mirror download fails, and is retried on another mirror"),
     TextVar("simple_cdd_preseed", "preseed/file=/cdrom/simple-cdd/default.preseed",
             help="kernel command line parameter to enable simple-cdd debconf preseeding"),
     PathVar("TASK", ["{simple_cdd_temp}", "simple-cdd.task"],
@@ -84,6 +106,9 @@ VARIABLES = [
             help="name of checksum files to use to verify downloaded files"),
     BoolVar("ignore_missing_checksums", False,
             help="when true, don't fail when a file can't be found in a checksum file."),
+    BoolVar("trust_verified_files", False,
+            help="when true, downloaded files that were verified against their checksums are not hashed again"
+                 " until their size, modification time or inode change"),
     BoolVar("do_mirror", True,
             help="when true, build a local mirror"),
     TextVar("di_release", "current",
@@ -127,6 +152,14 @@ VARIABLES = [
             help="argument passed to the kernel to boot with a serial console"),
     TextVar("debian_cd_dir", "/usr/share/debian-cd",
             help="directory where debian-cd has its tools"),
+    TextVar("populate_method", "auto", cmdline="--populate-method",
+            help="how to populate build trees from the mirror and debian-cd:"
+                 " auto (reflink, then hardlink, then copy), reflink, hardlink or copy"),
+    TextVar("shared_store", cmdline="--shared-store",
+            help="if set, directory of a content-addressed store of downloaded files shared between projects:"
+                 " files are linked from it instead of being downloaded again"),
+    TextVar("mirror_lock_timeout",
+            help="seconds to wait for other builds using the same mirror to release it (default: wait forever)"),
     BoolVar("require_optional_packages", cmdline="--require-optional-packages",
             help="fail if missing optional packages (*.downloads)"),
     BoolVar("force_preseed", cmdline="--force-preseed",
@@ -140,6 +173,20 @@ VARIABLES = [
     BoolVar("clean_mirror",
             help="Remove unused packages from the local mirror"),
     BoolVar("vga_normal"),
+    ListVar("qemu_test_profiles", cmdline="--qemu-test-profiles",
+            help="profile combinations tested by --qemu-test, with the profiles of each combination joined by '+'"
+                 " (default: auto_profiles)"),
+    TextVar("qemu_test_jobs", "2",
+            help="number of qemu installations run in parallel by --qemu-test"),
+    TextVar("qemu_test_timeout", "3600",
+            help="seconds after which a qemu installation run by --qemu-test is considered failed"),
+    TextVar("qemu_test_opts", "-m 1024",
+            help="additional options passed to qemu by --qemu-test"),
+    TextVar("qemu_test_success_pattern", "reboot: Restarting system",
+            help="regular expression that must be found in the serial console log of a successful --qemu-test run;"
+                 " if empty, only the exit code of qemu is checked"),
+    TextVar("qemu_test_installer_dir",
+            help="directory in the image with the installer kernel and initrd booted by --qemu-test (default: guessed from ARCH)"),
     ListVar("default_profiles", help="profiles which default to being selected in profile selection menu at install time"),
     ListVar("all_extras", help="files included on the media in the /simple-cdd dir"),
     ListVar("all_packages"),
@@ -160,6 +207,13 @@ VARIABLES = [
             help="options added to all reprepro invocations"),
     TextVar("debian_cd_emulate_codename", help="if using non-official CODENAME, create links to emulate an existing codename"),
     TextVar("reprepro_retries", help="number of times reprepro attempts to download new dependencies"),
+    BoolVar("image_size_check",
+            help="estimate the image size from the package indices before building the mirror,"
+                 " and fail if it does not fit DISKTYPE"),
+    TextVar("dependency_solver", "reprepro",
+            help="how mirror/reprepro finds the dependencies of the packages to mirror:"
+                 " reprepro repeats reprepro update adding all alternatives and all providers of virtual packages,"
+                 " minimal chooses a single package for each of them from the package lists"),
     TextVar("BOOT_TIMEOUT"),
     TextVar("commandline_opts"),
     TextVar("check_not_requested"),
@@ -0,0 +1,261 @@
+from simple_cdd.exceptions import Fail
+import traceback
+import select
+import signal
+import struct
+import time
+import sys
+import os
+import logging
+
+log = logging.getLogger()
+
+# Kinds of changes, from the cheapest to rebuild to the most expensive:
+#  extras: files copied into the image: only the image is built again
+#  packages: package lists: the mirror is updated and the image built again
+#  config: configuration: everything is read again and rebuilt
+KINDS = ("extras", "packages", "config")
+
+# Kind of change of each profile file extension
+KIND_BY_EXTENSION = {
+    "conf": "config",
+    "packages": "packages",
+    "downloads": "packages",
+    "udebs": "packages",
+    "excludes": "packages",
+    "description": "extras",
+    "preseed": "extras",
+    "postinst": "extras",
+    "extra": "extras",
+}
+
+# Seconds without changes to wait for before rebuilding, so that a burst of
+# edits causes a single rebuild
+DEBOUNCE = 1.0
+
+# Seconds between scans of the watched directories when inotify is not
+# available
+POLL_INTERVAL = 1.0
+
+
+def strongest(kinds):
+    """
+    Return the most expensive of the given kinds of changes
+    """
+    return max(kinds, key=KINDS.index)
+
+
+class WatchSet:
+    """
+    The files that a build depends on, with the kind of change that editing
+    each of them causes
+    """
+    def __init__(self):
+        # Pathname: kind of change
+        self.files = {}
+        # Names of the profiles in use, to recognise their new files
+        self.profiles = set()
+        # Directories to watch, besides those of the files
+        self.extra_dirs = set()
+
+    def add_file(self, pathname, kind):
+        pathname = os.path.abspath(pathname)
+        old = self.files.get(pathname, None)
+        self.files[pathname] = kind if old is None else strongest((old, kind))
+
+    @property
+    def dirs(self):
+        return sorted({os.path.dirname(f) for f in self.files} | self.extra_dirs)
+
+    def classify(self, pathname):
+        """
+        Return the kind of change caused by a change to pathname, or None if
+        the build does not depend on it
+        """
+        kind = self.files.get(os.path.abspath(pathname), None)
+        if kind is not None:
+            return kind
+        # New files of the profiles in use
+        basename = os.path.basename(pathname)
+        for profile in self.profiles:
+            if not basename.startswith(profile + "."): continue
+            kind = KIND_BY_EXTENSION.get(basename[len(profile) + 1:], None)
+            if kind is not None:
+                return kind
+        return None
+
+
+class PollWatcher:
+    """
+    Detect changes by scanning directories at regular intervals
+    """
+    def __init__(self, dirs, interval=POLL_INTERVAL):
+        self.dirs = list(dirs)
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self):
+        res = {}
+        for d in self.dirs:
+            try:
+                entries = list(os.scandir(d))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                res[entry.path] = (st.st_mtime_ns, st.st_size, st.st_ino)
+        return res
+
+    def changes(self, timeout=None):
+        """
+        Return the pathnames changed since the last call, waiting for at most
+        timeout seconds, or until something changes if timeout is None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.scan()
+            changed = {path for path in state.keys() | self.state.keys()
+                       if state.get(path, None) != self.state.get(path, None)}
+            self.state = state
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return set()
+            time.sleep(min(self.interval, left))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Detect changes with inotify on the watched directories, so that files
+    replaced by editors are seen as well
+    """
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, dirs):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        # Watch descriptor: directory
+        self.wds = {}
+        for d in dirs:
+            wd = libc.inotify_add_watch(fd, os.fsencode(d), self.MASK)
+            if wd < 0:
+                log.debug("cannot watch %s: %s", d, os.strerror(ctypes.get_errno()))
+                continue
+            self.wds[wd] = d
+
+    def changes(self, timeout=None):
+        """
+        Return the pathnames changed since the last call, waiting for at most
+        timeout seconds, or until something changes if timeout is None
+        """
+        readable, unused1, unused2 = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        res = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if wd in self.wds and name:
+                    res.add(os.path.join(self.wds[wd], os.fsdecode(name)))
+        return res
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def make_watcher(dirs):
+    """
+    Return an InotifyWatcher on dirs, or a PollWatcher if inotify is not
+    available
+    """
+    try:
+        return InotifyWatcher(dirs)
+    except (OSError, AttributeError) as e:
+        log.info("inotify is not available (%s): polling for changes every %.0fs", e, POLL_INTERVAL)
+        return PollWatcher(dirs)
+
+
+def wait_for_changes(watcher, watch_set, debounce=DEBOUNCE):
+    """
+    Wait for changes to the files of watch_set, then until no more changes
+    happen for debounce seconds. Returns a dict mapping the changed pathnames
+    to their kind of change.
+    """
+    changed = {}
+    timeout = None
+    while True:
+        paths = watcher.changes(timeout)
+        if not paths and changed:
+            return changed
+        for path in paths:
+            kind = watch_set.classify(path)
+            if kind is None: continue
+            changed[path] = kind
+        if changed:
+            timeout = debounce
+
+
+def run_in_child(func):
+    """
+    Call func in a forked process, so that each build starts from a clean
+    state, and return its exit code
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = func()
+        except Fail as e:
+            log.error(*e.args)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code)
+    while True:
+        try:
+            unused, status = os.waitpid(pid, 0)
+            break
+        except InterruptedError:
+            continue
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return 1
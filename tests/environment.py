@@ -0,0 +1,16 @@
+"""
+Environments for tests, with the variables of simple-cdd
+"""
+from simple_cdd.env import Environment
+from simple_cdd.variables import VARIABLES
+
+
+def make_env(**values):
+    """
+    Return an Environment with the variables of simple-cdd set to the given
+    values, and to their defaults otherwise, ignoring the process environment
+    """
+    res = Environment(VARIABLES, environ={})
+    for name, value in values.items():
+        res.set(name, value)
+    return res
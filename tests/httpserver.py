@@ -0,0 +1,89 @@
+"""
+Local HTTP server standing in for a Debian mirror in tests
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+import hashlib
+import re
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if server.delay:
+            time.sleep(server.delay)
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+        if server.support_etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header and server.support_range:
+            mo = re.match(r"bytes=(\d+)-$", range_header)
+            start = int(mo.group(1))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            status = 206
+
+        body = data[start:]
+        if server.truncate_at is not None:
+            body = body[:server.truncate_at]
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data) - start))
+        if server.support_etag:
+            self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(data) - 1, len(data)))
+        self.end_headers()
+        # Count before writing: the client may be done before we return
+        server.bytes_sent += len(body)
+        self.wfile.write(body)
+
+
+class MirrorServer(ThreadingHTTPServer):
+    """
+    Serve files from a dict mapping URL paths to contents
+    """
+    daemon_threads = True
+
+    def __init__(self, files=None, support_range=True, support_etag=True):
+        super().__init__(("127.0.0.1", 0), MirrorHandler)
+        self.files = files if files is not None else {}
+        self.support_range = support_range
+        self.support_etag = support_etag
+        # If set, only send this many bytes of each response, to simulate an
+        # interrupted transfer
+        self.truncate_at = None
+        # Seconds to wait before answering each request, to simulate a slow
+        # mirror
+        self.delay = 0
+        self.requests = []
+        self.bytes_sent = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
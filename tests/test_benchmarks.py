@@ -0,0 +1,24 @@
+import unittest
+from benchmarks.hotpaths import BenchContext
+from benchmarks.__main__ import run_benchmarks, compare
+import tempfile
+import io
+import contextlib
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_smoke(self):
+        # Run all benchmarks on a tiny archive, to check that they still work
+        with tempfile.TemporaryDirectory() as workdir:
+            ctx = BenchContext(workdir, packages=50, file_size=4096)
+            results = run_benchmarks(ctx, repeat=1)
+        self.assertIn("parse_release_file", results)
+        self.assertIn("checkpackages", results)
+        for res in results.values():
+            self.assertGreaterEqual(res["min"], 0)
+
+    def test_compare(self):
+        baseline = {"a": {"min": 1.0}, "b": {"min": 1.0}}
+        results = {"a": {"min": 1.1}, "b": {"min": 2.0}, "c": {"min": 1.0}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(compare(results, baseline, 1.25), ["b"])
@@ -0,0 +1,108 @@
+import unittest
+from simple_cdd.tools.build_debian_cd import ToolBuildDebianCd
+from .environment import make_env
+import tempfile
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestBuildDebianCd(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.confdir = os.path.join(self.workdir.name, "conf")
+        os.makedirs(os.path.join(self.confdir, "profiles"))
+        self.temp = os.path.join(self.workdir.name, "tmp")
+        os.makedirs(self.temp)
+        self.env = make_env(
+            simple_cdd_dirs=[self.confdir, TOPDIR],
+            simple_cdd_temp=self.temp,
+            TASK=os.path.join(self.temp, "simple-cdd.task"),
+            includes=[],
+            all_packages=[],
+            exclude_files=[],
+            all_extras=[],
+            package_files=[],
+            preseed_files=[],
+            profiles=[],
+            build_profiles=[],
+            default_profiles=[],
+            commandline_opts="--profiles web",
+        )
+        self.tool = ToolBuildDebianCd(self.env)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def write_conf(self, relname, text):
+        pathname = os.path.join(self.confdir, relname)
+        with open(pathname, "wt") as fd:
+            fd.write(text)
+        return pathname
+
+    def read(self, pathname):
+        with open(pathname, "rt") as fd:
+            return fd.read()
+
+    def test_task(self):
+        self.env.set("includes", ["/usr/share/debian-cd/tasks/base", "/usr/share/debian-cd/tasks/base"])
+        self.env.set("all_packages", ["vim", "apache2", "vim"])
+        self.tool.write_task()
+        self.assertEqual(self.read(self.env.get("TASK")),
+                         "#include </usr/share/debian-cd/tasks/base>\napache2\nvim\n")
+
+    def test_exclude(self):
+        self.tool.write_exclude()
+        self.assertEqual(self.env.get("EXCLUDE"), [])
+
+        self.env.set("exclude_files", [
+            self.write_conf("profiles/a.excludes", "# comment\nfoo\nbar\n\n"),
+            self.write_conf("profiles/b.excludes", "foo\nbaz\n"),
+        ])
+        self.tool.write_exclude()
+        exclude = os.path.join(self.temp, "simple-cdd.excludes")
+        self.assertEqual(self.env.get("EXCLUDE"), [exclude])
+        self.assertEqual(self.read(exclude), "bar\nbaz\nfoo\n")
+
+    def test_extras(self):
+        self.write_conf("profiles/web.conf", "packages=apache2\n")
+        self.write_conf("profiles/web.description", "# comment\nWeb\nserver\n")
+        self.write_conf("profiles/base.description", "Base system\n")
+        preseed = self.write_conf("profiles/web.preseed", "d-i foo string bar\n")
+        self.write_conf("simple-cdd.templates",
+                        "Template: simple-cdd/profiles\nChoices: CHOICES\nDefault: DEFAULTS\nDescription: profiles\n")
+        self.env.set("profiles", ["base", "web"])
+        self.env.set("default_profiles", ["base", "web"])
+        self.env.set("preseed_files", [preseed, preseed])
+
+        # Stale files from a previous build are removed
+        stale = os.path.join(self.temp, "extras", "simple-cdd", "old.preseed")
+        os.makedirs(os.path.dirname(stale))
+        self.write_conf(stale, "")
+
+        self.tool.write_extras()
+
+        extras = os.path.join(self.temp, "extras", "simple-cdd")
+        self.assertEqual(sorted(os.listdir(extras)), [".build-info", "simple-cdd.templates", "web.preseed"])
+        self.assertEqual(sorted(os.listdir(os.path.join(extras, ".build-info"))), ["commandline", "web.conf"])
+        self.assertEqual(self.read(os.path.join(extras, ".build-info", "commandline")), "--profiles web\n")
+        self.assertEqual(self.read(os.path.join(extras, "simple-cdd.templates")),
+                         "Template: simple-cdd/profiles\nChoices: base, web\nDefault: base, web\n"
+                         "Description: profiles\n .\n base: Base system\n .\n web: Web server\n")
+
+    def test_profile_index(self):
+        # The index exported by build-simple-cdd is used, not a new scan
+        self.write_conf("profiles/web.conf", "")
+        exported = os.path.join(self.workdir.name, "elsewhere", "web.conf")
+        index = os.path.join(self.temp, "profiles.index")
+        with open(index, "wt") as fd:
+            print("web", "conf", exported, sep="\t", file=fd)
+        self.env.set("profile_index", index)
+        self.assertEqual(self.tool.find_profile_file("web", "conf"), exported)
+        self.assertIsNone(self.tool.find_profile_file("web", "preseed"))
+
+        # Without it, the tool finds the files itself
+        self.env.set("profile_index", os.path.join(self.temp, "missing.index"))
+        tool = ToolBuildDebianCd(self.env)
+        self.assertEqual(tool.find_profile_file("web", "conf"), os.path.join(self.confdir, "profiles", "web.conf"))
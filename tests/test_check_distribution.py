@@ -0,0 +1,70 @@
+import unittest
+from importlib.machinery import SourceFileLoader
+from importlib.util import spec_from_loader, module_from_spec
+from simple_cdd.instrument import BuildReport
+from .environment import make_env
+import tempfile
+import logging
+import gzip
+import sys
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script():
+    """
+    Import build-simple-cdd as a module
+    """
+    loader = SourceFileLoader("build_simple_cdd", os.path.join(TOPDIR, "build-simple-cdd"))
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+build_simple_cdd = load_script()
+
+
+class FakeSimpleCDD:
+    def __init__(self, env):
+        self.env = env
+        self.report = BuildReport()
+
+
+class TestCheckDistribution(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.bindir = os.path.join(self.workdir.name, "bin")
+        os.makedirs(self.bindir)
+        self.orig_path = os.environ["PATH"]
+        os.environ["PATH"] = self.bindir + os.pathsep + self.orig_path
+        self.env = make_env(ARCHES=["amd64"], TDIR=os.path.join(self.workdir.name, "debian-cd"), CODENAME="bookworm")
+        binary = os.path.join(self.env.get("TDIR"), "bookworm", "CD1", "dists", "bookworm", "main", "binary-amd64")
+        os.makedirs(binary)
+        with gzip.open(os.path.join(binary, "Packages.gz"), "wt") as fd:
+            fd.write("Package: hello\nVersion: 1.0\nArchitecture: amd64\nDepends: libmissing\n\n")
+
+    def tearDown(self):
+        os.environ["PATH"] = self.orig_path
+        self.workdir.cleanup()
+
+    def write_debcheck(self, exit_code):
+        pathname = os.path.join(self.bindir, "dose-debcheck")
+        with open(pathname, "wt") as fd:
+            fd.write("#!{}\nimport sys\nprint('hello unsatisfied: libmissing')\nprint('debcheck error', file=sys.stderr)\n"
+                     "sys.exit({})\n".format(sys.executable, exit_code))
+        os.chmod(pathname, 0o755)
+
+    def check(self):
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            build_simple_cdd.SimpleCDD.check_distribution(FakeSimpleCDD(self.env))
+        return [r.getMessage() for r in logs.records if r.levelno == logging.WARNING]
+
+    def test_failures(self):
+        self.write_debcheck(1)
+        self.assertEqual(self.check(), ["distcheck: hello unsatisfied: libmissing"])
+
+    def test_success(self):
+        self.write_debcheck(0)
+        self.assertEqual(self.check(), [])
@@ -0,0 +1,79 @@
+import unittest
+from simple_cdd.utils import Checksums
+from .environment import make_env
+import tempfile
+import os
+
+
+RELEASE = """Origin: Debian
+Codename: bookworm
+Components: main contrib
+MD5Sum:
+ d41d8cd98f00b204e9800998ecf8427e      120 main/binary-amd64/Packages
+ 0f343b0931126a20f133d67c2b018a3b       64 main/installer-amd64/current/images/SHA256SUMS
+ 5d41402abc4b2a76b9719d911017c592       32 main/installer-i386/current/images/SHA256SUMS
+SHA256:
+ e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855      120 main/binary-amd64/Packages
+ 2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae       64 main/installer-amd64/current/images/SHA256SUMS
+ fcde2b2edba56bf408601fb721fe9b5c338d10ee429ea04fae5511b68fbf8fb9       32 main/installer-i386/current/images/SHA256SUMS
+SHA512:
+ cf83e1357eefb8bdf1542850d66d8007d620e4050b5715dc83f4a921d36ce9ce      120 main/binary-amd64/Packages
+"""
+
+
+class TestChecksums(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.release = os.path.join(self.workdir.name, "Release")
+        with open(self.release, "wt") as fd:
+            fd.write(RELEASE)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_parse_release_file(self):
+        sums = Checksums(make_env())
+        sums.parse_release_file(self.release)
+        self.assertEqual(len(sums.by_relname), 3)
+        entry = sums.by_relname["main/installer-amd64/current/images/SHA256SUMS"]
+        self.assertEqual(entry.size, 64)
+        self.assertEqual(entry.get("MD5Sum"), "0f343b0931126a20f133d67c2b018a3b")
+        self.assertEqual(entry.get("SHA256"), "2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae")
+        # Unsupported checksum fields are ignored
+        self.assertIsNone(entry.get("SHA512"))
+        self.assertIsNone(sums.filter)
+
+    def test_parse_release_file_wanted(self):
+        sums = Checksums(make_env())
+        sums.parse_release_file(self.release, wanted={"main/installer-amd64/current/images/SHA256SUMS"})
+        self.assertEqual(list(sums.by_relname), ["main/installer-amd64/current/images/SHA256SUMS"])
+        self.assertEqual(sums.expected("main/installer-amd64/current/images/SHA256SUMS"), [
+            ["size", 64],
+            ["MD5Sum", "0f343b0931126a20f133d67c2b018a3b"],
+            ["SHA256", "2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae"],
+        ])
+        self.assertIsNone(sums.expected("main/binary-amd64/Packages"))
+
+    def test_parse_release_file_prefixes(self):
+        sums = Checksums(make_env())
+        sums.parse_release_file(self.release, prefixes=("main/installer-",))
+        self.assertEqual(sorted(sums.by_relname), [
+            "main/installer-amd64/current/images/SHA256SUMS",
+            "main/installer-i386/current/images/SHA256SUMS",
+        ])
+
+    def test_cache_filter(self):
+        wanted = {"main/installer-amd64/current/images/SHA256SUMS"}
+        sums = Checksums(make_env())
+        sums.parse_release_file(self.release, wanted=wanted)
+        cache = self.release + ".sums"
+        sums.save(cache)
+
+        loaded = Checksums(make_env())
+        self.assertTrue(loaded.load(cache, self.release, filter=sorted(wanted)))
+        self.assertEqual(loaded.expected("main/installer-amd64/current/images/SHA256SUMS"),
+                         sums.expected("main/installer-amd64/current/images/SHA256SUMS"))
+
+        # A cache filtered for a different set of files is not used
+        self.assertFalse(Checksums(make_env()).load(cache, self.release))
+        self.assertFalse(Checksums(make_env()).load(cache, self.release, filter=["main/installer-i386/current/images/SHA256SUMS"]))
@@ -0,0 +1,72 @@
+import unittest
+from simple_cdd.daemon import BuildServer, send_request
+from simple_cdd.exceptions import Fail
+import threading
+import tempfile
+import io
+import os
+import sys
+
+
+class TestBuildServer(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.workdir.name, "daemon.sock")
+        self.cache = {}
+        self.server = BuildServer(self.socket_path, self.build, caches={"test": self.cache})
+        self.server.bind()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.workdir.cleanup()
+
+    def build(self, argv):
+        """
+        Fake build, run in the forked process
+        """
+        print("building", " ".join(argv), "in", os.getcwd())
+        print("env", os.environ.get("SCDD_TEST"), file=sys.stderr)
+        # Builds see what previous builds added to the caches
+        print("cached", ",".join(sorted(self.cache)))
+        self.cache[argv[0]] = True
+        if argv[0] == "fail":
+            raise SystemExit(3)
+        return 0
+
+    def request(self, *argv):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        result = send_request(self.socket_path, argv, stdout=stdout, stderr=stderr)
+        return result, stdout.getvalue(), stderr.getvalue()
+
+    def test_request(self):
+        os.environ["SCDD_TEST"] = "value"
+        try:
+            result, out, err = self.request("first", "--verbose")
+        finally:
+            del os.environ["SCDD_TEST"]
+        self.assertEqual(result, 0)
+        self.assertIn("building first --verbose in {}".format(os.getcwd()), out)
+        self.assertIn("cached \n", out)
+        self.assertIn("env value", err)
+
+        result, out, err = self.request("fail")
+        self.assertEqual(result, 3)
+        self.assertIn("cached first\n", out)
+
+        result, out, err = self.request("third")
+        self.assertIn("cached fail,first\n", out)
+
+        # Cache entries have been merged back into the daemon
+        self.assertEqual(sorted(self.cache), ["fail", "first", "third"])
+
+    def test_no_daemon(self):
+        with self.assertRaises(Fail):
+            send_request(os.path.join(self.workdir.name, "missing.sock"), ["build"])
+
+    def test_already_running(self):
+        with self.assertRaises(Fail):
+            BuildServer(self.socket_path, self.build, caches={}).bind()
@@ -0,0 +1,181 @@
+import unittest
+from simple_cdd.download import Downloader
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import Checksums
+from .httpserver import MirrorServer
+from .environment import make_env
+import tempfile
+import hashlib
+import os
+
+
+class TestDownloader(unittest.TestCase):
+    DATA = bytes(range(256)) * 4096
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.workdir.name, "images", "netboot.tar.gz")
+        sumsfile = os.path.join(self.workdir.name, "SHA256SUMS")
+        with open(sumsfile, "wt") as fd:
+            print(hashlib.sha256(self.DATA).hexdigest(), "./netboot.tar.gz", file=fd)
+        self.sums = Checksums(make_env())
+        self.sums.parse_checksums_file(sumsfile, "SHA256")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_download(self):
+        with MirrorServer({"/netboot.tar.gz": self.DATA}) as server:
+            Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+            with open(self.output, "rb") as fd:
+                self.assertEqual(fd.read(), self.DATA)
+            self.assertFalse(os.path.exists(self.output + ".partial"))
+
+            # A valid file is not downloaded again
+            Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+            self.assertEqual(len(server.requests), 1)
+
+    def test_resume(self):
+        with MirrorServer({"/netboot.tar.gz": self.DATA}) as server:
+            # Interrupted transfer: the partial file is kept and the final
+            # name is never created
+            server.truncate_at = 100000
+            with self.assertRaises(Fail):
+                Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+            self.assertFalse(os.path.exists(self.output))
+            self.assertEqual(os.path.getsize(self.output + ".partial"), 100000)
+
+            # Resuming only transfers the missing bytes
+            server.truncate_at = None
+            server.bytes_sent = 0
+            Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+            self.assertEqual(server.requests[-1][1]["Range"], "bytes=100000-")
+            self.assertEqual(server.bytes_sent, len(self.DATA) - 100000)
+            with open(self.output, "rb") as fd:
+                self.assertEqual(fd.read(), self.DATA)
+
+    def test_resume_stale_partial(self):
+        # A partial file from an older version of the file is detected by the
+        # checksum, and the file is downloaded again from scratch
+        os.makedirs(os.path.dirname(self.output))
+        with open(self.output + ".partial", "wb") as fd:
+            fd.write(b"x" * 1000)
+        with MirrorServer({"/netboot.tar.gz": self.DATA}) as server:
+            Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+        with open(self.output, "rb") as fd:
+            self.assertEqual(fd.read(), self.DATA)
+
+    def test_no_range_support(self):
+        os.makedirs(os.path.dirname(self.output))
+        with open(self.output + ".partial", "wb") as fd:
+            fd.write(self.DATA[:1000])
+        with MirrorServer({"/netboot.tar.gz": self.DATA}, support_range=False) as server:
+            Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+        with open(self.output, "rb") as fd:
+            self.assertEqual(fd.read(), self.DATA)
+
+    def test_bad_checksum(self):
+        with MirrorServer({"/netboot.tar.gz": b"corrupted"}) as server:
+            with self.assertRaises(Fail):
+                Downloader().fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+        self.assertFalse(os.path.exists(self.output))
+        self.assertFalse(os.path.exists(self.output + ".partial"))
+
+    def test_concurrent(self):
+        # Downloads started at the same time create the same directories
+        import threading
+        source = os.path.join(self.workdir.name, "hello.deb")
+        with open(source, "wb") as fd:
+            fd.write(b"deb")
+        jobs = 8
+        barrier = threading.Barrier(jobs)
+        errors = []
+
+        def fetch(job):
+            for i in range(20):
+                output = os.path.join(self.workdir.name, "pool", str(i), "hello_{}.deb".format(job))
+                barrier.wait()
+                try:
+                    Downloader().fetch("file://" + source, output)
+                except Exception as e:
+                    errors.append(e)
+        threads = [threading.Thread(target=fetch, args=(job,)) for job in range(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(os.listdir(os.path.join(self.workdir.name, "pool", "19"))), jobs)
+
+    def test_revalidate(self):
+        release = os.path.join(self.workdir.name, "bookworm_Release")
+        state = os.path.join(self.workdir.name, "download-state.json")
+        with MirrorServer({"/Release": b"Codename: bookworm\n"}) as server:
+            downloader = Downloader(state=state)
+            self.assertTrue(downloader.fetch(server.url + "/Release", release, revalidate=True))
+            downloader.save_state()
+
+            # A new run sends a conditional request and keeps the file
+            downloader = Downloader(state=state)
+            self.assertFalse(downloader.fetch(server.url + "/Release", release, revalidate=True))
+            self.assertIn("If-None-Match", server.requests[-1][1])
+
+            # A changed file is downloaded again
+            server.files["/Release"] = b"Codename: trixie\n"
+            self.assertTrue(downloader.fetch(server.url + "/Release", release, revalidate=True))
+            with open(release, "rb") as fd:
+                self.assertEqual(fd.read(), b"Codename: trixie\n")
+
+            # Without validators from a previous download, the file is always
+            # downloaded
+            self.assertTrue(Downloader().fetch(server.url + "/Release", release, revalidate=True))
+
+    def test_verified_stamp(self):
+        state = os.path.join(self.workdir.name, "download-state.json")
+        with MirrorServer({"/netboot.tar.gz": self.DATA}) as server:
+            downloader = Downloader(state=state, trust_verified=True)
+            downloader.fetch(server.url + "/netboot.tar.gz", self.output, checksums=self.sums, relname="netboot.tar.gz")
+
+        class CountingChecksums(Checksums):
+            verified = 0
+            def verify_file(self, absname, relname):
+                self.verified += 1
+                return super().verify_file(absname, relname)
+        sums = CountingChecksums(make_env())
+        sums.by_relname = self.sums.by_relname
+
+        # An unchanged file that was already verified is not hashed again
+        self.assertFalse(downloader.fetch("http://127.0.0.1:1/unused", self.output, checksums=sums, relname="netboot.tar.gz"))
+        self.assertEqual(sums.verified, 0)
+
+        # A modified file is
+        with open(self.output, "ab") as fd:
+            fd.write(b"x")
+        with MirrorServer({"/netboot.tar.gz": self.DATA}) as server:
+            self.assertTrue(downloader.fetch(server.url + "/netboot.tar.gz", self.output, checksums=sums, relname="netboot.tar.gz"))
+        self.assertEqual(sums.verified, 2)
+
+        # By default, files are always hashed again
+        self.assertFalse(Downloader(state=state).fetch("http://127.0.0.1:1/unused", self.output, checksums=sums,
+                                                       relname="netboot.tar.gz"))
+        self.assertEqual(sums.verified, 3)
+
+
+class TestChecksumsCache(unittest.TestCase):
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            sumsfile = os.path.join(workdir, "SHA256SUMS")
+            with open(sumsfile, "wt") as fd:
+                print("0" * 64, "./netboot.tar.gz", file=fd)
+            sums = Checksums(make_env())
+            sums.parse_checksums_file(sumsfile, "SHA256")
+            cache = os.path.join(workdir, "SHA256SUMS.sums")
+            sums.save(cache)
+
+            loaded = Checksums(make_env())
+            self.assertTrue(loaded.load(cache, sumsfile))
+            self.assertEqual(loaded.expected("netboot.tar.gz"), sums.expected("netboot.tar.gz"))
+
+            # A cache older than its source is not used
+            os.utime(sumsfile, (os.path.getmtime(cache) + 10,) * 2)
+            self.assertFalse(Checksums(make_env()).load(cache, sumsfile))
@@ -82,3 +82,69 @@ class TestEnv(unittest.TestCase):
             e.read_config_file(fd.name)
         self.assertFalse(e.use_security_mirror)
 
+
+    def test_independent_environments(self):
+        VARIABLES = [
+            env.ListVar("profiles"),
+        ]
+        e1 = env.Environment(VARIABLES)
+        e2 = env.Environment(VARIABLES)
+        e1.set("profiles", ["a"])
+        e2.set("profiles", ["b"])
+        self.assertEqual(e1.get("profiles"), ["a"])
+        self.assertEqual(e2.get("profiles"), ["b"])
+
+    def test_snapshot(self):
+        import pickle
+        os.environ["HOME"] = "/home/test"
+        os.environ["profiles"] = "a"
+        VARIABLES = [
+            env.ListVar("profiles"),
+            env.PathVar("simple_cdd_dir", "/srv"),
+            env.PathVar("simple_cdd_temp", ["{simple_cdd_dir}", "tmp"]),
+            env.TextVar("ARCH", env.Backtick("echo", "amd64")),
+            env.TextVar("unset_me", "x"),
+        ]
+        e = env.Environment(VARIABLES)
+        e.append("profiles", "b")
+        e.set("extra", "value")
+        e.unset("unset_me")
+        self.assertEqual(e.get("ARCH"), "amd64")
+
+        snapshot = pickle.loads(pickle.dumps(e.snapshot()))
+        os.environ.clear()
+        r = env.Environment.from_snapshot(VARIABLES, snapshot)
+        self.assertEqual(r.get("profiles"), ["a", "b"])
+        self.assertEqual(r.get("HOME"), "/home/test")
+        self.assertEqual(r.get("extra"), "value")
+        self.assertEqual(r.get("unset_me"), "")
+        self.assertEqual(r.get("ARCH"), "amd64")
+        # Defaults are still computed from the current values
+        r.set("simple_cdd_dir", "/build")
+        self.assertEqual(r.get("simple_cdd_temp"), "/build/tmp")
+        # Only changes since the original environment are reported
+        changed = {name for name, val, changed in r.export_iter() if changed}
+        self.assertEqual(changed, {"profiles", "extra", "simple_cdd_dir", "simple_cdd_temp", "ARCH"})
+
+        # Computed Backtick defaults are restored without running them again
+        VARIABLES[3] = env.TextVar("ARCH", env.Backtick("false"))
+        r = env.Environment.from_snapshot(VARIABLES, snapshot)
+        self.assertEqual(r.get("ARCH"), "amd64")
+        self.assertIsNone(VARIABLES[3].default.cached_result)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            pathname = os.path.join(workdir, "env.json")
+            e.write_snapshot(pathname)
+            r = env.Environment.read_snapshot(VARIABLES, pathname)
+        self.assertEqual(r.get("profiles"), ["a", "b"])
+
+    def test_format(self):
+        VARIABLES = [
+            env.TextVar("CODENAME", "bookworm"),
+        ]
+        e = env.Environment(VARIABLES)
+        self.assertEqual(e.format("dists/{CODENAME}"), "dists/bookworm")
+        self.assertEqual(e.format("{CODENAME}/{a}", a="amd64"), "bookworm/amd64")
+        self.assertEqual(e.format("{0}/{CODENAME}", "x"), "x/bookworm")
+        with self.assertRaises(KeyError):
+            e.format("{missing}")
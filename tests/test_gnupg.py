@@ -0,0 +1,49 @@
+import unittest
+from simple_cdd.gnupg import Gnupg
+from .environment import make_env
+import tempfile
+import os
+
+
+class RecordingGnupg(Gnupg):
+    """
+    Gnupg that records imports instead of running gpg, and appends to the
+    keybox like gpg would
+    """
+    def __init__(self, env):
+        super().__init__(env)
+        self.imported = []
+
+    def import_keyring(self, keyring_file):
+        self.imported.append(keyring_file)
+        with open(os.path.join(self.env.get("GNUPGHOME"), "pubring.kbx"), "ab") as fd:
+            fd.write(b"key\n")
+
+
+class TestGnupg(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.gnupghome = os.path.join(self.workdir.name, "gpg")
+        self.keyring = os.path.join(self.workdir.name, "archive.gpg")
+        with open(self.keyring, "wb") as fd:
+            fd.write(b"keyring")
+        self.env = make_env(GNUPGHOME=self.gnupghome, keyring=self.keyring)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_import_stamp(self):
+        gpg = RecordingGnupg(self.env)
+        gpg.init_homedir()
+        self.assertEqual(gpg.imported, [self.keyring])
+
+        # Unchanged keyring and keybox: nothing is imported again
+        gpg = RecordingGnupg(self.env)
+        gpg.init_homedir()
+        self.assertEqual(gpg.imported, [])
+
+        # A reset keybox triggers a new import
+        os.unlink(os.path.join(self.gnupghome, "pubring.kbx"))
+        gpg = RecordingGnupg(self.env)
+        gpg.init_homedir()
+        self.assertEqual(gpg.imported, [self.keyring])
@@ -0,0 +1,67 @@
+import unittest
+from simple_cdd.instrument import BuildReport
+from simple_cdd.exceptions import Fail
+import subprocess
+import tempfile
+import json
+import os
+
+
+class TestBuildReport(unittest.TestCase):
+    def test_stages(self):
+        report = BuildReport()
+        with report.stage("build_mirror"):
+            with report.stage("mirror/reprepro"):
+                subprocess.check_call(["true"])
+        with self.assertRaises(Fail):
+            with report.stage("checkpackages"):
+                raise Fail("stopping due to missing packages")
+
+        self.assertEqual([s.name for s in report.stages], ["build_mirror", "mirror/reprepro", "checkpackages"])
+        mirror, reprepro, check = report.stages
+        self.assertIsNone(mirror.parent)
+        self.assertEqual(reprepro.parent, "build_mirror")
+        self.assertEqual(reprepro.depth, 1)
+        self.assertGreaterEqual(mirror.wall, reprepro.wall)
+        self.assertEqual(reprepro.result, "ok")
+        self.assertEqual(check.result, "failed")
+
+    def test_write(self):
+        report = BuildReport()
+        with report.stage("setup_run"):
+            pass
+        with tempfile.TemporaryDirectory() as workdir:
+            pathname = os.path.join(workdir, "log", "build-report.json")
+            report.write(pathname, result="success")
+            with open(pathname) as fd:
+                data = json.load(fd)
+        self.assertEqual(data["result"], "success")
+        self.assertEqual(data["stages"][0]["name"], "setup_run")
+        for field in ("wall", "children_cpu_user", "read_bytes", "write_bytes"):
+            self.assertIn(field, data["stages"][0])
+        # Peak memory usage is only known for the whole build
+        self.assertNotIn("max_rss", data["stages"][0])
+        self.assertGreater(data["max_rss"], 0)
+
+    def test_concurrent(self):
+        from simple_cdd.scheduler import StageScheduler
+        import time
+        report = BuildReport()
+
+        def tool(name):
+            with report.stage(name):
+                time.sleep(0.1)
+        with report.stage("build_mirror"):
+            scheduler = StageScheduler(2)
+            scheduler.add("mirror/reprepro", lambda: tool("mirror/reprepro"), outputs=["mirror:archive"])
+            scheduler.add("mirror/download", lambda: tool("mirror/download"), outputs=["mirror:installer"])
+            scheduler.run()
+        with report.stage("build_distribution"):
+            pass
+        stages = {s["name"]: s for s in report.to_dict()["stages"]}
+        self.assertEqual(stages["mirror/download"]["parent"], "build_mirror")
+        # The usage of stages run at the same time includes each other's
+        self.assertTrue(stages["mirror/reprepro"]["concurrent"])
+        self.assertTrue(stages["mirror/download"]["concurrent"])
+        self.assertFalse(stages["build_mirror"]["concurrent"])
+        self.assertFalse(stages["build_distribution"]["concurrent"])
@@ -0,0 +1,69 @@
+import unittest
+from simple_cdd.lock import FileLock, LockManager, locked
+from simple_cdd.exceptions import Fail
+import tempfile
+import os
+
+
+class TestLock(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.pathname = os.path.join(self.workdir.name, "mirror", ".simple-cdd.lock")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def can_lock(self, shared):
+        """
+        Check if another process could take the lock in the given mode
+        """
+        try:
+            with FileLock(self.pathname, shared=shared, timeout=0):
+                return True
+        except Fail:
+            return False
+
+    def test_file_lock(self):
+        # Shared locks can be held together
+        with FileLock(self.pathname, shared=True):
+            self.assertTrue(self.can_lock(True))
+            # An exclusive lock cannot be taken while a shared one is held
+            self.assertFalse(self.can_lock(False))
+        self.assertTrue(self.can_lock(False))
+
+    def test_lock_manager(self):
+        manager = LockManager(self.pathname)
+        with manager.shared():
+            self.assertTrue(self.can_lock(True))
+            self.assertFalse(self.can_lock(False))
+            # An exclusive section converts the lock
+            with manager.exclusive():
+                self.assertFalse(self.can_lock(True))
+                # A nested shared section keeps it exclusive
+                with manager.shared():
+                    self.assertFalse(self.can_lock(True))
+            # Back to shared
+            self.assertTrue(self.can_lock(True))
+        self.assertTrue(self.can_lock(False))
+        self.assertIsNone(manager.lock)
+
+    def test_locked(self):
+        test = self
+
+        class Builder:
+            def __init__(self):
+                self.mirror_lock = LockManager(test.pathname)
+
+            @locked("mirror_lock")
+            def build_mirror(self):
+                test.assertFalse(test.can_lock(True))
+
+            @locked("mirror_lock", shared=True)
+            def build_distribution(self):
+                test.assertTrue(test.can_lock(True))
+                test.assertFalse(test.can_lock(False))
+
+        builder = Builder()
+        builder.build_mirror()
+        builder.build_distribution()
+        self.assertTrue(self.can_lock(False))
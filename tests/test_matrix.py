@@ -0,0 +1,75 @@
+import unittest
+from simple_cdd.matrix import read_matrix_file, union_values, check_shared_mirror, run_forked, format_table
+from simple_cdd.exceptions import Fail
+from .environment import make_env
+import tempfile
+import os
+
+
+class TestMatrix(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def write(self, name, text):
+        pathname = os.path.join(self.workdir.name, name)
+        with open(pathname, "wt") as fd:
+            fd.write(text)
+        return pathname
+
+    def test_read_matrix_file(self):
+        pathname = self.write("matrix.ini", "[DEFAULT]\nDISKTYPE = CD\n"
+                                            "[minimal]\nprofiles = base\n"
+                                            "[desktop]\nprofiles = base,desktop\nDISKTYPE = DVD\nKERNEL_PARAMS = quiet %s\n")
+        self.assertEqual(read_matrix_file(pathname), [
+            ("minimal", {"DISKTYPE": "CD", "profiles": "base"}),
+            ("desktop", {"DISKTYPE": "DVD", "profiles": "base,desktop", "KERNEL_PARAMS": "quiet %s"}),
+        ])
+
+        with self.assertRaises(Fail):
+            read_matrix_file(self.write("empty.ini", ""))
+        with self.assertRaises(Fail):
+            read_matrix_file(self.write("bad.ini", "[../escape]\nprofiles = base\n"))
+        with self.assertRaises(Fail):
+            read_matrix_file(os.path.join(self.workdir.name, "missing.ini"))
+
+    def test_union(self):
+        self.assertEqual(union_values([["a", "b"], ["b", "c"], []]), ["a", "b", "c"])
+
+        base = make_env(ARCHES=["amd64"], CODENAME="bookworm")
+        check_shared_mirror(base, [("a", make_env(ARCHES=["amd64"], CODENAME="bookworm", profiles=["x"]))])
+        with self.assertRaises(Fail):
+            check_shared_mirror(base, [("a", make_env(ARCHES=["arm64"], CODENAME="bookworm"))])
+
+    def test_run_forked(self):
+        iso = self.write("built.iso", "x" * 2048)
+
+        def fail():
+            raise Fail("no %s", "luck")
+
+        def crash():
+            os._exit(3)
+
+        # Tasks modify the memory of their own process only
+        state = []
+        def build():
+            state.append(1)
+            return iso
+
+        results = run_forked([("one", build), ("two", fail), ("three", crash), ("four", build)], jobs=2)
+        self.assertEqual(state, [])
+        self.assertEqual([r.name for r in results], ["one", "two", "three", "four"])
+        self.assertEqual([r.status for r in results], ["built", "failed", "failed", "built"])
+        self.assertEqual(results[0].isoname, iso)
+        self.assertEqual(results[0].size, 2048)
+        self.assertEqual(results[1].error, "no luck")
+        self.assertEqual(results[2].error, "exited with code 3")
+
+        lines = format_table(results)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith("variant  status  size    time  image"))
+        self.assertIn("built   2.0KiB", lines[1])
+        self.assertTrue(lines[1].endswith(iso))
+        self.assertTrue(lines[2].endswith("no luck"))
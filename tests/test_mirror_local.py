@@ -0,0 +1,71 @@
+import unittest
+from simple_cdd.tools.mirror_local import ToolMirrorLocal
+from .environment import make_env
+import tempfile
+import hashlib
+import os
+
+
+class RecordingMirrorLocal(ToolMirrorLocal):
+    """
+    ToolMirrorLocal with a fake reprepro database
+    """
+    def __init__(self, env, indexed):
+        super().__init__(env)
+        self.indexed = indexed
+        self.calls = []
+
+    def list_indexed(self, codename, reprepro_env):
+        return self.indexed.get(codename, {})
+
+    def reprepro(self, description, args, reprepro_env, check=True):
+        self.calls.append(args)
+
+
+class TestMirrorLocal(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.files = {}
+        for name in ("new_1.0_all.deb", "same_1.0_all.deb", "rebuilt_1.0_all.deb", "new-udeb_1.0_amd64.udeb", "README"):
+            pathname = os.path.join(self.workdir.name, name)
+            with open(pathname, "wb") as fd:
+                fd.write(name.encode())
+            self.files[name] = pathname
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def sha256(self, name):
+        return hashlib.sha256(name.encode()).hexdigest()
+
+    def test_include(self):
+        env = make_env(local_packages=[self.workdir.name], CODENAME="bookworm", DI_CODENAME="bookworm", reprepro_opts=[])
+        tool = RecordingMirrorLocal(env, {
+            "bookworm": {
+                ("deb", "same_1.0_all.deb"): ("same", self.sha256("same_1.0_all.deb")),
+                ("deb", "rebuilt_1.0_all.deb"): ("rebuilt", self.sha256("old contents")),
+            }
+        })
+        tool.include({})
+
+        self.assertCountEqual(tool.added, [self.files["new_1.0_all.deb"], self.files["new-udeb_1.0_amd64.udeb"]])
+        self.assertEqual(tool.replaced, [self.files["rebuilt_1.0_all.deb"]])
+        self.assertEqual(tool.skipped, [self.files["same_1.0_all.deb"]])
+
+        # One removal for the rebuilt package, then one batched include per
+        # package type
+        self.assertEqual(tool.calls[0], ["-T", "deb", "remove", "bookworm", "rebuilt"])
+        self.assertEqual(tool.calls[1][:3], ["--ignore=wrongdistribution", "includedeb", "bookworm"])
+        self.assertCountEqual(tool.calls[1][3:], [self.files["new_1.0_all.deb"], self.files["rebuilt_1.0_all.deb"]])
+        self.assertEqual(tool.calls[2], ["--ignore=wrongdistribution", "includeudeb", "bookworm", self.files["new-udeb_1.0_amd64.udeb"]])
+        self.assertEqual(len(tool.calls), 3)
+
+    def test_di_codename(self):
+        # udebs also go in DI_CODENAME when it differs from CODENAME
+        env = make_env(local_packages=[self.files["new-udeb_1.0_amd64.udeb"]], CODENAME="trixie", DI_CODENAME="bookworm", reprepro_opts=[])
+        tool = RecordingMirrorLocal(env, {})
+        tool.include({})
+        self.assertEqual(tool.calls, [
+            ["--ignore=wrongdistribution", "includeudeb", "trixie", self.files["new-udeb_1.0_amd64.udeb"]],
+            ["--ignore=wrongdistribution", "includeudeb", "bookworm", self.files["new-udeb_1.0_amd64.udeb"]],
+        ])
@@ -0,0 +1,254 @@
+import unittest
+from simple_cdd.tools.mirror_native import ToolMirrorNative, copy_paragraphs
+from simple_cdd.pdiff import DiffIndex, apply_ed_patch
+from simple_cdd.pkgset import PackageSet
+from .httpserver import MirrorServer
+from .environment import make_env
+import tempfile
+import hashlib
+import lzma
+import gzip
+import io
+import os
+
+
+def package(name, version, filename, priority="optional", depends=None, data=b""):
+    lines = [
+        "Package: " + name,
+        "Version: " + version,
+        "Architecture: amd64",
+        "Priority: " + priority,
+    ]
+    if depends:
+        lines.append("Depends: " + depends)
+    lines += [
+        "Filename: " + filename,
+        "Size: {}".format(len(data)),
+        "SHA256: " + hashlib.sha256(data).hexdigest(),
+        "Description: package " + name,
+        " .",
+        " with a long description",
+    ]
+    return "\n".join(lines) + "\n\n"
+
+
+class Archive:
+    """
+    Files of a fake upstream archive, as served by MirrorServer
+    """
+    def __init__(self):
+        self.files = {}
+        # suite: {relname: contents} of the files listed in its Release
+        self.suites = {}
+
+    def add_pool(self, name, version, suite="bookworm", root="/debian/", priority="optional", depends=None):
+        filename = "pool/main/{}/{}/{}_{}_amd64.deb".format(name[0], name, name, version)
+        data = "{} {} from {}".format(name, version, suite).encode("utf-8")
+        self.files[root + filename] = data
+        return package(name, version, filename, priority=priority, depends=depends, data=data)
+
+    def add_index(self, suite, relname, text, root="/debian/"):
+        data = lzma.compress(text.encode("utf-8"))
+        entries = self.suites.setdefault((root, suite), {})
+        entries[relname] = text.encode("utf-8")
+        entries[relname + ".xz"] = data
+        base = "{}dists/{}/".format(root, suite)
+        self.files[base + relname + ".xz"] = data
+        self.files[base + os.path.dirname(relname) + "/by-hash/SHA256/" + hashlib.sha256(data).hexdigest()] = data
+
+    def add_file(self, suite, relname, data, root="/debian/"):
+        self.suites.setdefault((root, suite), {})[relname] = data
+        self.files["{}dists/{}/{}".format(root, suite, relname)] = data
+
+    def publish(self, by_hash):
+        for (root, suite), entries in self.suites.items():
+            lines = ["Codename: " + suite, "Acquire-By-Hash: " + ("yes" if by_hash else "no"), "SHA256:"]
+            for relname, data in sorted(entries.items()):
+                lines.append(" {} {} {}".format(hashlib.sha256(data).hexdigest(), len(data), relname))
+            release = "{}dists/{}/Release".format(root, suite)
+            self.files[release] = ("\n".join(lines) + "\n").encode("utf-8")
+            self.files[release + ".gpg"] = b"signature"
+
+
+class Gnupg:
+    def verify_detached_sig(self, pathname, sigpathname):
+        pass
+
+
+class TestMirrorNative(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.mirror = os.path.join(self.workdir.name, "mirror")
+        self.archive = Archive()
+        self.packages = (
+            self.archive.add_pool("base-files", "12", priority="required") +
+            self.archive.add_pool("app", "1.0", depends="lib | lib-alt") +
+            self.archive.add_pool("lib", "1.0") +
+            self.archive.add_pool("lib-alt", "1.0") +
+            self.archive.add_pool("unused", "1.0"))
+        self.archive.add_index("bookworm", "main/binary-amd64/Packages", self.packages)
+        udebs = self.archive.add_pool("anna", "1.0")
+        self.archive.add_index("bookworm", "main/debian-installer/binary-amd64/Packages", udebs)
+        security = self.archive.add_pool("app", "1.1", suite="bookworm-security", root="/security/",
+                                         depends="lib | lib-alt")
+        self.archive.add_index("bookworm-security", "main/binary-amd64/Packages", security, root="/security/")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def make_tool(self, server, **kw):
+        values = dict(
+            simple_cdd_temp=os.path.join(self.workdir.name, "tmp"),
+            MIRROR=self.mirror,
+            CODENAME="bookworm",
+            DI_CODENAME="bookworm",
+            SUITE="stable",
+            ARCHES=["amd64"],
+            mirror_components=["main"],
+            all_packages=["app"],
+            debian_mirror=server.url + "/debian/",
+            security_mirror=server.url + "/security/",
+            dependency_solver="minimal",
+            mirror_jobs="4",
+            NORECOMMENDS="1",
+        )
+        values.update(kw)
+        env = make_env(**values)
+        tool = ToolMirrorNative(env)
+        tool.gnupg = Gnupg()
+        return tool
+
+    def read(self, relname):
+        with open(os.path.join(self.mirror, relname), "rt") as fd:
+            return fd.read()
+
+    def test_mirror(self):
+        self.archive.publish(by_hash=True)
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server).run()
+            fetched = [path for path, headers in server.requests]
+        self.assertIn("/debian/dists/bookworm/InRelease", fetched)
+        self.assertTrue([path for path in fetched if "/main/binary-amd64/by-hash/SHA256/" in path])
+        self.assertNotIn("/debian/dists/bookworm/main/binary-amd64/Packages.xz", fetched)
+
+        packages = self.read("dists/bookworm/main/binary-amd64/Packages")
+        self.assertIn("Package: base-files\n", packages)
+        self.assertIn("Package: lib\n", packages)
+        self.assertNotIn("Package: lib-alt\n", packages)
+        self.assertNotIn("Package: unused\n", packages)
+        # The newest version wins, with its whole paragraph
+        self.assertIn("Version: 1.1\n", packages)
+        self.assertNotIn("Version: 1.0\nArchitecture: amd64\nPriority: optional\nDepends", packages)
+        self.assertIn(" with a long description\n", packages)
+        with gzip.open(os.path.join(self.mirror, "dists/bookworm/main/binary-amd64/Packages.gz"), "rt") as fd:
+            self.assertEqual(fd.read(), packages)
+        self.assertIn("Package: anna\n", self.read("dists/bookworm/main/debian-installer/binary-amd64/Packages"))
+        release = self.read("dists/bookworm/Release")
+        self.assertIn("Codename: bookworm\n", release)
+        self.assertIn(" main/binary-amd64/Packages.gz\n", release)
+
+        self.assertEqual(self.read("pool/main/a/app/app_1.1_amd64.deb"), "app 1.1 from bookworm-security")
+        self.assertTrue(os.path.exists(os.path.join(self.mirror, "pool/main/a/anna/anna_1.0_amd64.deb")))
+        self.assertFalse(os.path.exists(os.path.join(self.mirror, "pool/main/a/app/app_1.0_amd64.deb")))
+        self.assertFalse(os.path.exists(os.path.join(self.mirror, "pool/main/u/unused/unused_1.0_amd64.deb")))
+
+    def test_failover(self):
+        self.archive.publish(by_hash=True)
+        with MirrorServer(self.archive.files) as broken, MirrorServer(self.archive.files) as server:
+            broken.truncate_at = 10
+            tool = self.make_tool(server, security_mirror="")
+            tool.env.set("debian_mirrors", [broken.url + "/debian/", server.url + "/debian/"])
+            tool.run()
+        self.assertEqual(self.read("pool/main/a/app/app_1.0_amd64.deb"), "app 1.0 from bookworm")
+        self.assertIn("Package: app\n", self.read("dists/bookworm/main/binary-amd64/Packages"))
+
+    def test_package_set_diff(self):
+        logs = os.path.join(self.workdir.name, "log")
+        os.makedirs(logs)
+        self.archive.publish(by_hash=False)
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server, security_mirror="", simple_cdd_logs=logs).run()
+        # What the build records after a successful build
+        PackageSet.from_mirror(self.mirror).write(os.path.join(logs, "packages.list"))
+        # A file that is not part of any package set
+        unknown = os.path.join(self.mirror, "pool/main/l/lib/unknown.deb")
+        with open(unknown, "wb"):
+            pass
+
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server, simple_cdd_logs=logs, clean_mirror=True).run()
+            fetched = [path for path, headers in server.requests]
+        # Only the upgraded package is fetched, and the old version is pruned
+        self.assertEqual([path for path in fetched if "/pool/" in path],
+                         ["/security/pool/main/a/app/app_1.1_amd64.deb"])
+        self.assertEqual(self.read("pool/main/a/app/app_1.1_amd64.deb"), "app 1.1 from bookworm-security")
+        self.assertFalse(os.path.exists(os.path.join(self.mirror, "pool/main/a/app/app_1.0_amd64.deb")))
+        self.assertTrue(os.path.exists(os.path.join(self.mirror, "pool/main/l/lib/lib_1.0_amd64.deb")))
+        self.assertTrue(os.path.exists(unknown))
+
+    def test_all_alternatives(self):
+        self.archive.publish(by_hash=False)
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server, dependency_solver="reprepro", security_mirror="").run()
+        packages = self.read("dists/bookworm/main/binary-amd64/Packages")
+        self.assertIn("Package: lib-alt\n", packages)
+        self.assertIn("Version: 1.0\n", packages)
+
+    def test_pdiff(self):
+        self.archive.publish(by_hash=False)
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server, security_mirror="").run()
+
+        # The archive gains a package, published as a pdiff
+        old = self.packages.encode("utf-8")
+        new_pkg = self.archive.add_pool("newpkg", "1.0", priority="important")
+        new = (self.packages + new_pkg).encode("utf-8")
+        lines = old.decode("utf-8").count("\n")
+        patch = "{}a\n{}.\n".format(lines, new_pkg).encode("utf-8")
+        patch_gz = gzip.compress(patch)
+        index = (
+            "SHA256-Current: {} {}\n"
+            "SHA256-History:\n {} {} T-1\n"
+            "SHA256-Patches:\n {} {} T-1\n"
+            "SHA256-Download:\n {} {} T-1.gz\n"
+            "X-Patch-Precedence: merged\n"
+        ).format(hashlib.sha256(new).hexdigest(), len(new),
+                 hashlib.sha256(old).hexdigest(), len(old),
+                 hashlib.sha256(patch).hexdigest(), len(patch),
+                 hashlib.sha256(patch_gz).hexdigest(), len(patch_gz))
+        self.archive.add_index("bookworm", "main/binary-amd64/Packages", new.decode("utf-8"))
+        self.archive.add_file("bookworm", "main/binary-amd64/Packages.diff/Index", index.encode("utf-8"))
+        self.archive.files["/debian/dists/bookworm/main/binary-amd64/Packages.diff/T-1.gz"] = patch_gz
+        self.archive.publish(by_hash=False)
+
+        with MirrorServer(self.archive.files) as server:
+            self.make_tool(server, security_mirror="").run()
+            fetched = [path for path, headers in server.requests]
+        self.assertIn("/debian/dists/bookworm/main/binary-amd64/Packages.diff/T-1.gz", fetched)
+        self.assertNotIn("/debian/dists/bookworm/main/binary-amd64/Packages.xz", fetched)
+        self.assertIn("Package: newpkg\n", self.read("dists/bookworm/main/binary-amd64/Packages"))
+        self.assertTrue(os.path.exists(os.path.join(self.mirror, "pool/main/n/newpkg/newpkg_1.0_amd64.deb")))
+
+
+class TestPdiff(unittest.TestCase):
+    def test_apply(self):
+        lines = ["a\n", "b\n", "c\n", "d\n"]
+        apply_ed_patch(lines, ["4a\n", "e\n", ".\n", "2,3c\n", "B\n", ".\n", "1d\n", "w\n"])
+        self.assertEqual(lines, ["B\n", "d\n", "e\n"])
+
+    def test_patches_from(self):
+        index = DiffIndex()
+        index.history = [("h1", 1, "T-1"), ("h2", 2, "T-2")]
+        self.assertEqual(index.patches_from("h1"), ["T-1", "T-2"])
+        self.assertIsNone(index.patches_from("h0"))
+        index.merged = True
+        self.assertEqual(index.patches_from("h1"), ["T-1"])
+
+    def test_copy_paragraphs(self):
+        text = package("a", "1", "pool/a.deb") + package("b", "1", "pool/b.deb")
+        with tempfile.NamedTemporaryFile("wt") as fd:
+            fd.write(text.rstrip("\n"))
+            fd.flush()
+            out = io.StringIO()
+            self.assertEqual(copy_paragraphs(fd.name, lambda name, version: name == "b", out), 1)
+        self.assertEqual(out.getvalue(), package("b", "1", "pool/b.deb"))
@@ -0,0 +1,55 @@
+import unittest
+from simple_cdd.tools.mirror_reprepro import ToolMirrorReprepro
+from .environment import make_env
+import tempfile
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PACKAGES = """\
+Package: hello
+Version: 2.10
+Priority: optional
+Depends: libc6
+
+Package: libc6
+Version: 2.36
+Priority: required
+
+Package: bash-completion
+Version: 2.11
+Priority: standard
+Depends: libcompletion
+
+Package: libcompletion
+Version: 1.0
+Priority: optional
+
+Package: unused
+Version: 1.0
+Priority: optional
+"""
+
+
+class TestMirrorReprepro(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.mirror = os.path.join(self.workdir.name, "mirror")
+        os.makedirs(os.path.join(self.mirror, "lists"))
+        with open(os.path.join(self.mirror, "lists", "debian_bookworm_main_amd64_Packages"), "wt") as fd:
+            fd.write(PACKAGES)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_solve_dependencies(self):
+        env = make_env(MIRROR=self.mirror, CODENAME="bookworm", ARCHES=["amd64"], mirror_components=["main"],
+                       all_packages=["hello"], simple_cdd_dirs=[TOPDIR], NORECOMMENDS="1")
+        pkglist = os.path.join(self.workdir.name, "package-list")
+        ToolMirrorReprepro(env).solve_dependencies(pkglist)
+        with open(pkglist, "rt") as fd:
+            selected = [line.split()[0] for line in fd]
+        # The dependencies of base packages are mirrored even if nothing
+        # requested needs them
+        self.assertEqual(selected, ["bash-completion", "hello", "libc6", "libcompletion"])
@@ -0,0 +1,103 @@
+import unittest
+from simple_cdd.mirrors import MirrorPool
+from simple_cdd.download import Downloader, NotFound
+from simple_cdd.exceptions import Fail
+from simple_cdd.utils import Checksums
+from .httpserver import MirrorServer
+from .environment import make_env
+import tempfile
+import hashlib
+import os
+
+
+class TestMirrorPool(unittest.TestCase):
+    DATA = bytes(range(256)) * 1024
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.files = {"/debian/dists/sid/Release": b"Codename: sid\n"}
+        sumsfile = os.path.join(self.workdir.name, "SHA256SUMS")
+        with open(sumsfile, "wt") as fd:
+            for idx in range(6):
+                self.files["/debian/file{}".format(idx)] = self.DATA
+                print(hashlib.sha256(self.DATA).hexdigest(), "file{}".format(idx), file=fd)
+        self.sums = Checksums(make_env())
+        self.sums.parse_checksums_file(sumsfile, "SHA256")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def fetch(self, pool, name):
+        output = os.path.join(self.workdir.name, "out", name)
+        pool.fetch(Downloader(timeout=pool.timeout), name, output, checksums=self.sums, relname=name)
+        with open(output, "rb") as fd:
+            self.assertEqual(fd.read(), self.DATA)
+
+    def test_ranking(self):
+        with MirrorServer(self.files) as slow, MirrorServer(self.files) as fast:
+            slow.delay = 0.3
+            pool = MirrorPool([slow.url + "/debian", fast.url + "/debian/"], timeout=5)
+            pool.probe("dists/sid/Release")
+            self.assertEqual(pool.ranked()[0].url, fast.url + "/debian/")
+            # The slow mirror is too slow to share the downloads
+            del slow.requests[:]
+            for idx in range(4):
+                self.fetch(pool, "file{}".format(idx))
+            self.assertEqual(slow.requests, [])
+
+    def test_spread(self):
+        with MirrorServer(self.files) as first, MirrorServer(self.files) as second:
+            pool = MirrorPool([first.url + "/debian/", second.url + "/debian/"])
+            for idx in range(4):
+                self.fetch(pool, "file{}".format(idx))
+            self.assertEqual(len(first.requests), 2)
+            self.assertEqual(len(second.requests), 2)
+
+    def test_failover(self):
+        with MirrorServer(self.files) as broken, MirrorServer(self.files) as good:
+            broken.truncate_at = 1000
+            pool = MirrorPool([broken.url + "/debian/", good.url + "/debian/"])
+            for idx in range(5):
+                self.fetch(pool, "file{}".format(idx))
+            self.assertFalse(pool.mirrors[0].healthy)
+            self.assertTrue(pool.mirrors[1].healthy)
+            # Once unhealthy, the broken mirror is only a last resort
+            del broken.requests[:]
+            self.fetch(pool, "file5")
+            self.assertEqual(broken.requests, [])
+
+    def test_timeout(self):
+        with MirrorServer(self.files) as stalled, MirrorServer(self.files) as good:
+            stalled.delay = 2
+            pool = MirrorPool([stalled.url + "/debian/", good.url + "/debian/"], timeout=0.5)
+            # Without probing, the first mirror is tried first
+            self.fetch(pool, "file0")
+            self.assertEqual(pool.mirrors[0].failures, 1)
+
+    def test_not_found(self):
+        with MirrorServer(self.files) as first, MirrorServer(self.files) as second:
+            pool = MirrorPool([first.url + "/debian/", second.url + "/debian/"])
+            with self.assertRaises(NotFound):
+                self.fetch(pool, "missing")
+            # A missing file is not the fault of the mirrors
+            self.assertTrue(all(m.failures == 0 for m in pool.mirrors))
+
+    def test_all_fail(self):
+        with MirrorServer(self.files) as first, MirrorServer(self.files) as second:
+            first.truncate_at = second.truncate_at = 1000
+            pool = MirrorPool([first.url + "/debian/", second.url + "/debian/"])
+            with self.assertRaises(Fail) as cm:
+                self.fetch(pool, "file0")
+            self.assertIn("any of 2 mirrors", str(cm.exception))
+
+    def test_revalidate(self):
+        with MirrorServer(self.files) as first, MirrorServer(self.files) as second:
+            pool = MirrorPool([first.url + "/debian/", second.url + "/debian/"])
+            downloader = Downloader()
+            release = os.path.join(self.workdir.name, "Release")
+            self.assertTrue(pool.fetch(downloader, "dists/sid/Release", release, revalidate=True))
+            self.assertEqual(len(first.requests), 1)
+            # A copy downloaded from another mirror is revalidated too
+            self.assertFalse(pool.fetch(downloader, "dists/sid/Release", release, revalidate=True))
+            self.assertEqual(len(second.requests), 1)
+            self.assertIn("If-None-Match", second.requests[0][1])
@@ -0,0 +1,76 @@
+import unittest
+from simple_cdd.pkgset import PackageSet, PackageSetDiff
+import tempfile
+import gzip
+import os
+
+
+def paragraph(name, version, arch, sha256, filename):
+    return "Package: {}\nVersion: {}\nArchitecture: {}\nFilename: {}\nSHA256: {}\nDescription: test\n test\n\n".format(
+        name, version, arch, filename, sha256)
+
+
+class TestPackageSet(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def write(self, relname, text):
+        pathname = os.path.join(self.workdir.name, relname)
+        os.makedirs(os.path.dirname(pathname), exist_ok=True)
+        if pathname.endswith(".gz"):
+            with gzip.open(pathname, "wt") as fd:
+                fd.write(text)
+        else:
+            with open(pathname, "wt") as fd:
+                fd.write(text)
+
+    def test_from_mirror(self):
+        self.write("dists/bookworm/main/binary-amd64/Packages",
+                   paragraph("app", "1.0", "amd64", "a1", "pool/main/a/app/app_1.0_amd64.deb") +
+                   paragraph("doc", "2", "all", "d2", "pool/main/d/doc/doc_2_all.deb"))
+        # The uncompressed index is preferred
+        self.write("dists/bookworm/main/binary-amd64/Packages.gz", paragraph("stale", "1", "amd64", "s", "pool/s.deb"))
+        self.write("dists/bookworm/main/debian-installer/binary-amd64/Packages.gz",
+                   paragraph("app", "1.0", "amd64", "u1", "pool/main/a/app/app_1.0_amd64.udeb"))
+        packages = PackageSet.from_mirror(self.workdir.name)
+        self.assertEqual(packages.packages, {
+            ("app", "amd64", "deb"): ("1.0", "a1", "pool/main/a/app/app_1.0_amd64.deb"),
+            ("doc", "all", "deb"): ("2", "d2", "pool/main/d/doc/doc_2_all.deb"),
+            ("app", "amd64", "udeb"): ("1.0", "u1", "pool/main/a/app/app_1.0_amd64.udeb"),
+        })
+
+        pathname = os.path.join(self.workdir.name, "packages.list")
+        packages.write(pathname)
+        self.assertEqual(PackageSet.read(pathname).packages, packages.packages)
+        self.assertIsNone(PackageSet.read(pathname + ".missing"))
+
+    def test_diff(self):
+        old = PackageSet()
+        old.add("same", "1", "amd64", "s1", "pool/same_1.deb")
+        old.add("up", "1.0", "amd64", "u1", "pool/up_1.0.deb")
+        old.add("down", "2", "amd64", "d2", "pool/down_2.deb")
+        old.add("gone", "1", "amd64", "g1", "pool/gone_1.deb")
+        old.add("binnmu", "1", "amd64", "b1", "pool/binnmu_1.deb")
+        new = PackageSet()
+        new.add("same", "1", "amd64", "s1", "pool/same_1.deb")
+        new.add("up", "1.0+deb12u1", "amd64", "u2", "pool/up_1.0+deb12u1.deb")
+        new.add("down", "1", "amd64", "d1", "pool/down_1.deb")
+        new.add("new", "1", "amd64", "n1", "pool/new_1.deb")
+        new.add("binnmu", "1", "amd64", "b2", "pool/binnmu_1.deb")
+
+        diff = PackageSetDiff(old, new)
+        self.assertEqual(diff.added, [("new", "amd64", "deb", "1")])
+        self.assertEqual(diff.removed, [("gone", "amd64", "deb", "1")])
+        self.assertEqual(diff.upgraded, [("up", "amd64", "deb", "1.0", "1.0+deb12u1")])
+        self.assertEqual(diff.downgraded, [("down", "amd64", "deb", "2", "1")])
+        self.assertEqual(diff.rebuilt, [("binnmu", "amd64", "deb", "1")])
+        self.assertEqual(diff.unchanged, 1)
+        self.assertEqual(diff.new_files, ["pool/binnmu_1.deb", "pool/down_1.deb", "pool/new_1.deb",
+                                          "pool/up_1.0+deb12u1.deb"])
+        self.assertEqual(diff.stale_files, ["pool/down_2.deb", "pool/gone_1.deb", "pool/up_1.0.deb"])
+        report = diff.report()
+        self.assertEqual(report[0], "1 added, 1 removed, 1 upgraded, 1 downgraded, 1 rebuilt, 1 unchanged")
+        self.assertIn("upgraded\tup 1.0 -> 1.0+deb12u1 (amd64) deb", report)
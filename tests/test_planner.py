@@ -0,0 +1,116 @@
+import unittest
+from simple_cdd.planner import ImagePlanner, choose_disktype, disk_capacity, blocks, MB, INSTALLER_ESTIMATE
+from simple_cdd.indices import PackageIndex
+from simple_cdd.exceptions import Fail
+from .environment import make_env
+import tempfile
+import os
+
+PACKAGES = """\
+Package: base-files
+Version: 12
+Architecture: {arch}
+Priority: required
+Filename: pool/main/b/base-files/base-files_12_{arch}.deb
+Size: 70000
+Installed-Size: 400
+
+Package: app
+Version: 1.0
+Architecture: {arch}
+Priority: optional
+Depends: app-data
+Filename: pool/main/a/app/app_1.0_{arch}.deb
+Size: 5000
+Installed-Size: 20
+
+Package: app-data
+Version: 1.0
+Architecture: all
+Priority: optional
+Filename: pool/main/a/app/app-data_1.0_all.deb
+Size: 1000000
+Installed-Size: 3000
+
+Package: unused
+Version: 1.0
+Architecture: all
+Priority: optional
+Filename: pool/main/u/unused/unused_1.0_all.deb
+Size: 9000000
+"""
+
+
+class TestPlanner(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        extra = os.path.join(self.workdir.name, "default.preseed")
+        with open(extra, "wt") as fd:
+            fd.write("x" * 3000)
+        self.env = make_env(
+            simple_cdd_temp=self.workdir.name,
+            MIRROR=os.path.join(self.workdir.name, "mirror"),
+            DI_CODENAME="bookworm",
+            di_release="20230607",
+            all_packages=["app"],
+            exclude_files=[],
+            preseed_files=[extra],
+            NORECOMMENDS="1",
+        )
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def index(self, arch):
+        pathname = os.path.join(self.workdir.name, "Packages-" + arch)
+        with open(pathname, "wt") as fd:
+            fd.write(PACKAGES.format(arch=arch))
+        index = PackageIndex()
+        index.load(pathname)
+        return index
+
+    def test_disktype(self):
+        self.assertEqual(blocks(1), 2048)
+        self.assertEqual(blocks(2048), 2048)
+        self.assertEqual(choose_disktype(100 * MB), "CD")
+        self.assertEqual(choose_disktype(1000 * MB), "DVD")
+        self.assertIsNone(choose_disktype(100000 * MB))
+        self.assertIsNone(disk_capacity("NETINST"))
+
+    def test_estimate(self):
+        planner = ImagePlanner(self.env)
+        amd64 = planner.estimate_arch("amd64", self.index("amd64"))
+        self.assertEqual(sorted(amd64.packages), ["app", "app-data", "base-files"])
+        self.assertEqual(amd64.debs_size, 1075000)
+        self.assertEqual(amd64.installed_size, 3420 * 1024)
+        self.assertEqual(amd64.installer_size, INSTALLER_ESTIMATE)
+
+        # Installer images of di_release in the mirror are measured
+        images = os.path.join(self.workdir.name, "mirror", "dists", "bookworm", "main", "installer-i386", "20230607", "images")
+        os.makedirs(images)
+        with open(os.path.join(images, "initrd.gz"), "wb") as fd:
+            fd.write(b"x" * 5000)
+        i386 = planner.estimate_arch("i386", self.index("i386"))
+        self.assertEqual(i386.installer_size, 6144)
+
+        # Architecture independent packages are counted once
+        pool = blocks(70000) * 2 + blocks(5000) * 2 + blocks(1000000)
+        total = planner.total_size([amd64, i386])
+        self.assertEqual(total, int(pool * 1.03) + INSTALLER_ESTIMATE + 6144 + blocks(3000))
+
+    def test_local_estimate(self):
+        self.env.set("CODENAME", "bookworm")
+        self.env.set("ARCHES", "amd64")
+        self.env.set("mirror_components", "main")
+        planner = ImagePlanner(self.env)
+        with self.assertRaises(Fail):
+            planner.estimate(local=True)
+
+        # The indices of the local mirror are used, without the network
+        binary = os.path.join(self.workdir.name, "mirror", "dists", "bookworm", "main", "binary-amd64")
+        os.makedirs(binary)
+        with open(os.path.join(binary, "Packages"), "wt") as fd:
+            fd.write(PACKAGES.format(arch="amd64"))
+        total, estimates = planner.estimate(local=True)
+        self.assertEqual([sorted(e.packages) for e in estimates], [["app", "app-data", "base-files"]])
+        self.assertEqual(total, planner.total_size(estimates))
@@ -0,0 +1,58 @@
+import unittest
+from simple_cdd import populate
+import tempfile
+import os
+
+
+class TestPopulate(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.workdir.name, "src")
+        self.dst = os.path.join(self.workdir.name, "dst")
+        os.makedirs(os.path.join(self.src, "images", "cdrom"))
+        with open(os.path.join(self.src, "images", "cdrom", "initrd.gz"), "wb") as fd:
+            fd.write(b"initrd")
+        with open(os.path.join(self.src, "images", "SHA256SUMS"), "wb") as fd:
+            fd.write(b"sums")
+        os.symlink("cdrom", os.path.join(self.src, "images", "netboot"))
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_populate(self):
+        populator = populate.populate_tree(self.src, self.dst, method="hardlink")
+        initrd = os.path.join(self.dst, "images", "cdrom", "initrd.gz")
+        with open(initrd, "rb") as fd:
+            self.assertEqual(fd.read(), b"initrd")
+        # Files on the same file system share the inode with the source
+        self.assertTrue(os.path.samefile(initrd, os.path.join(self.src, "images", "cdrom", "initrd.gz")))
+        self.assertEqual(populator.stats["hardlink"], 2)
+        # Symlinks are recreated as symlinks
+        self.assertEqual(os.readlink(os.path.join(self.dst, "images", "netboot")), "cdrom")
+
+        # A second run has nothing to do
+        populator = populate.populate_tree(self.src, self.dst, method="hardlink")
+        self.assertEqual(populator.stats["hardlink"], 0)
+        self.assertEqual(populator.stats["unchanged"], 3)
+
+    def test_writable(self):
+        populate.populate_tree(self.src, self.dst, method="hardlink")
+        # Trees that will be modified in place get their own copy of the data,
+        # even if they were previously hardlinked
+        populator = populate.populate_tree(self.src, self.dst, method="auto", writable=True)
+        self.assertEqual(populator.stats["hardlink"], 0)
+        initrd = os.path.join(self.dst, "images", "cdrom", "initrd.gz")
+        self.assertFalse(os.path.samefile(initrd, os.path.join(self.src, "images", "cdrom", "initrd.gz")))
+
+    def test_delete(self):
+        os.makedirs(os.path.join(self.dst, "images", "stale"))
+        with open(os.path.join(self.dst, "images", "old.img"), "wb") as fd:
+            fd.write(b"old")
+
+        populate.populate_tree(self.src, self.dst, method="copy")
+        self.assertTrue(os.path.exists(os.path.join(self.dst, "images", "old.img")))
+
+        populator = populate.populate_tree(self.src, self.dst, method="copy", delete=True)
+        self.assertFalse(os.path.exists(os.path.join(self.dst, "images", "old.img")))
+        self.assertFalse(os.path.exists(os.path.join(self.dst, "images", "stale")))
+        self.assertEqual(populator.stats["removed"], 2)
@@ -0,0 +1,73 @@
+import unittest
+from simple_cdd.profiles import ProfileIndex
+import subprocess
+import tempfile
+import sys
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestProfileIndex(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.local = os.path.join(self.workdir.name, "local")
+        self.system = os.path.join(self.workdir.name, "system")
+        for d, names in (
+                (self.local, ["web.packages", "web.conf", "web.packges", "web.conf.orig"]),
+                (self.system, ["web.packages", "web.preseed", "default.packages", "web-extra.packages"])):
+            os.makedirs(os.path.join(d, "profiles"))
+            for name in names:
+                with open(os.path.join(d, "profiles", name), "wt") as fd:
+                    fd.write("")
+        self.index = ProfileIndex([self.local, os.path.join(self.workdir.name, "missing"), self.system])
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_find(self):
+        self.assertEqual(self.index.find("web", "packages"), os.path.join(self.local, "profiles", "web.packages"))
+        self.assertEqual(self.index.find("web", "preseed"), os.path.join(self.system, "profiles", "web.preseed"))
+        self.assertIsNone(self.index.find("web", "udebs"))
+        self.assertEqual([ext for ext, pathname in self.index.profile_files("web")],
+                         ["conf", "packages", "packges", "preseed"])
+
+    def test_write(self):
+        pathname = os.path.join(self.workdir.name, "profiles.index")
+        self.index.write(pathname)
+        with open(pathname, "rt") as fd:
+            lines = [line.rstrip("\n").split("\t") for line in fd]
+        self.assertIn(["web", "packages", os.path.join(self.local, "profiles", "web.packages")], lines)
+        self.assertIn(["web-extra", "packages", os.path.join(self.system, "profiles", "web-extra.packages")], lines)
+        self.assertEqual(len(lines), 7)
+
+        index = ProfileIndex.read(pathname)
+        self.assertEqual(index.files, self.index.files)
+        self.assertEqual(index.find("web", "preseed"), os.path.join(self.system, "profiles", "web.preseed"))
+        self.assertIsNone(ProfileIndex.read(os.path.join(self.workdir.name, "missing.index")))
+
+    def test_checkpackages(self):
+        pool = os.path.join(self.workdir.name, "pool")
+        os.makedirs(pool)
+        with open(os.path.join(pool, "apache2_2.4_amd64.deb"), "wb") as fd:
+            fd.write(b"")
+        with open(os.path.join(self.system, "profiles", "web.packages"), "wt") as fd:
+            fd.write("apache2\nnginx\n")
+        # Only the index says where web.packages is
+        pathname = os.path.join(self.workdir.name, "profiles.index")
+        with open(pathname, "wt") as fd:
+            print("web", "packages", os.path.join(self.system, "profiles", "web.packages"), sep="\t", file=fd)
+        env = dict(os.environ, CHECK_MIRROR=pool, profiles="default web", simple_cdd_dir=self.workdir.name,
+                   profile_index=pathname)
+        proc = subprocess.run([sys.executable, os.path.join(TOPDIR, "checkpackages")], env=env,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(proc.returncode, 1)
+        self.assertEqual(proc.stdout, "ERROR: missing required packages from profile web:  nginx\n")
+
+    def test_report(self):
+        lines, problems = self.index.report(["default", "web", "nope"])
+        self.assertIn("    hides " + os.path.join(self.system, "profiles", "web.packages"), lines)
+        self.assertEqual(len(problems), 2)
+        self.assertIn("web.packges is not used", problems[0])
+        self.assertTrue(problems[1].startswith("profile nope: no files found"))
@@ -0,0 +1,72 @@
+import unittest
+from simple_cdd import env
+from simple_cdd.qemu import QemuTestRunner, QemuTestResult
+import tempfile
+import os
+
+
+class TestQemuTestRunner(unittest.TestCase):
+    def setUp(self):
+        # Save and clear the environment before the tests
+        self.saved_env = dict(os.environ)
+        os.environ.clear()
+
+    def tearDown(self):
+        # Restore the environment after the tests
+        os.environ.clear()
+        for k, v in self.saved_env.items():
+            os.environ[k] = v
+
+    def make_env(self):
+        VARIABLES = [
+            env.PathVar("simple_cdd_temp", "tmp"),
+            env.PathVar("simple_cdd_logs", ["{simple_cdd_temp}", "log"]),
+            env.ListVar("auto_profiles"),
+            env.ListVar("qemu_test_profiles"),
+            env.ListVar("KERNEL_PARAMS"),
+            env.TextVar("simple_cdd_preseed", "preseed/file=/cdrom/simple-cdd/default.preseed"),
+            env.TextVar("serial_console_opts", "ttyS0,115200"),
+            env.TextVar("qemu_test_success_pattern", "reboot: Restarting system"),
+        ]
+        return env.Environment(VARIABLES)
+
+    def test_profile_matrix(self):
+        e = self.make_env()
+        e.set("auto_profiles", ["x-basic"])
+        runner = QemuTestRunner(e, "test.iso")
+        self.assertEqual(runner.profile_matrix(), [["x-basic"]])
+
+        e.set_from_commandline("qemu_test_profiles", "x-basic+ltsp,router")
+        self.assertEqual(runner.profile_matrix(), [["x-basic", "ltsp"], ["router"]])
+
+    def test_kernel_cmdline(self):
+        e = self.make_env()
+        e.set("KERNEL_PARAMS", ["vga=normal", "simple-cdd/profiles=x-basic"])
+        runner = QemuTestRunner(e, "test.iso")
+        cmdline = runner.kernel_cmdline(["router", "ltsp"]).split()
+        self.assertIn("vga=normal", cmdline)
+        self.assertIn("preseed/file=/cdrom/simple-cdd/default.preseed", cmdline)
+        self.assertIn("simple-cdd/profiles=router,ltsp", cmdline)
+        self.assertNotIn("simple-cdd/profiles=x-basic", cmdline)
+        self.assertIn("console=ttyS0,115200", cmdline)
+
+    def test_check_serial_log(self):
+        e = self.make_env()
+        runner = QemuTestRunner(e, "test.iso")
+        with tempfile.TemporaryDirectory() as workdir:
+            def check(text):
+                result = QemuTestResult("x-basic", ["x-basic"])
+                result.status = "pass"
+                result.serial_log = os.path.join(workdir, "serial.log")
+                with open(result.serial_log, "wt") as fd:
+                    fd.write(text)
+                runner.check_serial_log(result)
+                return result.status
+
+            # A failed installation that powers off also exits successfully
+            self.assertEqual(check("[  99.0] reboot: Power down\n"), "fail")
+            self.assertEqual(check("[ 999.0] reboot: Restarting system\n"), "pass")
+
+            # Without a pattern, only the exit code counts
+            e.set("qemu_test_success_pattern", "")
+            self.assertEqual(check("[  99.0] reboot: Power down\n"), "pass")
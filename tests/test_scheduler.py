@@ -0,0 +1,68 @@
+import unittest
+from simple_cdd.scheduler import StageScheduler, Stage
+from simple_cdd.instrument import BuildReport
+from simple_cdd.exceptions import Fail
+import threading
+
+
+class TestScheduler(unittest.TestCase):
+    def test_conflicts(self):
+        download = Stage("download", None, outputs=["mirror:installer"])
+        reprepro = Stage("reprepro", None, outputs=["mirror:archive"])
+        local = Stage("local", None, outputs=["mirror:archive"])
+        reader = Stage("reader", None, inputs=["mirror:installer"], outputs=[])
+        shell = Stage("rsync", None)
+        self.assertFalse(download.conflicts(reprepro))
+        self.assertTrue(reprepro.conflicts(local))
+        self.assertTrue(reader.conflicts(download))
+        self.assertTrue(download.conflicts(reader))
+        self.assertTrue(shell.conflicts(reader))
+
+    def test_overlap(self):
+        # download and reprepro can only both get past the barrier if they
+        # run at the same time
+        barrier = threading.Barrier(2, timeout=10)
+        order = []
+        report = BuildReport()
+
+        def stage(name, wait=False):
+            def run():
+                with report.stage(name):
+                    if wait: barrier.wait()
+                    order.append(name)
+            return run
+
+        scheduler = StageScheduler(4)
+        scheduler.add("download", stage("download", True), outputs=["mirror:installer"])
+        scheduler.add("reprepro", stage("reprepro", True), outputs=["mirror:archive"])
+        scheduler.add("local", stage("local"), outputs=["mirror:archive"])
+        scheduler.add("rsync", stage("rsync"))
+        with report.stage("build_mirror"):
+            scheduler.run()
+        self.assertEqual(sorted(order[:2]), ["download", "reprepro"])
+        self.assertEqual(order[2:], ["local", "rsync"])
+        # Stages run in threads are nested in the stage that started them
+        self.assertEqual({s.name: s.parent for s in report.stages},
+                         {"build_mirror": None, "download": "build_mirror", "reprepro": "build_mirror",
+                          "local": "build_mirror", "rsync": "build_mirror"})
+
+    def test_failure(self):
+        ran = []
+
+        def fail():
+            raise Fail("download failed")
+
+        scheduler = StageScheduler(4)
+        scheduler.add("download", fail, outputs=["mirror:installer"])
+        scheduler.add("reprepro", lambda: ran.append("reprepro"), outputs=["mirror:installer"])
+        with self.assertRaises(Fail):
+            scheduler.run()
+        self.assertEqual(ran, [])
+
+    def test_sequential(self):
+        order = []
+        scheduler = StageScheduler(1)
+        for name in ("a", "b", "c"):
+            scheduler.add(name, lambda name=name: order.append(name), outputs=[name])
+        scheduler.run()
+        self.assertEqual(order, ["a", "b", "c"])
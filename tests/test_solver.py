@@ -0,0 +1,116 @@
+import unittest
+from simple_cdd.indices import PackageIndex, parse_relations
+from simple_cdd.solver import Solver
+import tempfile
+import gzip
+import os
+
+PACKAGES = """\
+Package: app
+Version: 1.0
+Priority: optional
+Depends: libc6 (>= 2.36), mail-transport-agent, editor | vim, python3:any
+Recommends: docs
+Size: 1000
+Installed-Size: 10
+
+Package: libc6
+Version: 2.36
+Priority: required
+Size: 3000
+
+Package: exim4
+Version: 4.96
+Priority: optional
+Provides: mail-transport-agent
+Depends: libc6
+
+Package: postfix
+Version: 3.7
+Priority: standard
+Provides: mail-transport-agent, default-mta (= 3.7)
+
+Package: nano
+Version: 7.2
+Priority: important
+Provides: editor
+
+Package: vim
+Version: 9.0
+Priority: optional
+Depends: vim-common
+
+Package: vim-common
+Version: 9.0
+Priority: optional
+
+Package: python3
+Version: 3.11
+Priority: optional
+Depends: vim
+
+Package: docs
+Version: 1.0
+Priority: optional
+"""
+
+UPDATES = """\
+Package: python3
+Version: 3.11.2
+Priority: optional
+Depends: libc6
+"""
+
+
+class TestSolver(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.index = PackageIndex()
+        pathname = os.path.join(self.workdir.name, "Packages")
+        with open(pathname, "wt") as fd:
+            fd.write(PACKAGES)
+        self.index.load(pathname)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_parse_relations(self):
+        self.assertEqual(parse_relations("a (>= 1), b:any | c [amd64], d<!nocheck>"), [["a"], ["b", "c"], ["d"]])
+        self.assertEqual(parse_relations(""), [])
+
+    def test_index(self):
+        pkg = self.index.get("app")
+        self.assertEqual(pkg.size, 1000)
+        self.assertEqual(pkg.installed_size, 10240)
+        self.assertEqual(pkg.depends, [["libc6"], ["mail-transport-agent"], ["editor", "vim"], ["python3"]])
+        # Providers are sorted by priority
+        self.assertEqual(self.index.satisfiers("mail-transport-agent"), ["postfix", "exim4"])
+        self.assertEqual(self.index.satisfiers("default-mta"), ["postfix"])
+        self.assertEqual(self.index.satisfiers("missing"), [])
+
+        # The highest version wins, from plain or compressed indices
+        pathname = os.path.join(self.workdir.name, "updates_Packages.gz")
+        with gzip.open(pathname, "wt") as fd:
+            fd.write(UPDATES)
+        self.index.load(pathname)
+        self.assertEqual(self.index.get("python3").version, "3.11.2")
+        self.index.load(os.path.join(self.workdir.name, "Packages"))
+        self.assertEqual(self.index.get("python3").version, "3.11.2")
+
+    def test_solve(self):
+        solver = Solver(self.index)
+        selected = solver.solve(["app", "unknown"])
+        # vim is pulled in by python3, so it satisfies "editor | vim"; only
+        # one mail-transport-agent is chosen, preferring higher priority
+        self.assertEqual(sorted(selected), ["app", "libc6", "postfix", "python3", "vim", "vim-common"])
+        self.assertEqual(solver.unknown, ["unknown"])
+        self.assertEqual(solver.missing, [])
+
+    def test_solve_options(self):
+        solver = Solver(self.index, recommends=True, excluded=["postfix", "python3"])
+        selected = solver.solve(["app"])
+        self.assertEqual(sorted(selected), ["app", "docs", "exim4", "libc6", "nano"])
+        self.assertEqual(solver.missing, [("app", ["python3"])])
+
+        # Virtual packages can be requested directly
+        self.assertEqual(sorted(Solver(self.index).solve(["editor"])), ["nano"])
@@ -0,0 +1,51 @@
+import unittest
+from simple_cdd.tools import Tool
+import subprocess
+import sys
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(*args):
+    """
+    Run build-simple-cdd with python -X importtime and the given arguments,
+    and return a dict mapping the names of the modules it imported to their
+    cumulative import time in microseconds
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.join(TOPDIR, "build-simple-cdd")] + list(args),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, cwd=TOPDIR, check=True)
+    res = {}
+    for line in proc.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:"): continue
+        self_us, cumulative, name = line[12:].split("|")
+        if not cumulative.strip().isdigit(): continue
+        res[name.strip()] = int(cumulative)
+    return res
+
+
+class TestStartup(unittest.TestCase):
+    # Modules only needed by some commands or tools, which must not be
+    # imported just to start build-simple-cdd
+    DEFERRED = (
+        "curses", "glob", "csv", "hashlib", "tempfile", "configparser", "socket",
+        "concurrent.futures", "urllib.request", "http.client", "debian.deb822",
+        "simple_cdd.download", "simple_cdd.daemon", "simple_cdd.matrix",
+        "simple_cdd.tools.mirror_download", "simple_cdd.tools.mirror_local",
+        "simple_cdd.tools.mirror_reprepro", "simple_cdd.tools.build_debian_cd",
+        "simple_cdd.tools.mirror_native", "simple_cdd.pdiff", "simple_cdd.mirrors",
+        "simple_cdd.watch",
+    )
+
+    def test_help(self):
+        modules = imported_modules("--help")
+        self.assertIn("simple_cdd.tools", modules)
+        for name in self.DEFERRED:
+            self.assertNotIn(name, modules)
+
+    def test_lazy_tools(self):
+        tool = Tool.lookup("mirror", "download")
+        self.assertEqual((tool.type, tool.name), ("mirror", "download"))
+        self.assertIn("simple_cdd.tools.mirror_download", sys.modules)
+        self.assertIsNone(Tool.lookup("mirror", "rsync"))
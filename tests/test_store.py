@@ -0,0 +1,83 @@
+import unittest
+from simple_cdd.store import ContentStore
+from simple_cdd.download import Downloader
+from simple_cdd.utils import Checksums
+from .httpserver import MirrorServer
+from .environment import make_env
+import tempfile
+import hashlib
+import os
+
+
+class TestContentStore(unittest.TestCase):
+    DATA = b"synthetic package contents\n" * 100
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.store = ContentStore(os.path.join(self.workdir.name, "store"), method="hardlink")
+        self.sha256 = hashlib.sha256(self.DATA).hexdigest()
+        self.src = os.path.join(self.workdir.name, "a", "pool", "foo.deb")
+        os.makedirs(os.path.dirname(self.src))
+        with open(self.src, "wb") as fd:
+            fd.write(self.DATA)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_ingest_link_out(self):
+        dst = os.path.join(self.workdir.name, "b", "pool", "foo.deb")
+        self.assertFalse(self.store.link_out(self.sha256, dst))
+        self.assertFalse(os.path.exists(dst))
+
+        self.assertTrue(self.store.ingest(self.src))
+        self.assertTrue(self.store.has(self.sha256))
+        # Adding it again is a no-op
+        self.assertFalse(self.store.ingest(self.src, self.sha256))
+
+        self.assertTrue(self.store.link_out(self.sha256, dst))
+        with open(dst, "rb") as fd:
+            self.assertEqual(fd.read(), self.DATA)
+        self.assertEqual(os.stat(dst).st_ino, os.stat(self.store.path(self.sha256)).st_ino)
+
+    def test_gc(self):
+        self.store.ingest(self.src)
+        # Still linked from the project
+        self.assertEqual(self.store.gc(), 0)
+        os.unlink(self.src)
+        self.assertEqual(self.store.gc(), 1)
+        self.assertFalse(self.store.has(self.sha256))
+
+    def test_downloader(self):
+        sumsfile = os.path.join(self.workdir.name, "SHA256SUMS")
+        with open(sumsfile, "wt") as fd:
+            print(self.sha256, "./foo.deb", file=fd)
+        sums = Checksums(make_env())
+        sums.parse_checksums_file(sumsfile, "SHA256")
+
+        with MirrorServer({"/foo.deb": self.DATA}) as server:
+            # The first project downloads the file and adds it to the store
+            out1 = os.path.join(self.workdir.name, "project1", "foo.deb")
+            self.assertTrue(Downloader(store=self.store).fetch(server.url + "/foo.deb", out1, checksums=sums, relname="foo.deb"))
+            self.assertEqual(len(server.requests), 1)
+            self.assertTrue(self.store.has(self.sha256))
+
+            # The second one links it from the store
+            out2 = os.path.join(self.workdir.name, "project2", "foo.deb")
+            self.assertTrue(Downloader(store=self.store).fetch(server.url + "/foo.deb", out2, checksums=sums, relname="foo.deb"))
+            self.assertEqual(len(server.requests), 1)
+            self.assertEqual(os.stat(out1).st_ino, os.stat(out2).st_ino)
+
+            # A corrupted store object is discarded and downloaded again
+            os.unlink(out1)
+            os.unlink(out2)
+            path = self.store.path(self.sha256)
+            os.chmod(path, 0o644)
+            with open(path, "wb") as fd:
+                fd.write(b"corrupted")
+            out3 = os.path.join(self.workdir.name, "project3", "foo.deb")
+            with self.assertLogs(level="WARNING"):
+                Downloader(store=self.store).fetch(server.url + "/foo.deb", out3, checksums=sums, relname="foo.deb")
+            self.assertEqual(len(server.requests), 2)
+            with open(self.store.path(self.sha256), "rb") as fd:
+                self.assertEqual(fd.read(), self.DATA)
+
@@ -0,0 +1,103 @@
+import unittest
+from simple_cdd.toollog import ToolLog, find_tool_log, iter_tool_log, iter_events
+from simple_cdd.utils import run_command
+from simple_cdd.exceptions import Fail
+import subprocess
+import threading
+import tempfile
+import time
+import json
+import sys
+import os
+
+# Root of the simple-cdd source tree
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestToolLog(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.logname = os.path.join(self.workdir.name, "build-debian-cd.log")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def test_compression(self):
+        for compression, ext in (("", ""), ("gz", ".gz"), ("xz", ".xz")):
+            with ToolLog(self.logname, "build/debian-cd", compression=compression, block_size=64) as fd:
+                for i in range(100):
+                    fd.write("stdout", "line {}".format(i))
+                fd.write("stderr", "")
+            self.assertEqual(fd.pathname, self.logname + ext)
+            # Logs of previous runs with another compression are removed
+            self.assertEqual(find_tool_log(self.logname), fd.pathname)
+            lines = list(iter_tool_log(fd.pathname))
+            self.assertEqual(len(lines), 101)
+            self.assertEqual(lines[0], ("stdout", "line 0"))
+            self.assertEqual(lines[-1], ("stderr", ""))
+            self.assertEqual(list(iter_tool_log(fd.pathname, streams=["stderr"])), [("stderr", "")])
+
+        with self.assertRaises(Fail):
+            ToolLog(self.logname, "build/debian-cd", compression="bz2")
+
+    def test_events(self):
+        with ToolLog(self.logname, "mirror/reprepro", events=True) as fd:
+            fd.write("stdout", "hello")
+            fd.write("stderr", "wörld")
+        events = list(iter_events(fd.events_pathname))
+        self.assertEqual([(e["tool"], e["stream"], e["text"]) for offset, e in events],
+                         [("mirror/reprepro", "stdout", "hello"), ("mirror/reprepro", "stderr", "wörld")])
+
+        # Reading can resume from the offset of the last event read, and
+        # skips a line that is still being written
+        offset = events[0][0]
+        with open(fd.events_pathname, "ab") as out:
+            out.write(b'{"stream": "stdout"')
+        self.assertEqual([e["text"] for o, e in iter_events(fd.events_pathname, offset=offset)], ["wörld"])
+
+        with ToolLog(self.logname, "mirror/reprepro") as fd:
+            fd.write("stdout", "hello")
+        self.assertFalse(os.path.exists(self.logname + ".events.jsonl"))
+
+    def test_run_command(self):
+        with ToolLog(self.logname, "test", compression="gz") as fd:
+            retval = run_command("test", [sys.executable, "-c", "import sys; print('out'); print('err', file=sys.stderr)"],
+                                 logfd=fd)
+        self.assertEqual(retval, 0)
+        lines = list(iter_tool_log(fd.pathname))
+        self.assertEqual(lines[0][0], "runcmd")
+        self.assertIn(("stdout", "out"), lines)
+        self.assertIn(("stderr", "err"), lines)
+        self.assertEqual(lines[-1], ("retval", "0"))
+
+    def test_reader(self):
+        with ToolLog(self.logname, "test", compression="xz", events=True) as fd:
+            fd.write("stdout", "out")
+            fd.write("stderr", "err")
+        cmd = [sys.executable, os.path.join(TOPDIR, "read-tool-log")]
+        env = dict(os.environ, PYTHONPATH=TOPDIR)
+        proc = subprocess.run(cmd + [self.logname], stdout=subprocess.PIPE, env=env, check=True)
+        self.assertEqual(proc.stdout, b"stdout: out\nstderr: err\n")
+        proc = subprocess.run(cmd + ["--raw", "--stream", "stderr", fd.pathname], stdout=subprocess.PIPE, env=env, check=True)
+        self.assertEqual(proc.stdout, b"err\n")
+        proc = subprocess.run(cmd + ["--events", self.logname], stdout=subprocess.PIPE, env=env, check=True)
+        self.assertEqual([json.loads(line)["text"] for line in proc.stdout.splitlines()], ["out", "err"])
+
+    def test_idle_flush(self):
+        # The tool writes one line and then stays quiet until told to exit:
+        # the line reaches the log while the tool still runs
+        done = os.path.join(self.workdir.name, "done")
+        script = "import os, time\nprint('out', flush=True)\nwhile not os.path.exists({!r}): time.sleep(0.05)".format(done)
+        with ToolLog(self.logname, "test", flush_interval=0.2) as fd:
+            thread = threading.Thread(target=run_command, args=("test", [sys.executable, "-c", script]),
+                                      kwargs={"logfd": fd})
+            thread.start()
+            try:
+                deadline = time.monotonic() + 10
+                while ("stdout", "out") not in list(iter_tool_log(fd.pathname)):
+                    self.assertLess(time.monotonic(), deadline)
+                    time.sleep(0.05)
+            finally:
+                open(done, "w").close()
+                thread.join()
+        self.assertEqual(list(iter_tool_log(fd.pathname))[-1], ("retval", "0"))
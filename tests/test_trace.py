@@ -0,0 +1,60 @@
+import unittest
+from simple_cdd import trace
+from simple_cdd.instrument import BuildReport
+from simple_cdd.utils import run_command
+from simple_cdd.exceptions import Fail
+import tempfile
+import json
+import sys
+import os
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.pathname = os.path.join(self.workdir.name, "trace.json")
+
+    def tearDown(self):
+        trace.stop()
+        self.workdir.cleanup()
+
+    def read_spans(self):
+        with open(self.pathname, "rt") as fd:
+            events = json.load(fd)
+        return {e["name"]: e for e in events if e["ph"] == "X"}
+
+    def test_no_trace(self):
+        with trace.span("nothing", "stage") as args:
+            args["x"] = 1
+        self.assertFalse(os.path.exists(self.pathname))
+
+    def test_spans(self):
+        self.assertTrue(trace.start(self.pathname))
+        self.assertFalse(trace.start(self.pathname))
+        report = BuildReport()
+        with report.stage("build_mirror"):
+            with report.stage("mirror/reprepro", category="tool"):
+                run_command("true", [sys.executable, "-c", "import sys; sys.exit(3)"])
+        with self.assertRaises(Fail):
+            with trace.span("pool/a.deb", "download", url="http://example.org/a.deb"):
+                raise Fail("Cannot download %s", "a.deb")
+
+        # Forked processes write to the same trace
+        pid = os.fork()
+        if pid == 0:
+            trace.TRACER.set_process_name("variant")
+            with trace.span("child", "stage"):
+                pass
+            os._exit(0)
+        os.waitpid(pid, 0)
+        trace.stop()
+
+        spans = self.read_spans()
+        stage, tool, cmd = spans["build_mirror"], spans["mirror/reprepro"], spans["true"]
+        self.assertEqual((stage["cat"], tool["cat"], cmd["cat"]), ("stage", "tool", "command"))
+        self.assertLessEqual(stage["ts"], tool["ts"])
+        self.assertLessEqual(tool["ts"] + tool["dur"], stage["ts"] + stage["dur"])
+        self.assertEqual(cmd["args"]["exit_code"], 3)
+        self.assertIsInstance(cmd["args"]["pid"], int)
+        self.assertEqual(spans["pool/a.deb"]["args"]["error"], "Cannot download a.deb")
+        self.assertEqual(spans["child"]["pid"], pid)
@@ -0,0 +1,95 @@
+import unittest
+from simple_cdd.watch import WatchSet, PollWatcher, InotifyWatcher, make_watcher, wait_for_changes, run_in_child, strongest
+import tempfile
+import threading
+import time
+import os
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.profiles = os.path.join(self.workdir.name, "profiles")
+        os.makedirs(self.profiles)
+        self.watch_set = WatchSet()
+        self.watch_set.profiles.update(("default", "x-basic"))
+        self.watch_set.extra_dirs.add(self.profiles)
+        for name, kind in (("default.conf", "config"), ("x-basic.packages", "packages"),
+                           ("x-basic.preseed", "extras")):
+            self.write(name)
+            self.watch_set.add_file(os.path.join(self.profiles, name), kind)
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def write(self, name, text="test\n"):
+        with open(os.path.join(self.profiles, name), "wt") as fd:
+            fd.write(text)
+
+    def test_classify(self):
+        path = lambda name: os.path.join(self.profiles, name)
+        self.assertEqual(self.watch_set.classify(path("default.conf")), "config")
+        self.assertEqual(self.watch_set.classify(path("x-basic.preseed")), "extras")
+        # New files of the profiles in use
+        self.assertEqual(self.watch_set.classify(path("x-basic.downloads")), "packages")
+        self.assertEqual(self.watch_set.classify(path("x-basic.postinst")), "extras")
+        # Files that the build does not use
+        self.assertIsNone(self.watch_set.classify(path("other.packages")))
+        self.assertIsNone(self.watch_set.classify(path("x-basic.packages~")))
+        self.assertIsNone(self.watch_set.classify(path(".x-basic.packages.swp")))
+        self.assertEqual(strongest(["extras", "config", "packages"]), "config")
+
+        # A file used in several ways causes the most expensive rebuild
+        self.watch_set.add_file(path("x-basic.preseed"), "packages")
+        self.assertEqual(self.watch_set.classify(path("x-basic.preseed")), "packages")
+        self.watch_set.add_file(path("x-basic.preseed"), "extras")
+        self.assertEqual(self.watch_set.classify(path("x-basic.preseed")), "packages")
+
+    def check_watcher(self, watcher):
+        try:
+            self.assertEqual(watcher.changes(0.05), set())
+
+            # A burst of edits is reported once, when it is over
+            def edit():
+                for name in ("x-basic.preseed", "x-basic.packages", "unrelated.txt", "x-basic.preseed"):
+                    self.write(name, "changed {}\n".format(name))
+                    time.sleep(0.1)
+            thread = threading.Thread(target=edit)
+            thread.start()
+            start = time.monotonic()
+            changed = wait_for_changes(watcher, self.watch_set, debounce=0.3)
+            thread.join()
+            self.assertGreaterEqual(time.monotonic() - start, 0.6)
+            self.assertEqual(changed, {
+                os.path.join(self.profiles, "x-basic.preseed"): "extras",
+                os.path.join(self.profiles, "x-basic.packages"): "packages",
+            })
+
+            # Editors that replace the file with a new one
+            tmpname = os.path.join(self.profiles, ".default.conf.tmp")
+            with open(tmpname, "wt") as fd:
+                fd.write("changed\n")
+            os.rename(tmpname, os.path.join(self.profiles, "default.conf"))
+            changed = wait_for_changes(watcher, self.watch_set, debounce=0.1)
+            self.assertEqual(changed, {os.path.join(self.profiles, "default.conf"): "config"})
+        finally:
+            watcher.close()
+
+    def test_poll(self):
+        self.check_watcher(PollWatcher(self.watch_set.dirs, interval=0.05))
+
+    def test_inotify(self):
+        try:
+            watcher = InotifyWatcher(self.watch_set.dirs)
+        except (OSError, AttributeError) as e:
+            self.skipTest("inotify not available: {}".format(e))
+        self.check_watcher(watcher)
+
+    def test_make_watcher(self):
+        watcher = make_watcher(self.watch_set.dirs)
+        watcher.close()
+
+    def test_run_in_child(self):
+        self.assertEqual(run_in_child(lambda: 3), 3)
+        parent = os.getpid()
+        self.assertEqual(run_in_child(lambda: 0 if os.getpid() != parent else 2), 0)